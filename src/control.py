@@ -0,0 +1,175 @@
+# coding: utf-8
+# vim: set ts=4 sw=4 et:
+
+"""Unix domain control socket of the running agent. A client sends a single
+command line and receives the response until the connection is closed."""
+
+__author__ = 'Logentries'
+
+__all__ = ['ControlServer', 'ControlError', 'ERROR_PREFIX', 'request']
+
+import errno
+import logging
+import os
+import socket
+import threading
+
+from utils import LOG_LE_AGENT
+
+# Maximal length of a command line
+MAX_COMMAND = 1024
+# Timeout of a single client connection
+CLIENT_TIMEOUT = 5.0  # Seconds
+# Permissions of the socket file
+SOCKET_MODE = 0660
+# Prefix of responses to requests which failed
+ERROR_PREFIX = 'Error: '
+
+log = logging.getLogger(LOG_LE_AGENT)
+
+
+class ControlError(Exception):
+
+    """Raised if the control socket cannot be created or contacted. Raised
+    by handlers for invalid requests, the message is sent as the response."""
+
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
+
+class ControlServer(object):
+
+    """
+    Serves commands on a Unix domain socket in a background thread. Handlers
+    are functions identified by commands, they accept list of command
+    arguments and return the response as a string. Failed requests are
+    answered with ERROR_PREFIX and the error message. Raises ControlError if
+    the socket cannot be created, for example if another agent listens on it.
+    """
+
+    def __init__(self, path, handlers):
+        self._path = path
+        self._handlers = handlers
+        self._shutdown = False
+        self._socket = self._bind(path)
+        self._worker = threading.Thread(target=self.run, name='control')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _bind(self, path):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                s.bind(path)
+            except socket.error, e:
+                if e.args[0] != errno.EADDRINUSE or _listening(path):
+                    raise
+                # Left by an agent which has not exited cleanly
+                os.remove(path)
+                s.bind(path)
+            os.chmod(path, SOCKET_MODE)
+            s.listen(5)
+        except (socket.error, OSError), e:
+            s.close()
+            raise ControlError('Cannot create control socket %s: %s' % (path, e))
+        return s
+
+    def run(self):
+        while not self._shutdown:
+            try:
+                connection, _ = self._socket.accept()
+            except socket.error, e:
+                if self._shutdown:
+                    break
+                if e.args[0] in (errno.EINTR, errno.ECONNABORTED):
+                    continue
+                raise
+            try:
+                try:
+                    connection.settimeout(CLIENT_TIMEOUT)
+                    self._serve(connection)
+                except socket.error:
+                    pass
+                except Exception, e:
+                    # The next requests are served as usual
+                    log.error("Caught unknown error `%s' while serving control "
+                              "request", e, exc_info=True)
+                    self._respond(connection, '%s%s\n' % (ERROR_PREFIX, e))
+            finally:
+                connection.close()
+
+    def _serve(self, connection):
+        command = ''
+        while '\n' not in command and len(command) < MAX_COMMAND:
+            data = connection.recv(MAX_COMMAND)
+            if not data:
+                break
+            command += data
+        args = command.split('\n', 1)[0].split()
+        handler = None
+        if args:
+            handler = self._handlers.get(args[0])
+        if not handler:
+            response = '%sUnknown command\n' % ERROR_PREFIX
+        else:
+            try:
+                response = handler(args[1:])
+            except ControlError, e:
+                response = '%s%s\n' % (ERROR_PREFIX, e.msg)
+        connection.sendall(response)
+
+    def _respond(self, connection, response):
+        try:
+            connection.sendall(response)
+        except socket.error:
+            pass
+
+    def close(self):
+        """Stops serving and removes the socket file."""
+        self._shutdown = True
+        try:
+            # Interrupt accept
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self._socket.close()
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
+
+
+def _listening(path):
+    """Returns True if some process accepts connections on the socket."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            s.connect(path)
+            return True
+        except socket.error:
+            return False
+    finally:
+        s.close()
+
+
+def request(path, command):
+    """Sends the command to the control socket and returns the response.
+    Raises ControlError if the agent cannot be contacted."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.settimeout(CLIENT_TIMEOUT)
+        try:
+            s.connect(path)
+            s.sendall(command + '\n')
+            response = []
+            while True:
+                data = s.recv(65536)
+                if not data:
+                    break
+                response.append(data)
+        except socket.error, e:
+            raise ControlError('Cannot contact the agent at %s: %s' % (path, e))
+    finally:
+        s.close()
+    return ''.join(response)
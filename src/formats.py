@@ -4,12 +4,53 @@
 
 __author__ = 'Logentries'
 
-__all__ = ['FormatPlain', 'FormatSyslog', 'get_formatter']
+__all__ = ['FormatPlain', 'FormatSyslog', 'Clock', 'clock', 'get_formatter']
 
 
-import datetime
 import socket
 import string
+import time
+
+
+class Clock(object):
+    """Renders current UTC time the same way as
+    datetime.utcnow().isoformat('T'). The time is rendered at most once per
+    tick of the resolution given in seconds; finer parts are zeroed."""
+
+    def __init__(self, resolution=0.000001):
+        self.set_resolution(resolution)
+        # (seconds, microseconds) -> rendered time
+        self._cached = (None, None)
+        # Seconds -> rendered date and time without fraction
+        self._cached_seconds = (None, None)
+
+    def set_resolution(self, resolution):
+        self._resolution = max(int(round(resolution * 1000000)), 1)
+
+    def isoformat(self):
+        now = time.time()
+        seconds = int(now)
+        # Rounded the same way as datetime does
+        microseconds = int(round((now - seconds) * 1000000))
+        if microseconds == 1000000:
+            seconds += 1
+            microseconds = 0
+        microseconds -= microseconds % self._resolution
+        tick = (seconds, microseconds)
+        cached_tick, rendered = self._cached
+        if tick == cached_tick:
+            return rendered
+        cached_seconds, rendered = self._cached_seconds
+        if cached_seconds != seconds:
+            rendered = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+            self._cached_seconds = (seconds, rendered)
+        if microseconds:
+            rendered = '%s.%06d' % (rendered, microseconds)
+        self._cached = (tick, rendered)
+        return rendered
+
+# Clock shared by all formatters
+clock = Clock()
 
 
 class FormatPlain(object):
@@ -17,9 +58,13 @@ class FormatPlain(object):
 
     def __init__(self, token):
         self._token = token
+        self._token_utf8 = _encode(token)
 
     def format_line(self, line):
+        if isinstance(line, str):
+            return self._token_utf8 + line
         return self._token + line
+    format_line.bytes_native = True
 
 
 class FormatSyslog(object):
@@ -33,18 +78,33 @@ class FormatSyslog(object):
             self._hostname = _sanitize_syslog_name(socket.gethostname())
         self._appname = _sanitize_syslog_name(appname)
         self._token = token
+        # Pre-encoded parts of UTF-8 encoded lines
+        self._token_utf8 = _encode(token)
+        self._header_utf8 = _encode(' %s %s - ' % (self._hostname, self._appname))
 
     def format_line(self, line, msgid='-', token=None):
+        if isinstance(line, str):
+            if token:
+                token = _encode(token)
+            else:
+                token = self._token_utf8
+            return '%s<14>1 %sZ%s%s - %s'%(
+                token, clock.isoformat(),
+                self._header_utf8, msgid, line)
         if not token:
             token = self._token
         return '%s<14>1 %sZ %s %s - %s - %s'%(
-            token, datetime.datetime.utcnow().isoformat('T'),
+            token, clock.isoformat(),
             self._hostname, self._appname,
             msgid, line)
+    format_line.bytes_native = True
 
 
 class FormatCustom(object):
-    """Formats lines based of pattern given."""
+    """Formats lines based of pattern given. The pattern is split to static
+    segments and slots for the time and the line when created."""
+
+    _SLOTS = ('isodatetime', 'line')
 
     def __init__(self, pattern, hostname, appname, token):
         if hostname:
@@ -55,16 +115,59 @@ class FormatCustom(object):
         self._token = token
         self._pattern = pattern.decode('utf8', 'ignore')
         self._template = string.Template(token + self._pattern)
+        self._compile()
+
+    def _compile(self):
+        """Splits the template to segments. Slots for the time and the line
+        are listed by their indices. Templates with unknown or invalid
+        placeholders are substituted as a whole to fail the same way."""
+        constants = {'hostname': self._hostname, 'appname': self._appname}
+        segments = []
+        slots = dict([(name, []) for name in self._SLOTS])
+        template = self._template.template
+        pos = 0
+        for m in self._template.pattern.finditer(template):
+            segments.append(template[pos:m.start()])
+            pos = m.end()
+            name = m.group('named') or m.group('braced')
+            if m.group('escaped') is not None:
+                segments.append(self._template.delimiter)
+            elif name in constants:
+                segments.append(constants[name])
+            elif name in slots:
+                slots[name].append(len(segments))
+                segments.append(None)
+            else:
+                self._segments = None
+                return
+        segments.append(template[pos:])
+        self._segments = segments
+        self._segments_utf8 = [_encode(segment) for segment in segments]
+        self._time_slots = slots['isodatetime']
+        self._line_slots = slots['line']
 
     def format_line(self, line):
-        # Convert the pattern into output string
-        # this is performance sub-optimal
-        return self._template.substitute({
-            'isodatetime': datetime.datetime.utcnow().isoformat('T'),
-            'hostname': self._hostname,
-            'appname': self._appname,
-            'line': line
-            })
+        if self._segments is None:
+            if isinstance(line, str):
+                line = line.decode('utf8')
+            return self._template.substitute({
+                'isodatetime': clock.isoformat(),
+                'hostname': self._hostname,
+                'appname': self._appname,
+                'line': line
+                })
+        if isinstance(line, str):
+            parts = self._segments_utf8[:]
+        else:
+            parts = self._segments[:]
+        if self._time_slots:
+            now = clock.isoformat()
+            for i in self._time_slots:
+                parts[i] = now
+        for i in self._line_slots:
+            parts[i] = line
+        return ''.join(parts)
+    format_line.bytes_native = True
 
 def get_formatter(definition, hostname, log_name, log_token):
     """Instantiates formatter defined by its name or pattern.
@@ -82,6 +185,13 @@ def get_formatter(definition, hostname, log_name, log_token):
     # Formatter not found
     return None
 
+def _encode(value):
+    """Returns the value as UTF-8 encoded string.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf8')
+    return value
+
 def _sanitize_syslog_name(original):
     """Replaces invalid characters from syslog name entry.
     """
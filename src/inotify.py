@@ -0,0 +1,371 @@
+# coding: utf-8
+# vim: set ts=4 sw=4 et:
+
+"""Minimal binding of Linux inotify(7) implemented with ctypes. It allows
+followers to sleep until a followed file changes instead of polling it."""
+
+__author__ = 'Logentries'
+
+__all__ = ['Inotify', 'WatchManager', 'FileWatch', 'available',
+           'IN_MODIFY', 'IN_ATTRIB', 'IN_MOVED_FROM', 'IN_MOVED_TO',
+           'IN_CREATE', 'IN_DELETE', 'IN_DELETE_SELF', 'IN_MOVE_SELF',
+           'IN_Q_OVERFLOW', 'IN_IGNORED', 'IN_ONLYDIR']
+
+import errno
+import fnmatch
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+# Event masks, see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+# Flags of inotify_init1
+_IN_NONBLOCK = 0x00000800
+_IN_CLOEXEC = 0x00080000
+
+# struct inotify_event header: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct('iIII')
+# Enough space for several events with long file names
+_READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    if ctypes is None or not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+_libc = _load_libc()
+
+
+def available():
+    """Returns True if inotify can be used on this system."""
+    return _libc is not None
+
+
+class Inotify(object):
+
+    """Inotify instance. Raises OSError if inotify cannot be initialized,
+    typically because of the per-user instance limit."""
+
+    def __init__(self):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd == -1:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        # Pipe used to interrupt waiting
+        self._wake_r, self._wake_w = os.pipe()
+        self._wake_lock = threading.Lock()
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        """Adds (or updates) watch of the path given. Returns the watch
+        descriptor, raises OSError on failure."""
+        if isinstance(path, unicode):
+            path = path.encode(sys.getfilesystemencoding() or 'utf8')
+        wd = _libc.inotify_add_watch(self._fd, path, mask)
+        if wd == -1:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        """Removes the watch given. Watches of removed files are released
+        by kernel, hence errors are ignored."""
+        _libc.inotify_rm_watch(self._fd, wd)
+
+    def wait(self, timeout):
+        """Waits up to timeout seconds for events. Returns True if there are
+        events to be read, False on timeout or if interrupted by wake."""
+        fds = [self._fd, self._wake_r]
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return False
+            raise
+        if self._wake_r in readable:
+            return False
+        return bool(readable)
+
+    def wake(self):
+        """Interrupts waiting, typically on shutdown. All subsequent waits
+        return immediately."""
+        self._wake_lock.acquire()
+        try:
+            if self._wake_w != -1:
+                try:
+                    os.write(self._wake_w, '\0')
+                except OSError:
+                    pass
+        finally:
+            self._wake_lock.release()
+
+    def read_events(self):
+        """Returns list of pending events as (wd, mask, name) tuples. Returns
+        an empty list if there are no events."""
+        try:
+            buff = os.read(self._fd, _READ_SIZE)
+        except OSError, e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        events = []
+        pos = 0
+        header_size = _EVENT_HEADER.size
+        while pos + header_size <= len(buff):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(buff, pos)
+            pos += header_size
+            name = buff[pos:pos + name_len].rstrip('\0')
+            pos += name_len
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        self._wake_lock.acquire()
+        try:
+            for fd in (self._fd, self._wake_r, self._wake_w):
+                if fd != -1:
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            self._fd = self._wake_r = self._wake_w = -1
+        finally:
+            self._wake_lock.release()
+
+
+class WatchManager(object):
+
+    """Shares a single inotify instance among file watches waited for in
+    many threads, so that the number of followed files is not limited by the
+    per-user limit of inotify instances. Events are read in a background
+    thread and dispatched to watches by watch descriptors. Raises OSError if
+    inotify cannot be initialized."""
+
+    def __init__(self):
+        self._inotify = Inotify()
+        self._lock = threading.Lock()
+        # Watch descriptor -> {watch: file name pattern or None for files}
+        self._watches = {}
+        self._shutdown = False
+        self._worker = threading.Thread(target=self._run, name='inotify')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def add_watch(self, watch, path, mask, pattern=None):
+        """Adds watch of the path given for the watch object. Events of files
+        (pattern is None) are masked by FileWatch.FILE_EVENTS, events of
+        directories are passed on as IN_CREATE if the name matches the
+        pattern. Returns the watch descriptor, raises OSError on failure."""
+        self._lock.acquire()
+        try:
+            wd = self._inotify.add_watch(path, mask)
+            self._watches.setdefault(wd, {})[watch] = pattern
+            return wd
+        finally:
+            self._lock.release()
+
+    def rm_watch(self, watch, wd):
+        """Removes the watch descriptor of the watch object given."""
+        self._lock.acquire()
+        try:
+            watchers = self._watches.get(wd)
+            if watchers is None:
+                return
+            watchers.pop(watch, None)
+            # Watch descriptors are shared by all watches of the same file
+            # or directory
+            if not watchers:
+                del self._watches[wd]
+                self._inotify.rm_watch(wd)
+        finally:
+            self._lock.release()
+
+    def _dispatch(self, events):
+        self._lock.acquire()
+        try:
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost, all watches have to check their files
+                    for watchers in self._watches.itervalues():
+                        for watch in watchers:
+                            watch.notify(IN_MODIFY | IN_CREATE)
+                    continue
+                for watch, pattern in self._watches.get(wd, {}).iteritems():
+                    if pattern is None:
+                        if mask & FileWatch.FILE_EVENTS:
+                            watch.notify(mask & FileWatch.FILE_EVENTS)
+                    elif fnmatch.fnmatchcase(name, pattern):
+                        watch.notify(IN_CREATE)
+                if mask & IN_IGNORED:
+                    # Kernel has released the watch descriptor
+                    self._watches.pop(wd, None)
+        finally:
+            self._lock.release()
+
+    def _run(self):
+        while not self._shutdown:
+            if self._inotify.wait(None):
+                self._dispatch(self._inotify.read_events())
+
+    def close(self, timeout):
+        """Stops the dispatching thread, waits up to timeout seconds for it
+        and closes the inotify instance."""
+        self._shutdown = True
+        self._inotify.wake()
+        self._worker.join(timeout)
+        if not self._worker.isAlive():
+            self._inotify.close()
+
+
+class FileWatch(object):
+
+    """Watches a single file for modifications and its directory for
+    creation of files which may replace it (e.g. on log rotation). Events
+    are received from the WatchManager given."""
+
+    FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+    DIR_EVENTS = IN_CREATE | IN_MOVED_TO
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._wds = []
+        self._lock = threading.Lock()
+        # Events received since the last wait
+        self._events = 0
+        self._woken = False
+        # Pipe readable while there are events or once woken
+        self._signal_r, self._signal_w = os.pipe()
+        self._signalled = False
+
+    def watch(self, filename, pattern=None):
+        """Starts watching the file given, previous watches are dropped.
+        Pattern restricts directory events to matching file names, the base
+        name of the file is used by default."""
+        self.unwatch()
+        try:
+            self._wds.append(self._manager.add_watch(
+                self, filename, self.FILE_EVENTS))
+            self._wds.append(self._manager.add_watch(
+                self, os.path.dirname(filename) or '.',
+                self.DIR_EVENTS | IN_ONLYDIR,
+                os.path.basename(pattern or filename)))
+        except OSError:
+            # File watch is sufficient, directory events only speed up
+            # detection of rotation
+            pass
+
+    def unwatch(self):
+        for wd in self._wds:
+            self._manager.rm_watch(self, wd)
+        self._wds = []
+        # Stale events of removed watches
+        self._take_events()
+
+    def notify(self, mask):
+        """Adds events to be returned by wait, called by the manager."""
+        self._lock.acquire()
+        try:
+            self._events |= mask
+            self._signal()
+        finally:
+            self._lock.release()
+
+    def _signal(self):
+        # Called with the lock held
+        if not self._signalled and self._signal_w != -1:
+            self._signalled = True
+            try:
+                os.write(self._signal_w, '\0')
+            except OSError:
+                pass
+
+    def _take_events(self):
+        self._lock.acquire()
+        try:
+            if self._signalled and not self._woken:
+                os.read(self._signal_r, 1)
+                self._signalled = False
+            events, self._events = self._events, 0
+            return events
+        finally:
+            self._lock.release()
+
+    def wait(self, timeout):
+        """Blocks until the file changes or timeout expires. Returns mask of
+        events received, 0 on timeout or if interrupted by wake. Creation of
+        a matching file in the directory is reported as IN_CREATE."""
+        deadline = time.time() + timeout
+        while True:
+            events = self._take_events()
+            if events or self._woken:
+                return events
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return 0
+            try:
+                select.select([self._signal_r], [], [], remaining)
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    def wake(self):
+        """Interrupts waiting, typically on shutdown. All subsequent waits
+        return immediately."""
+        self._lock.acquire()
+        try:
+            self._woken = True
+            self._signal()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self.unwatch()
+        self._lock.acquire()
+        try:
+            self._woken = True
+            for fd in (self._signal_r, self._signal_w):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._signal_r = self._signal_w = -1
+        finally:
+            self._lock.release()
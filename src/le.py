@@ -31,6 +31,8 @@ LOCAL_CONFIG_DIR_USER = '.le'
 LOCAL_CONFIG_DIR_SYSTEM = '/etc/le'
 
 PID_FILE = '/var/run/logentries.pid'
+# Control socket is next to the pid file, with this suffix instead of .pid
+CONTROL_SOCKET_SUFFIX = '.sock'
 
 MAIN_SECT = 'Main'
 USER_KEY_PARAM = 'user-key'
@@ -39,30 +41,67 @@ FILTERS_PARAM = 'filters'
 FORMATTERS_PARAM = 'formatters'
 FORMATTER_PARAM = 'formatter'
 ENTRY_IDENTIFIER_PARAM = 'entry_identifier'
+DROP_PARAM = 'drop'
+KEEP_PARAM = 'keep'
+REDACT_PARAM = 'redact'
 SUPPRESS_SSL_PARAM = 'suppress_ssl'
 USE_CA_PROVIDED_PARAM = 'use_ca_provided'
 FORCE_DOMAIN_PARAM = 'force_domain'
 DATAHUB_PARAM = 'datahub'
 SYSSTAT_TOKEN_PARAM = 'system-stat-token'
 STATE_FILE_PARAM = 'state-file'
+STATE_POSITION_PARAM = 'state-position'
 HOSTNAME_PARAM = 'hostname'
 TOKEN_PARAM = 'token'
 PATH_PARAM = 'path'
+LISTEN_PARAM = 'listen'
+APP_NAME_PARAM = 'app-name'
 INCLUDE_PARAM = 'include'
 DESTINATION_PARAM = 'destination'
 PULL_SERVER_SIDE_CONFIG_PARAM = 'pull-server-side-config'
+FOLLOWER_ENGINE_PARAM = 'follower-engine'
+SEND_BATCH_SIZE_PARAM = 'send-batch-size'
+SEND_BATCH_LATENCY_PARAM = 'send-batch-latency'
+SEND_QUEUE_SIZE_PARAM = 'send-queue-size'
+SEND_QUEUE_POLICY_PARAM = 'send-queue-policy'
+SPOOL_DIR_PARAM = 'spool-dir'
+SPOOL_SIZE_PARAM = 'spool-size'
+PUT_CONNECTIONS_PARAM = 'put-connections'
+PUT_IDLE_TIMEOUT_PARAM = 'put-idle-timeout'
+TIMESTAMP_RESOLUTION_PARAM = 'timestamp-resolution'
+SHUTDOWN_TIMEOUT_PARAM = 'shutdown-timeout'
+SYSLOG_SOCKET_MODE_PARAM = 'syslog-socket-mode'
 KEY_LEN = 36
 ACCOUNT_KEYS_API = '/agent/account-keys/'
 ID_LOGS_API = '/agent/id-logs/'
 
-LINE_SEPARATOR = '\xe2\x80\xa8'.decode('utf8')
+LINE_SEPARATOR_UTF8 = '\xe2\x80\xa8'
+LINE_SEPARATOR = LINE_SEPARATOR_UTF8.decode('utf8')
 
 PROXY_TYPE_PARAM = "proxy-type"
 PROXY_URL_PARAM = "proxy-url"
 PROXY_PORT_PARAM = "proxy-port"
 
-# Maximal queue size for events sent
-SEND_QUEUE_SIZE = 32000
+# Maximal size of events queued for sending
+SEND_QUEUE_SIZE = 16 * 1024 * 1024 # Bytes
+# What happens when the send queue is full: followers stop reading until the
+# queue drains to a half, or the oldest events are dropped
+SEND_QUEUE_BACKPRESSURE = 'backpressure'
+SEND_QUEUE_DROP_OLDEST = 'drop-oldest'
+# Which file positions are saved in the state file: positions read, or
+# positions of entries sent or spooled
+STATE_POSITION_READ = 'read'
+STATE_POSITION_SENT = 'sent'
+# Maximal size of entries spooled on disk for each destination
+SPOOL_SIZE = 256 * 1024 * 1024 # Bytes
+# Directory of entries not sent on shutdown if spooling is not configured,
+# next to the state file or the pid file, with this suffix instead of theirs
+UNSENT_SUFFIX = '.unsent'
+# Time after which unused pooled connections of logs with keys are closed
+PUT_IDLE_TIMEOUT = 60.0 # Seconds
+# Default limits of events sent in a single write
+SEND_BATCH_SIZE = 65536 # Bytes
+SEND_BATCH_LATENCY = 0.01 # Seconds
 
 # Logentries server details
 LE_SERVER_API = '/'
@@ -96,6 +135,8 @@ RETRY_GLOB_INTERVAL = 0.250 # in seconds
 FOLLOWMULTI_JOIN_INTERVAL = 1.0  # in seconds
 FOLLOWER_JOIN_INTERVAL = 1.0    # in seconds
 TRANSPORT_JOIN_INTERVAL = 1.5   # in seconds
+# Time to stop all threads and send queued entries on shutdown
+SHUTDOWN_TIMEOUT = 3.0  # in seconds
 
 class Domain(object):
 
@@ -139,6 +180,13 @@ TAIL_RECHECK = 0.2  # Seconds
 # Number of attemps to read a file, until the name is recheck
 NAME_CHECK = 4  # TAIL_RECHECK cycles
 
+# Maximal time spent waiting for inotify events before the log is re-checked
+INOTIFY_RECHECK = 1.0  # Seconds
+
+# Follower engines: a thread per follower or a single reactor thread
+FOLLOWER_ENGINE_THREADS = 'threads'
+FOLLOWER_ENGINE_REACTOR = 'reactor'
+
 # Interval of inactivity when IAA token is sent
 IAA_INTERVAL = 10.0 # Seconds
 # I am alive token that's passed at fixed interval during inactivity
@@ -150,14 +198,10 @@ MAX_BLOCK_SIZE = 65536 - 512 # Space for formatting
 # Interval between attampts to open a file
 REOPEN_INT = 1  # Seconds
 
-# Linux block devices
-SYS_BLOCK_DEV = '/sys/block/'
-# Linux CPU stat file
-CPUSTATS_FILE = '/proc/stat'
-# Linux mmeory stat file
-MEMSTATS_FILE = '/proc/meminfo'
-# Linux network stat file
-NETSTATS_FILE = '/proc/net/dev'
+# Size of the beginning of a file which identifies the file in the state
+FINGERPRINT_SIZE = 1024  # Bytes
+# Interval between saves of the state file, changes in between are coalesced
+STATE_SAVE_INTERVAL = 1  # Seconds
 
 # List of accepted network devices
 NET_DEVICES = ['  eth', ' wlan', 'venet', ' veth']
@@ -212,6 +256,8 @@ Where command is one of:
   ls        List internal filesystem and settings: <path>
   rm        Remove entity: <path>
   pull      Pull log file: <path> <when> <filter> <limit>
+  stats     Display statistics of the running agent
+    --json  output statistics in JSON
 
   Structure management (technology preview)
   ls structures          List structures defined
@@ -280,11 +326,15 @@ except ImportError:
 import ConfigParser
 import Queue
 import atexit
+import collections
 import datetime
+import errno
 import fileinput
+import fnmatch
 import getopt
 import getpass
 import glob
+import hashlib
 import httplib
 import logging
 import os
@@ -292,8 +342,11 @@ import os.path
 import platform
 import random
 import re
+import select
 import signal
 import socket
+import sre_constants
+import sre_parse
 import stat
 import string
 import subprocess
@@ -305,9 +358,14 @@ import urllib
 import logging.handlers
 from backports import CertificateError, match_hostname
 
+import control
 import formats
+import inotify
 import metrics
+import rules
 import socks
+import spool
+import syslogd
 
 # Option to avoid issues around encodings
 #reload(sys)
@@ -373,6 +431,9 @@ class LegacySslWrapper(object):
     def send(self, data):
         self._socket.write(data)
 
+    def sendall(self, data):
+        self._socket.write(data)
+
     def close(self):
         self._socket.close()
 
@@ -415,6 +476,8 @@ def filter_events(events):
     """
     # By default, this method is empty
     return events
+# Accepts UTF-8 encoded lines as well as unicode
+filter_events.bytes_native = True
 
 
 def default_filter_filenames(filename):
@@ -966,6 +1029,195 @@ def retrieve_account_key():
 
         print >> sys.stderr, 'Try to log in again, or press Ctrl+C to break'
 
+# Set once reaching the limit of inotify instances has been reported
+_inotify_limit_reported = False
+# Inotify instance shared by followers running in threads, created on first
+# use, see _shared_watch_manager
+_watch_manager = None
+_watch_manager_lock = threading.Lock()
+
+
+def _inotify_unavailable(name, fallback, e):
+    """Logs that inotify cannot be used for the log given. Reaching the
+    per-user limit of inotify instances is reported once as a warning."""
+    global _inotify_limit_reported
+    if e.errno == errno.EMFILE and not _inotify_limit_reported:
+        _inotify_limit_reported = True
+        log.warning("Cannot use inotify for %s, %s instead: limit of inotify "
+                    "instances reached, raise fs.inotify.max_user_instances",
+                    name, fallback)
+    else:
+        log.debug("Cannot use inotify for %s, %s instead: %s", name, fallback, e)
+
+
+def _shared_watch_manager(name):
+    """Returns the inotify watch manager shared by followers running in
+    threads, None if inotify cannot be used and the log given has to be
+    polled."""
+    global _watch_manager
+    _watch_manager_lock.acquire()
+    try:
+        if _watch_manager is None and inotify.available():
+            try:
+                _watch_manager = inotify.WatchManager()
+            except OSError, e:
+                _inotify_unavailable(name, 'polling', e)
+        return _watch_manager
+    finally:
+        _watch_manager_lock.release()
+
+
+def _close_watch_manager(timeout):
+    """Closes the shared inotify watch manager if it has been created."""
+    global _watch_manager
+    _watch_manager_lock.acquire()
+    try:
+        if _watch_manager:
+            _watch_manager.close(timeout)
+            _watch_manager = None
+    finally:
+        _watch_manager_lock.release()
+
+
+class _MultilogWatch(object):
+    """
+    Discovers files matching a multilog pathname by watching directories with
+    inotify. The directory given by the non-wildcard prefix of the pathname is
+    watched for entries matching the wildcard component, and each matching
+    entry is watched for the file itself. Only entries reported by inotify are
+    matched again; the prefix directory is listed on start and when events
+    were lost.
+    """
+
+    PREFIX_EVENTS = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM | \
+        inotify.IN_MOVED_TO | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF | inotify.IN_ONLYDIR
+    ENTRY_EVENTS = PREFIX_EVENTS
+
+    def __init__(self, pathname):
+        self._inotify = inotify.Inotify()
+        components = pathname.split(os.sep)
+        wild = len(components) - 1
+        for index, component in enumerate(components):
+            if glob.has_magic(component):
+                wild = index
+                break
+        self._prefix = os.sep.join(components[:wild]) or os.sep
+        self._wildcard = components[wild]
+        # Path of the file relative to the matching entry
+        self._tail = components[wild + 1:]
+        self._prefix_wd = None
+        # Entry -> watch descriptor, watch descriptor -> {entry: expected name}
+        self._entry_wds = {}
+        self._wd_entries = {}
+        self.files = set()
+
+    def _candidate(self, entry):
+        return os.path.join(self._prefix, entry, *self._tail)
+
+    def _matches(self, entry):
+        # Hidden entries are matched explicitly only, the same as with glob
+        if entry.startswith('.') and not self._wildcard.startswith('.'):
+            return False
+        return fnmatch.fnmatch(entry, self._wildcard)
+
+    def _unwatch_entry(self, entry):
+        wd = self._entry_wds.pop(entry, None)
+        if wd is None:
+            return
+        entries = self._wd_entries.get(wd, {})
+        entries.pop(entry, None)
+        if not entries:
+            self._wd_entries.pop(wd, None)
+            self._inotify.rm_watch(wd)
+
+    def _check_entry(self, entry):
+        """Matches the entry again and updates its watch."""
+        self._unwatch_entry(entry)
+        candidate = self._candidate(entry)
+        if not self._matches(entry):
+            self.files.discard(candidate)
+            return
+        # Watch the deepest existing directory on the way to the file
+        path = os.path.join(self._prefix, entry)
+        names = self._tail[:-1]
+        index = 0
+        while index < len(names) and os.path.isdir(os.path.join(path, names[index])):
+            path = os.path.join(path, names[index])
+            index += 1
+        if self._tail and os.path.isdir(path):
+            try:
+                wd = self._inotify.add_watch(path, self.ENTRY_EVENTS)
+                self._entry_wds[entry] = wd
+                self._wd_entries.setdefault(wd, {})[entry] = self._tail[index]
+            except OSError:
+                pass
+        if os.path.lexists(candidate):
+            self.files.add(candidate)
+        else:
+            self.files.discard(candidate)
+
+    def rescan(self):
+        """Watches the prefix directory and matches all its entries."""
+        for entry in self._entry_wds.keys():
+            self._unwatch_entry(entry)
+        if self._prefix_wd is not None:
+            self._inotify.rm_watch(self._prefix_wd)
+            self._prefix_wd = None
+        self.files = set()
+        try:
+            self._prefix_wd = self._inotify.add_watch(self._prefix, self.PREFIX_EVENTS)
+            entries = os.listdir(self._prefix)
+        except OSError:
+            # The prefix directory does not exist (yet)
+            return
+        for entry in entries:
+            self._check_entry(entry)
+
+    def wait(self, timeout):
+        """Waits up to timeout for changes in watched directories. Returns
+        True if the set of files may have changed."""
+        if self._prefix_wd is None:
+            # Retry watching until the prefix directory appears
+            time.sleep(timeout)
+            self.rescan()
+            return self._prefix_wd is not None
+        if not self._inotify.wait(timeout):
+            return False
+        changed = False
+        for wd, mask, name in self._inotify.read_events():
+            if mask & inotify.IN_Q_OVERFLOW or (wd == self._prefix_wd and
+                    mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF | inotify.IN_IGNORED)):
+                self.rescan()
+                return True
+            if wd == self._prefix_wd:
+                self._check_entry(name)
+                changed = True
+                continue
+            entries = self._wd_entries.get(wd)
+            if not entries:
+                continue
+            for entry, expected in entries.items():
+                if name == expected or mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF | inotify.IN_IGNORED):
+                    if mask & inotify.IN_IGNORED:
+                        # Kernel has released the watch already
+                        self._wd_entries.pop(wd, None)
+                        self._entry_wds.pop(entry, None)
+                    self._check_entry(entry)
+                    changed = True
+        return changed
+
+    def wake(self):
+        self._inotify.wake()
+
+    def close(self):
+        self._inotify.close()
+
+
+def _remaining(deadline):
+    """Returns seconds left until the deadline, zero if it has passed."""
+    return max(deadline - time.time(), 0)
+
+
 class FollowMultilog(object):
     """
     The FollowMultilog is responsible for handling those logs that were set-up using the
@@ -980,7 +1232,8 @@ class FollowMultilog(object):
                  entry_identifier,
                  transport,
                  states,
-                 max_num_followers=MAX_FILES_FOLLOWED ):
+                 max_num_followers=MAX_FILES_FOLLOWED,
+                 reactor=None):
         """ Initializes the FollowMultilog. """
         self.name = name
         self.flush = True
@@ -988,16 +1241,30 @@ class FollowMultilog(object):
         self.entry_formatter = entry_formatter
         self.entry_identifier = entry_identifier
         self.transport = transport
+        self.reactor = reactor
 
         self._states = states
         self._shutdown = False
         self._max_num_followers=max_num_followers
-        self._followers = []
+        # File name -> follower
+        self._followers = {}
+        self._discovery = self._create_discovery()
         self._worker = threading.Thread(
             target=self.supervise_followers, name=self.name)
         self._worker.daemon = True
         self._worker.start()
 
+    def _create_discovery(self):
+        """Returns inotify based discovery of files, or None if the pathname
+        has to be globbed in RETRY_GLOB_INTERVAL intervals."""
+        if not inotify.available():
+            return None
+        try:
+            return _MultilogWatch(self.name)
+        except OSError, e:
+            _inotify_unavailable(self.name, 'globbing', e)
+            return None
+
     def _file_test(self, candidate):
         """
         Only regular files passed
@@ -1011,7 +1278,7 @@ class FollowMultilog(object):
         return True
 
     def _append_followers(self, add_files, states={}):
-        for filename in add_files:
+        for filename in sorted(add_files):
             if len(self._followers) < self._max_num_followers:
                 follower = Follower(filename,
                                     self.entry_filter,
@@ -1019,8 +1286,9 @@ class FollowMultilog(object):
                                     self.entry_identifier,
                                     self.transport,
                                     states.get(filename),
-                                    True)
-                self._followers.append(follower)
+                                    True,
+                                    self.reactor)
+                self._followers[filename] = follower
                 if config.debug_multilog:
                     print >> sys.stderr, "Number of followers increased to: %s" %len(self._followers)
             else:
@@ -1028,48 +1296,224 @@ class FollowMultilog(object):
                 break
 
     def _remove_followers(self, removed_files):
-        for follower in self._followers:
-            if follower.name in removed_files:
+        for filename in removed_files:
+            follower = self._followers.pop(filename, None)
+            if follower:
                 follower.close()
-                self._followers.remove(follower)
                 if config.debug_multilog:
                     print >> sys.stderr, "Number of followers decreased to: %s" %len(self._followers)
 
-    def close(self):
+    def _current_files(self):
+        """Returns set of files matching the pathname."""
+        if self._discovery:
+            return self._discovery.files
+        try:
+            return set(glob.glob(self.name))
+        except os.error:
+            log.error("FollowerMultiple glob has failed")
+            return None
+
+    def stop(self):
         """
-        Stops all FollowMultilog activity, and then loops through list of existing
-        followers to close each one - then waits for the worker thread to stop.
+        Signals the worker thread and all followers to stop without waiting
+        for them, see join.
         """
         self._shutdown = True
-        # Run through list of followers closing each one
-        for follower in self._followers:
-            follower.close()
-        self._worker.join(FOLLOWMULTI_JOIN_INTERVAL)
+        if self._discovery:
+            self._discovery.wake()
+        for follower in self._followers.values():
+            follower.stop()
+
+    def join(self, timeout):
+        """Waits up to timeout seconds for the worker thread and followers to
+        stop."""
+        deadline = time.time() + timeout
+        self._worker.join(timeout)
+        # Followers may have been added before the worker noticed the shutdown
+        for follower in self._followers.values():
+            follower.stop()
+        for follower in self._followers.values():
+            follower.join(_remaining(deadline))
+
+    def close(self):
+        """
+        Stops all FollowMultilog activity and followers of existing files, then
+        waits for them to stop.
+        """
+        self.stop()
+        self.join(FOLLOWMULTI_JOIN_INTERVAL)
+
+    def followers(self):
+        """Returns list of followers of the matching files."""
+        return self._followers.values()
+
+    def stats(self):
+        """Returns list of statistics of followers of the matching files."""
+        return [follower.stats() for follower in self.followers()]
 
     def supervise_followers(self):
         """
          Instantiates a Follower object for each file found - all log events from all
          files are forwarded to the same log in the lE infrastructure
         """
-        try:
-            start_set = set([filename for filename in glob.glob(self.name)])
-        except os.error:
-            log.error("Error: FollowerMultiple glob has failed")
-        if len(start_set) == 0:
+        if self._discovery:
+            self._discovery.rescan()
+        start_set = self._current_files()
+        if not start_set:
             log.error("FollowMultilog: no files found in OS to be followed")
         else:
             self._append_followers(start_set, self._states)
         while not self._shutdown:
-            time.sleep(RETRY_GLOB_INTERVAL)
-            try:
-                current_set = set([filename for filename in glob.glob(self.name)])
-            except os.error:
-                log.error("FollowerMultiple glob has failed")
-            followed_files = [follower.name for follower in self._followers]
-            added_files = [filename for filename in current_set if not filename in followed_files]
-            self._append_followers(added_files)
-            removed_files = [filename for filename in followed_files if not filename in current_set]
-            self._remove_followers(removed_files)
+            if self._discovery:
+                if not self._discovery.wait(INOTIFY_RECHECK):
+                    continue
+            else:
+                time.sleep(RETRY_GLOB_INTERVAL)
+            current_set = self._current_files()
+            if current_set is None:
+                continue
+            followed_files = set(self._followers)
+            self._append_followers(current_set - followed_files)
+            self._remove_followers(followed_files - current_set)
+        if self._discovery:
+            self._discovery.close()
+
+
+class BatchFilter(object):
+
+    """Filter provided by user's batch_filters. The function given accepts a
+    list of lines and returns a list of filtered lines."""
+
+    def __init__(self, filter_batch):
+        self.filter_batch = filter_batch
+        self.bytes_native = getattr(filter_batch, 'bytes_native', False)
+
+    def __call__(self, line):
+        for filtered in self.filter_batch([line]):
+            return filtered
+        return None
+
+
+class BatchFormatter(object):
+
+    """Formatter provided by user's batch_formatters. The function given
+    accepts a list of lines and returns a list of entries."""
+
+    def __init__(self, format_batch):
+        self.format_batch = format_batch
+        self.bytes_native = getattr(format_batch, 'bytes_native', False)
+
+    def __call__(self, line):
+        for entry in self.format_batch([line]):
+            return entry
+        return None
+
+
+class RuleFilter(BatchFilter):
+
+    """Applies filter rules of the configuration to lines before they are
+    passed to the filter given. Lines dropped by the rules never reach the
+    filter."""
+
+    def __init__(self, filter_rules, entry_filter, log_name):
+        BatchFilter.__init__(self, self._filter_batch)
+        self.filter_rules = filter_rules
+        self.log_name = log_name
+        self.entry_filter = entry_filter
+        self._next_batch = getattr(entry_filter, 'filter_batch', None)
+        self.bytes_native = getattr(entry_filter, 'bytes_native', False)
+
+    def _filter_batch(self, lines):
+        lines = self.filter_rules.filter_lines(lines)
+        if self._next_batch:
+            return self._next_batch(lines)
+        return map(self.entry_filter, lines)
+
+    def redactions(self):
+        """Returns hits of redact patterns as a list of dictionaries."""
+        return [{'log': self.log_name, 'pattern': pattern, 'hits': hits}
+                for pattern, hits in self.filter_rules.redactions()]
+
+    def log_redactions(self):
+        """Logs hits of redact patterns."""
+        for pattern, hits in self.filter_rules.redactions():
+            if hits:
+                log.info("%s: %d hits of redact pattern `%s'", self.log_name, hits, pattern)
+
+
+def decode_lines(lines, bytes_native):
+    """Decodes UTF-8 encoded lines. In bytes native mode lines are only
+    checked to be valid UTF-8; invalid sequences are dropped in both modes."""
+    if not bytes_native:
+        return [line.decode('utf-8', 'ignore') for line in lines]
+    try:
+        # A single check of the whole block is cheaper than decoding every
+        # line
+        '\n'.join(lines).decode('utf-8')
+        return lines
+    except UnicodeDecodeError:
+        return [line.decode('utf-8', 'ignore').encode('utf-8') for line in lines]
+
+
+def send_lines(lines, entry_filter, entry_formatter, transport, batch):
+    """Filters and formats lines and sends the entries. If batch is set, the
+    filter or the formatter processes whole blocks. Returns the number of
+    lines filtered out."""
+    if batch:
+        return _send_batch(lines, entry_filter, entry_formatter, transport)
+    filtered = 0
+    for line in lines:
+        if not line:
+            continue
+        line = entry_filter(line)
+        if not line:
+            filtered += 1
+            continue
+        if config.debug_events:
+            print >> sys.stderr, line
+        line = entry_formatter(line)
+        if not line:
+            continue
+        transport.send(line)
+    return filtered
+
+
+def _send_batch(lines, entry_filter, entry_formatter, transport):
+    lines = [line for line in lines if line]
+    count = len(lines)
+    filter_batch = getattr(entry_filter, 'filter_batch', None)
+    if filter_batch:
+        lines = [line for line in filter_batch(lines) if line]
+    else:
+        lines = [line for line in map(entry_filter, lines) if line]
+    if config.debug_events:
+        for line in lines:
+            print >> sys.stderr, line
+    format_batch = getattr(entry_formatter, 'format_batch', None)
+    if format_batch:
+        entries = format_batch(lines)
+    else:
+        entries = map(entry_formatter, lines)
+    for entry in entries:
+        if entry:
+            transport.send(entry)
+    return count - len(lines)
+
+
+def _file_fingerprint(path, length):
+    """Returns fingerprint of the file, see Follower._file_identity. Returns
+    None if the file cannot be read."""
+    try:
+        f = open(path, 'rb')
+        try:
+            head = f.read(length)
+        finally:
+            f.close()
+    except IOError:
+        return None
+    if len(head) < length:
+        return None
+    return hashlib.md5(head).hexdigest()
 
 
 class Follower(object):
@@ -1085,8 +1529,10 @@ class Follower(object):
                  entry_identifier,
                  transport,
                  state,
-                 disable_glob=False):
-        """ Initializes the follower. """
+                 disable_glob=False,
+                 reactor=None):
+        """ Initializes the follower. Followers run in their own threads unless
+        a reactor is given. """
         self.name = name
         self.entry_filter = entry_filter
         self.entry_formatter = entry_formatter
@@ -1094,35 +1540,193 @@ class Follower(object):
         self.transport = transport
         # FollowMultilog usage
         self._disable_glob = disable_glob
-
-        self._load_state(state)
+        # Lines are passed on as UTF-8 encoded strings unless the filter or
+        # the formatter needs unicode
+        self._bytes_native = getattr(entry_filter, 'bytes_native', False) and \
+            getattr(entry_formatter, 'bytes_native', False)
+        if self._bytes_native:
+            self._line_separator = LINE_SEPARATOR_UTF8
+        else:
+            self._line_separator = LINE_SEPARATOR
+        self._entry_search = None
+        if entry_identifier:
+            self._entry_search = self._init_entry_search()
+        # User code processes whole blocks of lines
+        self._batch = isinstance(entry_filter, BatchFilter) or \
+            isinstance(entry_formatter, BatchFormatter)
+
+        # Statistics, updated by the following thread only
+        self._lines_read = 0
+        self._bytes_read = 0
+        self._filtered = 0
+
+        # With acknowledged positions the state advances only once entries
+        # read are sent or spooled, see _queue_ack
+        self._ack = config.state_position == STATE_POSITION_SENT
+        self._ack_state = None
         self._file = None
+        # Identity of the open file, see _file_identity
+        self._inode = None
+        self._fingerprint = None
+        # Up to FINGERPRINT_SIZE bytes at the beginning of the open file,
+        # collected while reading
+        self._head = None
+        self._load_state(state)
         self._shutdown = False
         self._read_file_rest = ''
         self._entry_rest = []
-        self._worker = threading.Thread(
-            target=self.monitorlogs, name=self.name)
-        self._worker.daemon = True
-        self._worker.start()
+        # Bytes of the file in the pending multiline entry, and sizes of
+        # lines of the last block read including new lines; tracked with
+        # acknowledged positions only
+        self._entry_rest_bytes = 0
+        self._block_sizes = None
+        self._idle_cnt = 0
+        self._open_args = None
+        self._reactor = reactor
+        self._watch = self._create_watch()
+        if reactor:
+            self._closed = threading.Event()
+            state = self.get_state()
+            self._request_open(state['filename'], state['position'])
+            reactor.add(self)
+        else:
+            self._worker = threading.Thread(
+                target=self.monitorlogs, name=self.name)
+            self._worker.daemon = True
+            self._worker.start()
 
     def get_state(self):
         return self._state
 
+    def stats(self):
+        """Returns statistics of the follower as a dictionary. Lag is the
+        number of bytes of the file not read yet, None if unknown."""
+        state = self._state
+        lag = None
+        if state['position'] >= 0:
+            try:
+                lag = max(os.fstat(self._file.fileno()).st_size - state['position'], 0)
+            except (AttributeError, ValueError, OSError):
+                pass
+        return {
+            'name': self.name,
+            'filename': state['filename'],
+            'position': state['position'],
+            'lag': lag,
+            'lines_read': self._lines_read,
+            'bytes_read': self._bytes_read,
+            'filtered': self._filtered,
+        }
+
     def get_name(self):
         return self.name
 
     def _load_state(self, state):
+        # Identity of the file the position refers to
+        self._saved_identity = None
         if state:
             self._update_state(state['filename'], state['position'])
+            if 'inode' in state and 'fingerprint' in state:
+                self._saved_identity = (state['inode'], state['fingerprint'])
         else:
             # -1 here means we'll seek to the end of the first file
             self._update_state(None, -1)
+        self._state = self._read_state
 
     def _update_state(self, real_name, file_position):
-        self._state = {
+        """Updates the position read. The state follows unless positions
+        are acknowledged."""
+        if self._ack and self._file and file_position >= 0:
+            # Partial last line and pending multiline entry are not sent yet
+            file_position = max(0, file_position - len(self._read_file_rest) -
+                                self._entry_rest_bytes)
+        self._read_state = {
             'filename': real_name,
             'position': file_position,
         }
+        if self._file and file_position >= 0:
+            inode, fingerprint = self._file_identity(file_position)
+            self._read_state['inode'] = inode
+            self._read_state['fingerprint'] = fingerprint
+        if not self._ack:
+            self._state = self._read_state
+
+    def _file_identity(self, position):
+        """Returns inode and fingerprint of the open file. The fingerprint
+        is a digest of the first FINGERPRINT_SIZE bytes, or of the bytes
+        before the position if the position is lower."""
+        length = min(position, FINGERPRINT_SIZE)
+        if not self._fingerprint or self._fingerprint[0] != length:
+            if self._head is None or len(self._head) < length:
+                self._head = self._read_head()
+            head = self._head[:length]
+            self._fingerprint = (length, hashlib.md5(head).hexdigest())
+        return self._inode, self._fingerprint[1]
+
+    def _read_head(self):
+        """Reads bytes at the beginning of the open file up to the current
+        position, at most FINGERPRINT_SIZE bytes."""
+        current = self._get_file_position()
+        self._set_file_position(0)
+        head = self._file.read(min(current, FINGERPRINT_SIZE))
+        self._set_file_position(current)
+        return head
+
+    def _resume(self, candidate, position):
+        """Returns the file and position to continue from after restart. If
+        the file saved in the state has been replaced by another one, the
+        position refers to the renamed file if it can be found, otherwise the
+        new file is followed from the beginning."""
+        inode, fingerprint = self._saved_identity
+        length = min(position, FINGERPRINT_SIZE)
+        if _file_fingerprint(candidate, length) == fingerprint:
+            return candidate, position
+        directory = os.path.dirname(candidate) or '.'
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                if os.stat(path).st_ino != inode:
+                    continue
+            except OSError:
+                continue
+            if _file_fingerprint(path, length) == fingerprint:
+                log.info("Following %s renamed to %s", self.name, path)
+                return path, position
+        return candidate, 0
+
+    def _queue_ack(self):
+        """Queues acknowledgement of the position read after entries sent
+        so far. The state is updated once the transport has sent or spooled
+        all entries queued before."""
+        if not self._ack or self._read_state is self._ack_state:
+            return
+        state = self._ack_state = self._read_state
+        acknowledge = getattr(self.transport, 'acknowledge', None)
+        if not acknowledge:
+            self._state = state
+            return
+
+        def acknowledged():
+            self._state = state
+        acknowledge(acknowledged)
+
+    def _create_watch(self):
+        """Returns inotify watch used to wait for file changes, or None if
+        inotify is not available and the log has to be polled."""
+        if self._reactor:
+            return self._reactor.create_watch()
+        manager = _shared_watch_manager(self.name)
+        if not manager:
+            return None
+        try:
+            return inotify.FileWatch(manager)
+        except OSError, e:
+            log.debug("Cannot watch %s, polling instead: %s", self.name, e)
+            return None
 
     def _file_candidate(self):
         """
@@ -1142,6 +1746,45 @@ class Follower(object):
         except os.error:
             return None
 
+    def _try_open_log(self, filename, position, first_try):
+        """Makes a single attempt to open the log file. Returns True if the
+        file has been opened. See _open_log for parameters."""
+        if first_try and filename and not self._disable_glob:
+            candidate = filename
+        else:
+            candidate = self._current_path()
+
+        if not candidate:
+            return False
+        if first_try and position > 0 and self._saved_identity:
+            candidate, position = self._resume(candidate, position)
+        self.real_name = candidate
+        try:
+            self._close_log()
+            self._file = open(self.real_name)
+            self._inode = os.fstat(self._file.fileno()).st_ino
+            self._fingerprint = None
+            self._head = ''
+            new_position = 0
+            if first_try:
+                if position == -1:
+                    self._set_file_position(0, FILE_END)
+                    new_position = self._get_file_position()
+                elif position != 0:
+                    self._set_file_position(position)
+                    new_position = position
+            if new_position:
+                self._head = self._read_head()
+            self._update_state(self.real_name, new_position)
+            if first_try and position == -1:
+                # Nothing has been read yet
+                self._state = self._read_state
+            if self._watch:
+                self._watch.watch(self.real_name, self.name)
+            return True
+        except IOError:
+            return False
+
     def _open_log(self, filename=None, position=0):
         """Keeps trying to re-open the log file. Returns when the file has been
         opened or when requested to remove.
@@ -1149,37 +1792,18 @@ class Follower(object):
         filename, if specified, is name of a file that is being open on first attempt
         position indicates the desired initial position, -1 means end of file
         """
+        if self._reactor:
+            # Reactor keeps trying in its own steps
+            self._request_open(filename, position)
+            return
+
         error_info = True
         self.real_name = None
         first_try = True
 
         while not self._shutdown:
-            # FollowMultilog usage
-            if self._disable_glob:
-                candidate = self.name
-            else:
-                if first_try and filename:
-                    candidate = filename
-                else:
-                    candidate = self._file_candidate()
-
-            if candidate:
-                self.real_name = candidate
-                try:
-                    self._close_log()
-                    self._file = open(self.real_name)
-                    new_position = 0
-                    if first_try:
-                        if position == -1:
-                            self._set_file_position(0, FILE_END)
-                            new_position = self._get_file_position()
-                        elif position != 0:
-                            self._set_file_position(position)
-                            new_position = position
-                    self._update_state(self.real_name, new_position)
-                    break
-                except IOError:
-                    pass
+            if self._try_open_log(filename, position, first_try):
+                break
 
             if error_info:
                 log.info("Cannot open file '%s', re-trying in %ss intervals",
@@ -1188,6 +1812,14 @@ class Follower(object):
             first_try = False
             time.sleep(REOPEN_TRY_INTERVAL)
 
+    def _request_open(self, filename=None, position=0):
+        """Schedules (re)opening of the log file in reactor steps."""
+        self._close_log()
+        self.real_name = None
+        self._open_args = (filename, position)
+        self._open_first_try = True
+        self._open_error_info = True
+
     def _close_log(self):
         if self._file:
             try:
@@ -1196,42 +1828,81 @@ class Follower(object):
                 pass
             self._file = None
 
-    def _log_rename(self):
-        """Detects file rename."""
+    def _current_path(self):
+        """Returns name of the file the log refers to now. Names with
+        wildcards are globbed for the most recent file."""
+        # FollowMultilog usage
+        if self._disable_glob or not glob.has_magic(self.name):
+            return self.name
+        return self._file_candidate()
 
-        # Get file candidates
-        candidate = self._file_candidate()
+    def _log_rename(self):
+        """Detects file rotation. Returns True if the path refers to a file
+        other than the one open, compared by device and inode."""
+        candidate = self._current_path()
         if not candidate:
             return False
+        try:
+            current = os.fstat(self._file.fileno())
+            new = os.stat(candidate)
+        except os.error:
+            # The file has been removed and not replaced yet
+            return False
+        return (current.st_dev, current.st_ino) != (new.st_dev, new.st_ino)
 
+    def _log_truncated(self):
+        """Returns True if the open file is shorter than the current position."""
         try:
-            ctime1 = os.fstat(self._file.fileno()).st_mtime
-            ctime_new = os.path.getmtime(candidate)
-            ctime2 = os.fstat(self._file.fileno()).st_mtime
+            size = os.fstat(self._file.fileno()).st_size
         except os.error:
-            pass
+            return False
+        return size < self._get_file_position()
 
-        if ctime1 == ctime2 and ctime1 != ctime_new:
-            # We have a name change according to the time
-            return True
+    def _drain_log(self):
+        """Reads the rest of the open file including the last unterminated
+        line, used before switching to a rotated file. Returns the lines."""
+        lines = []
+        while True:
+            position = self._get_file_position()
+            lines.extend(self._read_log_lines())
+            if self._get_file_position() == position:
+                break
+        return self._flush_rest(lines)
 
-        return False
+    def _flush_rest(self, lines):
+        """Returns the lines given followed by the last unterminated line and
+        the pending multiline entry, used when the rest of the file will not
+        be read."""
+        if self._read_file_rest:
+            lines.extend(decode_lines([self._read_file_rest], self._bytes_native))
+            self._read_file_rest = ''
+        return self._collect_lines(lines) + self._collect_lines([])
 
     def _read_log_lines(self):
         """ Reads a block of lines from the log. Checks maximal line size. """
         buff = self._file.read(MAX_BLOCK_SIZE - len(self._read_file_rest))
         buff_lines = buff.split('\n')
+        self._bytes_read += len(buff)
+        self._lines_read += len(buff_lines) - 1
         if len(self._read_file_rest) > 0:
             buff_lines[0] = self._read_file_rest + buff_lines[0]
 
         self._read_file_rest = buff_lines[-1]
+        if self._head is not None and len(self._head) < FINGERPRINT_SIZE:
+            self._head += buff[:FINGERPRINT_SIZE - len(self._head)]
+
+        if self._ack and self.entry_identifier:
+            self._block_sizes = [len(x) + 1 for x in buff_lines[:-1]]
 
         # Limit size of _read_file_rest
         if len(self._read_file_rest) >= MAX_BLOCK_SIZE:
             buff_lines.append(self._read_file_rest[:MAX_BLOCK_SIZE])
             self._read_file_rest = self._read_file_rest[MAX_BLOCK_SIZE:]
+            if self._block_sizes is not None:
+                # Split without a new line
+                self._block_sizes.append(len(buff_lines[-1]))
 
-        return [line.decode('utf-8', 'ignore') for line in buff_lines[:-1]]
+        return decode_lines(buff_lines[:-1], self._bytes_native)
 
     def _set_file_position(self, offset, start=FILE_BEGIN):
         """ Move the position of filepointers."""
@@ -1249,92 +1920,298 @@ class Follower(object):
         if not self.entry_identifier:
             return lines
         if not lines:
+            self._entry_rest_bytes = 0
             if self._entry_rest:
-                x = [LINE_SEPARATOR.join(self._entry_rest)]
+                x = [self._line_separator.join(self._entry_rest)]
                 self._entry_rest = []
             else:
                 x = []
             return x
         # Entry separator is specified
+        if self._entry_search:
+            block = '\n'.join(lines)
+            starts = self._entry_starts(block)
+            if starts is not None:
+                if self._block_sizes is not None:
+                    start = block.count('\n', 0, starts[-1]) if starts else None
+                    self._count_entry_rest(lines, start)
+                return self._collect_block(block, starts)
         new_lines = []
         new_entry = self._entry_rest
         self._entry_rest = []
-        for line in lines:
+        start = None
+        for i, line in enumerate(lines):
             if self.entry_identifier.search(line):
                 if new_entry:
-                    new_lines.append(LINE_SEPARATOR.join(new_entry))
+                    new_lines.append(self._line_separator.join(new_entry))
                     new_entry = []
                 new_entry.append(line)
+                start = i
             else:
                 new_entry.append(line)
         self._entry_rest = new_entry
+        if self._block_sizes is not None:
+            self._count_entry_rest(lines, start)
         return new_lines
 
+    def _count_entry_rest(self, lines, start):
+        """Counts bytes of the file in the pending entry after lines of the
+        last block read have been collected. Start is the index of the line
+        starting the pending entry, None if the entry continues."""
+        sizes = self._block_sizes
+        if len(sizes) != len(lines):
+            # Lines of several blocks, flushed right after
+            return
+        if start is None:
+            self._entry_rest_bytes += sum(sizes)
+        else:
+            self._entry_rest_bytes = sum(sizes[start:])
+
+    def _entry_starts(self, block):
+        """Returns offsets of lines of the block the entry identifier matches,
+        or None if a match spans multiple lines and lines have to be matched
+        one by one."""
+        starts = []
+        pos = 0
+        while True:
+            m = self._entry_search(block, pos)
+            if not m:
+                break
+            start, end = m.span()
+            if block.find('\n', start, end) != -1:
+                return None
+            starts.append(block.rfind('\n', 0, start) + 1)
+            # Continue with the next line
+            pos = block.find('\n', end)
+            if pos == -1:
+                break
+            pos += 1
+        return starts
+
+    def _collect_block(self, block, starts):
+        """Merges lines of the block to multiline events, the same way as
+        _collect_lines. Starts are offsets of lines which start new events."""
+        separator = self._line_separator
+        if not starts:
+            self._entry_rest.append(block.replace('\n', separator))
+            return []
+        new_lines = []
+        if starts[0] > 0:
+            self._entry_rest.append(block[:starts[0] - 1].replace('\n', separator))
+        if self._entry_rest:
+            new_lines.append(separator.join(self._entry_rest))
+        for i in xrange(len(starts) - 1):
+            new_lines.append(block[starts[i]:starts[i + 1] - 1].replace('\n', separator))
+        self._entry_rest = [block[starts[-1]:].replace('\n', separator)]
+        return new_lines
+
+    def _init_entry_search(self):
+        """Returns function which searches the entry identifier in a block of
+        lines, or None if lines have to be matched one by one."""
+        entry_search = _block_entry_search(self.entry_identifier)
+        if not entry_search:
+            return None
+        regex, literal = entry_search
+        if not literal:
+            return regex.search
+        # Identifier starts with a literal at the beginning of a line, find
+        # candidate lines without the regular expression engine
+        if self._bytes_native:
+            literal = ''.join([chr(c) for c in literal])
+        else:
+            literal = u''.join([unichr(c) for c in literal])
+        line_literal = '\n' + literal
+        match = regex.match
+
+        def search(block, pos):
+            while True:
+                if pos == 0 and block.startswith(literal):
+                    candidate = 0
+                else:
+                    candidate = block.find(line_literal, max(pos - 1, 0))
+                    if candidate == -1:
+                        return None
+                    candidate += 1
+                m = match(block, candidate)
+                if m:
+                    return m
+                pos = candidate + 1
+        return search
+
+    def _wait_interval(self):
+        """Returns time to wait for new data before the follower goes idle.
+        Pending multiline entry is flushed after TAIL_RECHECK of inactivity
+        with inotify as well as with polling."""
+        if self._watch and not self._entry_rest:
+            return INOTIFY_RECHECK
+        return TAIL_RECHECK
+
+    def _idle(self):
+        """Called when no new lines are available. Flushes pending multiline
+        entry and every NAME_CHECK cycles checks whether the log has been
+        renamed or modified. Returns flushed lines."""
+        lines = self._collect_lines([])
+        if lines:
+            return lines
+
+        # Log rename check
+        self._idle_cnt += 1
+        if self._idle_cnt >= NAME_CHECK:
+            self._idle_cnt = 0
+            return self._check_rotation()
+        # To reset end-of-line error
+        self._set_file_position(self._get_file_position())
+        return []
+
+    def _check_rotation(self):
+        """Checks whether the log has been renamed or truncated, reopens or
+        rewinds it. Returns lines left from the previous file or content."""
+        if self._log_rename():
+            # Lines written just before the rotation are in the old file
+            lines = self._drain_log()
+            self._open_log()
+            return lines
+        if self._log_truncated():
+            # File has been externaly modified, the unterminated line belongs
+            # to the previous content
+            lines = self._flush_rest([])
+            self._set_file_position(0)
+            self._fingerprint = None
+            self._head = ''
+            return lines
+        # To reset end-of-line error
+        self._set_file_position(self._get_file_position())
+        return []
+
     def _get_lines(self):
         """Returns a block of newly detected line from the log. Returns None in
         case of timeout.
         """
 
-        # TODO: investigate select-like approach?
-        idle_cnt = 0
+        self._idle_cnt = 0
         lines = []
         while not self._shutdown:
-            # Collect lines
+            if not self.transport.accepting():
+                # Keep the position until queued entries are sent
+                self.transport.wait_accepting(TAIL_RECHECK)
+                continue
+            # Collect lines, pending multiline entry is flushed when idle
             lines = self._read_log_lines()
-            lines = self._collect_lines(lines)
+            if lines:
+                lines = self._collect_lines(lines)
             if lines:
                 break
 
             # No line, wait
-            time.sleep(TAIL_RECHECK)
+            if self._watch:
+                events = self._watch.wait(self._wait_interval())
+                if events == inotify.IN_MODIFY:
+                    # Nothing to read after a modification, the file may
+                    # have been truncated or replaced while written to
+                    lines = self._check_rotation()
+                    if lines:
+                        break
+                    continue
+                # Inactivity or the file may have been replaced, check the
+                # name immediately
+                self._idle_cnt = NAME_CHECK - 1
+            else:
+                time.sleep(TAIL_RECHECK)
 
-            lines = self._collect_lines([])
+            lines = self._idle()
             if lines:
                 break
 
-            # Log rename check
-            idle_cnt += 1
-            if idle_cnt == NAME_CHECK:
-                if self._log_rename():
-                    self._open_log()
-                else:
-                    # Recover from external file modification
-                    position = self._get_file_position()
-                    self._set_file_position(0, FILE_END)
-                    file_size = self._get_file_position()
+        self._update_state(self.real_name, self._get_file_position())
+        return lines
 
-                    if file_size < position:
-                        # File has been externaly modified
-                        position = 0
-                    self._set_file_position(position)
-                idle_cnt = 0
+    def _react(self, events, timed_out):
+        """Makes a single non-blocking step of following the log, used by
+        FollowerReactor instead of the worker thread. Events is a mask of
+        inotify events received since the last step, timed_out is set if the
+        wait interval returned by the last step expired. Returns time to wait
+        for the next step, 0 if more data may be available."""
+        if self._open_args:
+            filename, position = self._open_args
+            if not self._try_open_log(filename, position, self._open_first_try):
+                if self._open_error_info:
+                    log.info("Cannot open file '%s', re-trying in %ss intervals",
+                             self.name, REOPEN_INT)
+                    self._open_error_info = False
+                self._open_first_try = False
+                return REOPEN_TRY_INTERVAL
+            self._open_args = None
+            self._idle_cnt = 0
+
+        if not self.transport.accepting():
+            # Keep the position until queued entries are sent
+            return TAIL_RECHECK
+        lines = self._read_log_lines()
+        if lines:
+            lines = self._collect_lines(lines)
+        if not lines:
+            if not timed_out and not events & ~inotify.IN_MODIFY:
+                # Nothing to read after a modification, the file may have
+                # been truncated or replaced while written to
+                lines = self._check_rotation()
             else:
-                # To reset end-of-line error
-                self._set_file_position(self._get_file_position())
+                if self._watch:
+                    # Inactivity or the file may have been replaced
+                    self._idle_cnt = NAME_CHECK - 1
+                lines = self._idle()
+            if self._open_args:
+                # The log has been renamed
+                if lines:
+                    self._deliver(lines)
+                return 0
+        if not lines:
+            return self._wait_interval()
 
+        self._idle_cnt = 0
         self._update_state(self.real_name, self._get_file_position())
-        return lines
+        self._deliver(lines)
+        return 0
 
     def _send_lines(self, lines):
         """ Sends lines. """
-        for line in lines:
-            if not line:
-                continue
-            line = self.entry_filter(line)
-            if not line:
-                continue
-            if config.debug_events:
-                print >> sys.stderr, line
-            line = self.entry_formatter(line)
-            if not line:
-                continue
-            self.transport.send(line)
+        self._filtered += send_lines(lines, self.entry_filter, self.entry_formatter,
+                                     self.transport, self._batch)
+
+    def _deliver(self, lines):
+        """Sends lines, recovers from errors."""
+        try:
+            self._send_lines(lines)
+            self._queue_ack()
+        except IOError, e:
+            if config.debug:
+                log.debug("IOError: %s", e)
+            self._open_log()
+        except UnicodeError, e:
+            log.warn("UnicodeError sending lines `%s'", lines, exc_info=True)
+        except Exception, e:
+            log.error("Caught unknown error `%s' while sending lines %s", e, lines, exc_info=True)
+
+    def stop(self):
+        """Sets the shutdown flag without waiting for the follower to stop,
+        see join."""
+        self._shutdown = True
+        if self._reactor:
+            self._reactor.remove(self)
+        elif self._watch:
+            self._watch.wake()
+
+    def join(self, timeout):
+        """Waits up to timeout seconds for the follower to stop."""
+        if self._reactor:
+            self._closed.wait(timeout)
+        else:
+            self._worker.join(timeout)
 
     def close(self):
         """Closes the follower by setting the shutdown flag and waiting for the
         worker thread to stop."""
-        self._shutdown = True
-        self._worker.join(FOLLOWER_JOIN_INTERVAL)
+        self.stop()
+        self.join(FOLLOWER_JOIN_INTERVAL)
 
     def monitorlogs(self):
         """ Opens the log file and starts to collect new events. """
@@ -1344,21 +2221,470 @@ class Follower(object):
         while not self._shutdown:
             try:
                 lines = self._get_lines()
-                try:
-                    self._send_lines(lines)
-                except IOError, e:
-                    if config.debug:
-                        log.debug("IOError: %s", e)
-                    self._open_log()
-                except UnicodeError, e:
-                    log.warn("UnicodeError sending lines `%s'", lines, exc_info=True)
-                except Exception, e:
-                    log.error("Caught unknown error `%s' while sending lines %s", e, lines, exc_info=True)
+                self._deliver(lines)
             except Exception, e:
                 log.error("Caught unknown error `%s' while sending line", e, exc_info=True)
+        self._finish()
+
+    def _finish(self):
+        """Saves the final state and releases the file."""
         if self._file:
             self._update_state(self.real_name, self._get_file_position())
         self._close_log()
+        if self._watch:
+            self._watch.close()
+
+
+class SyslogInput(object):
+
+    """
+    Sends messages received by the syslog server on the address given, see
+    syslogd.parse_address. If the app name is given, only messages of the app
+    are accepted; otherwise messages not accepted by other inputs of the
+    address are. Messages pass the same filter, formatter and transport as
+    lines of followed files. Messages cannot wait for the transport, those
+    which do not fit in its queue are dropped.
+    """
+
+    def __init__(self, name, address, app_name, entry_filter, entry_formatter, transport):
+        self.name = name
+        self.address = address
+        self.app_name = app_name
+        self.entry_filter = entry_filter
+        self.entry_formatter = entry_formatter
+        self.transport = transport
+        self._sender = metrics.NonBlockingTransport(transport)
+        self._bytes_native = getattr(entry_filter, 'bytes_native', False) and \
+            getattr(entry_formatter, 'bytes_native', False)
+        self._batch = isinstance(entry_filter, BatchFilter) or \
+            isinstance(entry_formatter, BatchFormatter)
+        # Statistics, updated by the receiving thread only
+        self._received = 0
+        self._filtered = 0
+
+    def send(self, lines):
+        """Sends lines of messages received."""
+        self._received += len(lines)
+        try:
+            lines = decode_lines(lines, self._bytes_native)
+            self._filtered += send_lines(lines, self.entry_filter, self.entry_formatter,
+                                         self._sender, self._batch)
+        except Exception, e:
+            log.error("Caught unknown error `%s' while sending messages", e, exc_info=True)
+
+    def stats(self):
+        """Returns statistics of the input as a dictionary."""
+        return {
+            'name': self.name,
+            'listen': self.address,
+            'app_name': self.app_name,
+            'received': self._received,
+            'filtered': self._filtered,
+            'dropped': self._sender.dropped,
+        }
+
+
+class _SyslogRouter(object):
+
+    """Routes messages received on a single address to inputs by their app
+    names."""
+
+    def __init__(self):
+        # App name -> input
+        self._apps = {}
+        self._default = None
+
+    def add(self, syslog_input):
+        if syslog_input.app_name:
+            self._apps[syslog_input.app_name] = syslog_input
+        else:
+            self._default = syslog_input
+
+    def __call__(self, messages):
+        if not self._apps:
+            if self._default:
+                self._default.send([line for _, line in messages])
+            return
+        routed = {}
+        for app, line in messages:
+            target = self._apps.get(app, self._default)
+            if target:
+                routed.setdefault(target, []).append(line)
+        for target, lines in routed.iteritems():
+            target.send(lines)
+
+
+def start_syslog_server(inputs):
+    """Starts receiving syslog messages of the inputs given. Returns the
+    server, None if there are no inputs or sockets cannot be created."""
+    if not inputs:
+        return None
+    routers = {}
+    listeners = []
+    for syslog_input in inputs:
+        kind, address = syslogd.parse_address(syslog_input.address)
+        router = routers.get((kind, address))
+        if not router:
+            router = routers[(kind, address)] = _SyslogRouter()
+            listeners.append((kind, address, router))
+        router.add(syslog_input)
+    socket_mode = syslogd.SOCKET_MODE
+    if config.syslog_socket_mode != NOT_SET:
+        socket_mode = config.syslog_socket_mode
+    try:
+        return syslogd.SyslogServer(listeners, socket_mode)
+    except syslogd.SyslogError, e:
+        log.error('%s', e.msg)
+        return None
+
+
+class _ReactorWatch(object):
+
+    """Inotify watch of a follower registered with FollowerReactor. Events
+    are dispatched by the reactor and accumulated in the events mask."""
+
+    def __init__(self, reactor):
+        self._reactor = reactor
+        self._wds = []
+        self.events = 0
+
+    def _add(self, path, mask, pattern):
+        wd = self._reactor._inotify.add_watch(path, mask)
+        self._reactor._watches.setdefault(wd, {})[self] = pattern
+        self._wds.append(wd)
+
+    def watch(self, filename, pattern=None):
+        """See inotify.FileWatch.watch."""
+        self.unwatch()
+        try:
+            self._add(filename, inotify.FileWatch.FILE_EVENTS, None)
+            self._add(os.path.dirname(filename) or '.',
+                      inotify.FileWatch.DIR_EVENTS | inotify.IN_ONLYDIR,
+                      os.path.basename(pattern or filename))
+        except OSError:
+            pass
+
+    def unwatch(self):
+        watches = self._reactor._watches
+        for wd in self._wds:
+            watchers = watches.get(wd)
+            if watchers is None:
+                continue
+            watchers.pop(self, None)
+            # Watch descriptors are shared by all followers of the same file
+            # or directory
+            if not watchers:
+                del watches[wd]
+                self._reactor._inotify.rm_watch(wd)
+        self._wds = []
+
+    def close(self):
+        self.unwatch()
+
+
+class FollowerReactor(object):
+
+    """
+    Follows logs of many followers in a single thread. Followers registered
+    with the reactor do not start their own threads; the reactor waits for
+    inotify events of all followed files at once and makes non-blocking steps
+    of followers which are ready. Without inotify, followers are polled in
+    TAIL_RECHECK intervals.
+    """
+
+    def __init__(self):
+        self._inotify = None
+        if inotify.available():
+            try:
+                self._inotify = inotify.Inotify()
+            except OSError, e:
+                _inotify_unavailable('reactor', 'polling', e)
+        # Watch descriptor -> {watch: file name pattern or None for files}
+        self._watches = {}
+        # Follower -> [time of the next step, ready for immediate step]
+        self._followers = {}
+        self._lock = threading.Lock()
+        self._added = []
+        self._removed = []
+        self._wake_r, self._wake_w = os.pipe()
+        self._shutdown = False
+        self._worker = threading.Thread(target=self.run, name='reactor')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def create_watch(self):
+        """Returns watch for a new follower, None if followers are polled."""
+        if self._inotify:
+            return _ReactorWatch(self)
+        return None
+
+    def add(self, follower):
+        self._lock.acquire()
+        try:
+            self._added.append(follower)
+        finally:
+            self._lock.release()
+        self._wake()
+
+    def remove(self, follower):
+        self._lock.acquire()
+        try:
+            self._removed.append(follower)
+        finally:
+            self._lock.release()
+        self._wake()
+
+    def _wake(self):
+        self._lock.acquire()
+        try:
+            if self._wake_w != -1:
+                try:
+                    os.write(self._wake_w, '\0')
+                except OSError:
+                    pass
+        finally:
+            self._lock.release()
+
+    def _update_followers(self):
+        self._lock.acquire()
+        try:
+            added, self._added = self._added, []
+            removed, self._removed = self._removed, []
+        finally:
+            self._lock.release()
+        for follower in added:
+            self._followers[follower] = [0, True]
+        for follower in removed:
+            if self._followers.pop(follower, None) is not None:
+                self._finish(follower)
+
+    def _finish(self, follower):
+        try:
+            follower._finish()
+        except Exception, e:
+            log.error("Caught unknown error `%s' while closing follower", e, exc_info=True)
+        follower._closed.set()
+
+    def _dispatch_events(self):
+        for wd, mask, name in self._inotify.read_events():
+            if mask & inotify.IN_Q_OVERFLOW:
+                # Events were lost, check all followers
+                for watchers in self._watches.itervalues():
+                    for watch in watchers:
+                        watch.events |= inotify.IN_MODIFY | inotify.IN_CREATE
+                continue
+            for watch, pattern in self._watches.get(wd, {}).iteritems():
+                if pattern is None:
+                    watch.events |= mask & inotify.FileWatch.FILE_EVENTS
+                elif fnmatch.fnmatchcase(name, pattern):
+                    watch.events |= inotify.IN_CREATE
+
+    def _wait(self, timeout):
+        fds = [self._wake_r]
+        if self._inotify:
+            fds.append(self._inotify.fileno())
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+        except select.error:
+            return
+        if self._wake_r in readable:
+            os.read(self._wake_r, 4096)
+        if self._inotify and self._inotify.fileno() in readable:
+            self._dispatch_events()
+
+    def _step(self, follower, events, timed_out):
+        try:
+            return follower._react(events, timed_out)
+        except Exception, e:
+            log.error("Caught unknown error `%s' while sending line", e, exc_info=True)
+            return TAIL_RECHECK
+
+    def run(self):
+        while not self._shutdown:
+            self._update_followers()
+
+            now = time.time()
+            timeout = INOTIFY_RECHECK
+            for next_step, ready in self._followers.itervalues():
+                if ready:
+                    timeout = 0
+                    break
+                timeout = min(timeout, next_step - now)
+            self._wait(max(timeout, 0))
+
+            now = time.time()
+            for follower, step in self._followers.items():
+                events = 0
+                watch = follower._watch
+                if watch:
+                    events, watch.events = watch.events, 0
+                timed_out = not step[1] and step[0] <= now
+                if not (events or step[1] or timed_out):
+                    continue
+                interval = self._step(follower, events, timed_out)
+                step[0] = now + interval
+                step[1] = interval == 0
+
+        self._update_followers()
+        for follower in self._followers.keys():
+            self._finish(follower)
+        self._followers = {}
+        self._close()
+
+    def _close(self):
+        """Releases inotify and the wake pipe once the worker is done."""
+        if self._inotify:
+            self._inotify.close()
+        self._lock.acquire()
+        try:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = -1
+        finally:
+            self._lock.release()
+
+    def stop(self):
+        """Signals the reactor to stop without waiting, see join."""
+        self._shutdown = True
+        self._wake()
+
+    def join(self, timeout):
+        """Waits up to timeout seconds for the reactor to stop, remaining
+        followers are closed."""
+        self._worker.join(timeout)
+
+    def close(self):
+        """Stops the reactor, remaining followers are closed."""
+        self.stop()
+        self.join(FOLLOWER_JOIN_INTERVAL)
+
+
+class _Ack(object):
+
+    """Acknowledgement queued behind entries, see Transport.acknowledge.
+    Acknowledgements of pooled logs carry the preamble of their log."""
+
+    def __init__(self, callback, preamble=None):
+        self.callback = callback
+        self.preamble = preamble
+
+
+def _split_acks(entries):
+    """Separates acknowledgements from entries. Returns entries and
+    acknowledgements."""
+    acks = [x for x in entries if isinstance(x, _Ack)]
+    if acks:
+        entries = [x for x in entries if not isinstance(x, _Ack)]
+    return entries, acks
+
+
+class SendQueue(object):
+
+    """Queue of entries waiting to be sent, bounded by the total size of
+    entries. With the backpressure policy the queue stops accepting once it
+    is full and followers wait until it drains to a half; their entries are
+    always accepted, hence the queue may exceed its size by the blocks read
+    before followers stopped. Producers which cannot wait, such as metrics
+    and syslog inputs, put entries without blocking and their entries are
+    dropped if they do not fit. With the drop-oldest policy the oldest
+    entries are dropped to make space for new ones. Entries of zero size,
+    such as acknowledgements, are not counted as queued or dropped. The
+    interface follows Queue.Queue."""
+
+    def __init__(self, max_size, policy=SEND_QUEUE_BACKPRESSURE, item_size=len):
+        self._entries = collections.deque()
+        self.item_size = item_size
+        self._size = 0
+        self.max_size = max_size
+        self._low_watermark = max_size / 2
+        self._policy = policy
+        self._accepting = True
+        # Number of entries put and dropped
+        self.queued = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def accepting(self):
+        """Returns False if producers should stop until the queue drains."""
+        return self._accepting
+
+    def wait_accepting(self, timeout):
+        """Waits up to timeout seconds for the queue to accept entries.
+        Returns the accepting state."""
+        self._lock.acquire()
+        try:
+            if not self._accepting:
+                self._not_full.wait(timeout)
+            return self._accepting
+        finally:
+            self._lock.release()
+
+    def put(self, entry, block=True):
+        """Appends the entry. If block is False and the queue has the
+        backpressure policy, the entry is dropped and Queue.Full is raised
+        if it does not fit in the queue."""
+        self._lock.acquire()
+        try:
+            size = self.item_size(entry)
+            if not block and size and self._policy == SEND_QUEUE_BACKPRESSURE and \
+                    self._size + size > self.max_size:
+                self.dropped += 1
+                raise Queue.Full
+            self._entries.append(entry)
+            self._size += size
+            if size:
+                self.queued += 1
+            if self._size > self.max_size:
+                if self._policy == SEND_QUEUE_DROP_OLDEST:
+                    while self._size > self.max_size and len(self._entries) > 1:
+                        size = self.item_size(self._entries.popleft())
+                        self._size -= size
+                        if size:
+                            self.dropped += 1
+                else:
+                    self._accepting = False
+            self._not_empty.notify()
+        finally:
+            self._lock.release()
+
+    def get(self, block=True, timeout=None):
+        """Removes and returns the oldest entry. Raises Queue.Empty if there
+        is no entry within the timeout given."""
+        self._lock.acquire()
+        try:
+            if block and not self._entries:
+                if timeout is None:
+                    while not self._entries:
+                        self._not_empty.wait()
+                else:
+                    deadline = time.time() + timeout
+                    while not self._entries:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._not_empty.wait(remaining)
+            if not self._entries:
+                raise Queue.Empty
+            entry = self._entries.popleft()
+            self._size -= self.item_size(entry)
+            if not self._accepting and self._size <= self._low_watermark:
+                self._accepting = True
+                self._not_full.notifyAll()
+            return entry
+        finally:
+            self._lock.release()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def qsize(self):
+        return len(self._entries)
+
+    def size(self):
+        """Returns the total size of queued entries."""
+        return self._size
 
 
 class Transport(object):
@@ -1372,11 +2698,45 @@ class Transport(object):
         self.port = port
         self.use_ssl = use_ssl
         self.preamble = preamble
-        self._entries = Queue.Queue(SEND_QUEUE_SIZE)
+        queue_size = SEND_QUEUE_SIZE
+        if config.send_queue_size != NOT_SET:
+            queue_size = config.send_queue_size
+        queue_policy = SEND_QUEUE_BACKPRESSURE
+        if config.send_queue_policy != NOT_SET:
+            queue_policy = config.send_queue_policy
+        self._entries = SendQueue(queue_size, queue_policy, self._entry_size)
         self._socket = None # Socket with optional TLS encyption
         self._debug_transport_events = debug_transport_events
+        # Entries go to the spool while disconnected or the queue is full,
+        # and keep going there until the spool is replayed
+        self._connected = False
+        self._spooling = False
+        self._spool_lock = threading.Lock()
+        self._spool = self._create_spool()
+        # Entries not sent on the last shutdown, replayed first
+        self._unsent = self._open_unsent()
+        # Spool of the entries being sent if they have been read from one
+        self._replayed = None
+        # Entries taken from the queue whose sending has been interrupted
+        self._taken = []
+        # Statistics, updated by the networking thread unless noted
+        self._sent = 0
+        self._spooled = 0 # Under the spool lock
+        self._reconnects = 0
+        self._connect_failures = 0
+        # Limits of entries sent in a single write
+        self._batch_size = SEND_BATCH_SIZE
+        if config.send_batch_size != NOT_SET:
+            self._batch_size = config.send_batch_size
+        self._batch_latency = SEND_BATCH_LATENCY
+        if config.send_batch_latency != NOT_SET:
+            self._batch_latency = config.send_batch_latency
 
         self._shutdown = False # Shutdown flag - terminates the networking thread
+        # Queued entries are sent until the deadline on shutdown, see stop
+        self._drain_deadline = None
+        # Interrupts waiting between connection attempts on shutdown
+        self._wakeup = threading.Event()
 
         # proxy setup
         self._use_proxy = False
@@ -1414,10 +2774,91 @@ class Transport(object):
         self._certs = cert_name
 
         # Start asynchronous worker
-        self._worker = threading.Thread(target=self.run)
+        self._worker = threading.Thread(target=self._work)
         self._worker.daemon = True
         self._worker.start()
 
+    def _entry_size(self, entry):
+        if isinstance(entry, _Ack):
+            return 0
+        return len(entry)
+
+    def _spool_name(self):
+        """Returns name of the spool directory of this destination."""
+        return '%s_%s_%s' % (self.endpoint, self.port,
+                             hashlib.md5(self.preamble).hexdigest())
+
+    def _spool_size(self):
+        if config.spool_size != NOT_SET:
+            return config.spool_size
+        return SPOOL_SIZE
+
+    def _unsent_dir(self):
+        """Returns directory of entries not sent on shutdown, None if there
+        is neither state file nor pid file."""
+        base = config.state_file
+        if base == NOT_SET:
+            base = config.pid_file
+        if not base:
+            return None
+        return os.path.join(os.path.splitext(base)[0] + UNSENT_SUFFIX,
+                            self._spool_name())
+
+    def _encode_spooled(self, entry):
+        """Returns the queued entry as a string to be spooled."""
+        if isinstance(entry, unicode):
+            entry = entry.encode('utf8')
+        return entry
+
+    def _decode_spooled(self, data):
+        """Returns the spooled string as an entry to be queued."""
+        return data
+
+    def _create_spool(self):
+        """Returns spool of this destination, None if spooling is not
+        configured."""
+        if config.spool_dir == NOT_SET:
+            return None
+        try:
+            s = spool.Spool(os.path.join(config.spool_dir, self._spool_name()),
+                            self._spool_size())
+        except (IOError, OSError), e:
+            log.error("Cannot create spool in %s: %s", config.spool_dir, e)
+            return None
+        # Replay entries left from the previous run
+        self._spooling = not s.empty()
+        return s
+
+    def _open_unsent(self):
+        """Returns spool of entries not sent on the last shutdown, None if
+        there are no such entries."""
+        unsent_dir = self._unsent_dir()
+        if not unsent_dir or not os.path.isdir(unsent_dir):
+            return None
+        try:
+            s = spool.Spool(unsent_dir, self._spool_size())
+        except (IOError, OSError), e:
+            log.error("Cannot load entries not sent from %s: %s", unsent_dir, e)
+            return None
+        if s.empty():
+            self._remove_unsent(s, unsent_dir)
+            return None
+        log.info("Sending entries not sent on the last shutdown to %s:%s",
+                 self.endpoint, self.port)
+        self._spooling = True
+        return s
+
+    def _remove_unsent(self, s, unsent_dir):
+        """Closes spool of entries not sent and removes its directory once
+        all entries have been sent."""
+        s.close()
+        try:
+            os.rmdir(unsent_dir)
+            os.rmdir(os.path.dirname(unsent_dir))
+        except OSError:
+            # Entries of other destinations are left
+            pass
+
     def _get_address(self, use_proxy):
         if use_proxy:
             return self.endpoint
@@ -1481,8 +2922,10 @@ class Transport(object):
             return None
         return plain_socket
 
-    def _open_connection(self):
-        """ Opens a push connection to logentries. """
+    def _open_connection(self, attempts=None):
+        """ Opens a push connection to logentries. Gives up after the number
+        of failed attempts given, if any, or after a failed attempt on
+        shutdown. """
         preamble = self.preamble.strip()
         if preamble:
             preamble = ' ' + preamble
@@ -1490,8 +2933,9 @@ class Transport(object):
                   self.endpoint, self.port, preamble)
         retry = 0
         delay = SRV_RECON_TO_MIN
+        self._connected = False
         # Keep trying to open the connection
-        while not self._shutdown:
+        while not self._stopped():
             self._close_connection()
             try:
                 s = None
@@ -1511,14 +2955,18 @@ class Transport(object):
                 if self._socket:
                     if self.preamble:
                         self._socket.send(self.preamble)
+                    self._connected = True
                     break
             except socket.error:
                 if self._shutdown:
                     return  # XXX
+            self._connect_failures += 1
+            retry += 1
+            if attempts and retry >= attempts or self._drain_deadline is not None:
+                break
 
             # Wait between attempts
-            time.sleep(delay)
-            retry += 1
+            self._wakeup.wait(delay)
             delay *= 2
             if delay > SRV_RECON_TO_MAX:
                 delay = SRV_RECON_TO_MAX
@@ -1533,57 +2981,583 @@ class Transport(object):
                 pass
             self._socket = None
 
-    def _send_entry(self, entry):
-        """Sends the entry. If the connection fails it will re-open it and try
-        again."""
+    def _send_data(self, data):
+        """Sends the data. If the connection fails it will re-open it and try
+        again. Returns False if interrupted by shutdown."""
         # Keep sending data until successful
-        while not self._shutdown:
+        while not self._stopped():
             try:
-                self._socket.send(entry.encode('utf8'))
+                self._socket.sendall(data)
                 if self._debug_transport_events:
-                    print >> sys.stderr, entry.encode('utf8'),
-                break
+                    print >> sys.stderr, data,
+                return True
             except socket.error:
+                self._reconnects += 1
                 self._open_connection()
+                if not self._connected:
+                    break
+        return False
 
-    def send(self, entry):
+    def _get_entries(self, block=True, timeout=IAA_INTERVAL):
+        """Waits up to timeout for an entry, then takes further entries
+        queued within the batch size and latency limits. Returns the entries,
+        IAA token on inactivity. If not blocking, returns queued entries
+        only."""
+        try:
+            if block:
+                entry = self._entries.get(True, timeout)
+            else:
+                entry = self._entries.get_nowait()
+        except Queue.Empty:
+            if not block:
+                return []
+            return [IAA_TOKEN]
+        entries = [entry]
+        size = self._entry_size(entry)
+        deadline = time.time() + self._batch_latency
+        if not block:
+            deadline = 0
+        while size < self._batch_size and not self._shutdown:
+            try:
+                entry = self._entries.get_nowait()
+            except Queue.Empty:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._entries.get(True, remaining)
+                except Queue.Empty:
+                    break
+            entries.append(entry)
+            size += self._entry_size(entry)
+        return entries
+
+    def send(self, entry, block=True):
         """Sends the entry given. Depending on transport configuration it will
         block until the entry is sent or it will queue the entry for async
-        send.
+        send. Producers which do not wait for accepting pass block as False,
+        see SendQueue.put; Queue.Full is raised if the entry is dropped.
 
         Note: entry must end with a new line
         """
-        while True:
+        if self._spool and self._spool_entry(entry):
+            return
+        self._entries.put(entry, block)
+
+    def acknowledge(self, callback):
+        """Calls the callback from the networking thread once all entries
+        given before have been sent or spooled."""
+        # Never spooled, spooled entries are replayed after queued ones
+        self._entries.put(_Ack(callback))
+
+    def _spool_entry(self, entry):
+        """Appends the entry to the spool if disconnected, the queue is full
+        or spooled entries are not replayed yet. Returns True if spooled."""
+        self._spool_lock.acquire()
+        try:
+            if not self._spooling and self._connected and self._entries.accepting():
+                return False
+            if isinstance(entry, unicode):
+                entry = entry.encode('utf8')
             try:
-                self._entries.put_nowait(entry)
-                break
-            except Queue.Full:
-                try:
-                    self._entries.get_nowait()
-                except Queue.Empty:
-                    pass
+                self._spool.append([entry])
+            except (IOError, OSError), e:
+                log.error("Cannot write to spool: %s", e)
+                return False
+            self._spooling = True
+            self._spooled += 1
+            return True
+        finally:
+            self._spool_lock.release()
+
+    def _get_spooled(self):
+        """Returns spooled entries to be sent next, None if there are no
+        spooled entries left. Entries not sent on the last shutdown are the
+        oldest ones. Queued entries are older than spooled ones, hence they
+        are returned before them. Spooled entries are consumed once sent,
+        see _replayed."""
+        self._replayed = None
+        if self._unsent:
+            entries = self._read_spooled(self._unsent)
+            if entries or not self._unsent.empty():
+                return entries
+            self._remove_unsent(self._unsent, self._unsent_dir())
+            self._unsent = None
+        entries = self._get_entries(False)
+        if entries:
+            return entries
+        if not self._spool:
+            self._spooling = False
+            return None
+        entries = self._read_spooled(self._spool)
+        if entries:
+            return entries
+        self._spool_lock.acquire()
+        try:
+            if self._spool.empty():
+                self._spooling = False
+                return None
+            return []
+        finally:
+            self._spool_lock.release()
 
-    def close(self):
+    def _read_spooled(self, s):
+        """Returns the next entries of the spool given, an empty list if
+        there are none or the spool cannot be read."""
+        try:
+            data = s.read(self._batch_size)
+        except (IOError, OSError), e:
+            log.error("Cannot read from spool: %s", e)
+            time.sleep(TAIL_RECHECK)
+            return []
+        if data:
+            self._replayed = s
+        return [self._decode_spooled(x) for x in data]
+
+    def accepting(self):
+        """Returns False if followers should stop reading until queued
+        entries are sent. With spool, followers stop also while the
+        connection is down or spooled entries are replayed, only entries from
+        other sources are spooled."""
+        if self._spool and (self._spooling or not self._connected):
+            return False
+        return self._entries.accepting()
+
+    def wait_accepting(self, timeout):
+        """Waits up to timeout seconds for the transport to accept entries.
+        Returns True if entries are accepted."""
+        return self._entries.wait_accepting(timeout)
+
+    def stats(self):
+        """Returns statistics of the transport as a dictionary. Queued
+        entries include the ones sent and dropped."""
+        stats = {
+            'endpoint': '%s:%s' % (self.endpoint, self.port),
+            'queued': self._entries.queued,
+            'sent': self._sent,
+            'dropped': self._entries.dropped,
+            'queue_depth': self._entries.qsize(),
+            'queue_size': self._entries.size(),
+            'reconnects': self._reconnects,
+            'connect_failures': self._connect_failures,
+        }
+        if self._spool:
+            stats['spooled'] = self._spooled
+            stats['spool_evicted'] = self._spool.evicted
+        return stats
+
+    def _stopped(self):
+        """Returns True if the networking thread has to stop, either
+        immediately or because the time to send queued entries on shutdown
+        has run out."""
+        if self._shutdown:
+            return True
+        return self._drain_deadline is not None and time.time() >= self._drain_deadline
+
+    def stop(self, deadline):
+        """Signals the networking thread to send queued entries until the
+        deadline and stop, without waiting for it. See join."""
+        self._drain_deadline = deadline
+        # Wake up the networking thread waiting for entries or reconnecting
+        self._wakeup.set()
+        self._entries.put(_Ack(lambda: None))
+
+    def join(self, timeout):
+        """Waits up to timeout seconds for queued entries to be sent and the
+        networking thread to save the rest, see _work."""
+        self._worker.join(timeout)
         self._shutdown = True
-        self.send('') # Force the networking thread to check the shutdown flag
-        self._worker.join(TRANSPORT_JOIN_INTERVAL)
+        if self._worker.isAlive():
+            log.warning("Entries queued for %s:%s are not saved, sending has not stopped in time",
+                        self.endpoint, self.port)
+
+    def close(self):
+        self.stop(time.time() + TRANSPORT_JOIN_INTERVAL)
+        self.join(TRANSPORT_JOIN_INTERVAL)
+
+    def _work(self):
+        """Body of the networking thread. Entries not sent are saved once
+        sending has stopped."""
+        try:
+            self.run()
+        finally:
+            self._save_queued()
+            if self._spool:
+                self._spool.close()
+            if self._unsent:
+                self._unsent.close()
+
+    def _save_queued(self):
+        """Moves entries left in the queue to the spool, before the spooled
+        entries which are newer. If spooling is not configured, entries are
+        saved in the unsent directory and sent on the next start."""
+        entries, acks = _split_acks(self._take_queued())
+        if entries:
+            data = [self._encode_spooled(x) for x in entries]
+            unsent_dir = self._unsent_dir()
+            if not self._spool and not unsent_dir:
+                log.error("Cannot save %d entries not sent without state or pid file", len(data))
+                return
+            try:
+                if self._spool:
+                    self._spool.insert(data)
+                elif self._unsent:
+                    # After entries not sent on the last shutdown
+                    self._unsent.append(data)
+                else:
+                    unsent = spool.Spool(unsent_dir, self._spool_size())
+                    unsent.append(data)
+                    unsent.close()
+            except (IOError, OSError), e:
+                log.error("Cannot save %d entries not sent: %s", len(data), e)
+                return
+            if self._spool:
+                self._spooled += len(data)
+            else:
+                log.info("Saved %d entries not sent to %s:%s", len(data), self.endpoint, self.port)
+        for ack in acks:
+            ack.callback()
+
+    def _take_queued(self):
+        """Removes and returns entries left in the queue, after the ones
+        whose sending has been interrupted."""
+        entries, self._taken = self._taken, []
+        while True:
+            try:
+                entries.append(self._entries.get_nowait())
+            except Queue.Empty:
+                break
+        return entries
 
     def run(self):
         """When run with backgroud thread it collects entries from internal
-        queue and sends them to destination."""
+        queue and sends them to destination. On shutdown, queued and spooled
+        entries are sent in the same order until there are none left, the
+        connection fails or the deadline passes."""
         self._open_connection()
-        while not self._shutdown:
+        while not self._stopped():
             try:
-                try:
-                    entry = self._entries.get(True, IAA_INTERVAL)
-                except Queue.Empty:
-                    entry = IAA_TOKEN
-                self._send_entry(entry + '\n')
+                draining = self._drain_deadline is not None
+                if draining and not self._connected:
+                    # Queued entries will be saved
+                    break
+                entries = None
+                self._replayed = None
+                if self._spooling:
+                    entries = self._get_spooled()
+                    if entries == []:
+                        if draining:
+                            break
+                        continue
+                if entries is None:
+                    entries = self._get_entries(not draining)
+                    if not entries:
+                        break
+                entries, acks = _split_acks(entries)
+                if entries:
+                    data = []
+                    for entry in entries:
+                        if isinstance(entry, unicode):
+                            entry = entry.encode('utf8')
+                        data.append(entry)
+                    data.append('')
+                    if not self._send_data('\n'.join(data)):
+                        if not self._replayed and entries[0] is not IAA_TOKEN:
+                            # Saved with queued entries, spooled ones are
+                            # left unconsumed
+                            self._taken = entries + acks
+                        continue
+                    if entries[0] is not IAA_TOKEN:
+                        self._sent += len(entries)
+                    if self._replayed:
+                        self._replayed.consume()
+                for ack in acks:
+                    ack.callback()
             except Exception:
                 log.error("Exception in run: %s", traceback.format_exc())
         self._close_connection()
 
 
+class PooledTransport(Transport):
+
+    """
+    Transport of logs identified by keys. Instead of a connection and a thread
+    for each log, all logs share a single thread and a pool of connections.
+    Each connection streams entries of a single log preceded by its PUT
+    preamble, as the Transport does. Connections unused for idle_timeout are
+    closed. Once the pool has max_connections, the least recently used
+    connection is replaced only if it has been idle for IAA_INTERVAL, the
+    pool grows beyond the limit while more logs are active and shrinks back
+    as they become idle. Entries of a log which cannot be connected are held
+    and retried after growing delays, without delaying other logs.
+    """
+
+    def __init__(self, endpoint, port, use_ssl, debug_transport_events, proxy,
+                 max_connections, idle_timeout=PUT_IDLE_TIMEOUT):
+        # Preamble -> [socket, time of the last entry, time of the last write]
+        self._connections = {}
+        self._max_connections = max(max_connections, 1)
+        self._idle_timeout = idle_timeout
+        # Preamble -> [time of the next connection attempt, delay]
+        self._backoff = {}
+        # Preamble -> [entries, acknowledgements, size] taken from the queue
+        # and not written yet
+        self._held = {}
+        self._held_size = 0
+        # Acknowledgements of no log, called once no entries are held
+        self._acks = []
+        Transport.__init__(self, endpoint, port, use_ssl, '',
+                           debug_transport_events, proxy)
+
+    def get(self, preamble):
+        """Returns transport of the log given by its preamble."""
+        return _PooledLog(self, preamble)
+
+    def _entry_size(self, entry):
+        if isinstance(entry, tuple):
+            return len(entry[1])
+        if isinstance(entry, _Ack):
+            return 0
+        return len(entry)
+
+    def _create_spool(self):
+        return None
+
+    def _spool_name(self):
+        # Preambles are carried by entries
+        return '%s_%s_put' % (self.endpoint, self.port)
+
+    def _encode_spooled(self, entry):
+        # Entries are preceded by the length of the preamble and the preamble
+        preamble, entry = entry
+        if isinstance(entry, unicode):
+            entry = entry.encode('utf8')
+        return '%d %s%s' % (len(preamble), preamble, entry)
+
+    def _decode_spooled(self, data):
+        length, data = data.split(' ', 1)
+        length = int(length)
+        return data[:length], data[length:]
+
+    def _connection(self, preamble):
+        """Returns connection of the log, opens a new one if needed. Returns
+        None if the log cannot be connected now or on shutdown."""
+        connection = self._connections.get(preamble)
+        if connection:
+            return connection[0]
+        now = time.time()
+        backoff = self._backoff.get(preamble)
+        if backoff and now < backoff[0]:
+            return None
+        if len(self._connections) >= self._max_connections:
+            lru, connection = min(self._connections.items(), key=lambda item: item[1][1])
+            if now - connection[1] >= IAA_INTERVAL:
+                self._drop_connection(lru)
+        self.preamble = preamble
+        self._socket = None
+        self._open_connection(1)
+        connection_socket, self._socket = self._socket, None
+        if connection_socket:
+            now = time.time()
+            self._connections[preamble] = [connection_socket, now, now]
+            self._backoff.pop(preamble, None)
+        else:
+            self._back_off(preamble)
+        return connection_socket
+
+    def _back_off(self, preamble):
+        """Delays the next connection attempt of the log."""
+        backoff = self._backoff.get(preamble)
+        if backoff:
+            delay = min(backoff[1] * 2, SRV_RECON_TO_MAX)
+        else:
+            delay = SRV_RECON_TO_MIN
+        self._backoff[preamble] = [time.time() + delay, delay]
+
+    def _drop_connection(self, preamble):
+        connection = self._connections.pop(preamble, None)
+        if connection:
+            self._socket = connection[0]
+            self._close_connection()
+
+    def _write(self, preamble, data):
+        """Writes data to the connection of the log. A broken connection is
+        reopened once. Returns False if the data has not been written."""
+        for attempt in range(2):
+            if self._stopped():
+                break
+            connection_socket = self._connection(preamble)
+            if not connection_socket:
+                break
+            try:
+                connection_socket.sendall(data)
+                if self._debug_transport_events:
+                    print >> sys.stderr, data,
+                self._connections[preamble][2] = time.time()
+                return True
+            except socket.error:
+                self._reconnects += 1
+                self._drop_connection(preamble)
+                if attempt:
+                    self._back_off(preamble)
+        return False
+
+    def stats(self):
+        stats = Transport.stats(self)
+        stats['connections'] = len(self._connections)
+        stats['held'] = self._held_size
+        return stats
+
+    def _maintain_connections(self):
+        """Closes idle connections and keeps the others alive. Connections
+        over the limit are closed once idle for IAA_INTERVAL, least recently
+        used first."""
+        now = time.time()
+        connections = self._connections.items()
+        connections.sort(key=lambda item: item[1][1])
+        count = len(connections)
+        for preamble, connection in connections:
+            idle = now - connection[1]
+            if idle >= self._idle_timeout or \
+                    (count > self._max_connections and idle >= IAA_INTERVAL):
+                self._drop_connection(preamble)
+                count -= 1
+            elif now - connection[2] >= IAA_INTERVAL:
+                self._write(preamble, IAA_TOKEN + '\n')
+
+    def _hold(self, entry):
+        """Adds the entry taken from the queue to entries of its log."""
+        if isinstance(entry, _Ack):
+            if entry.preamble is None:
+                self._acks.append(entry)
+            else:
+                self._held.setdefault(entry.preamble, [[], [], 0])[1].append(entry)
+            return
+        if not isinstance(entry, tuple):
+            # IAA token
+            return
+        preamble, entry = entry
+        if isinstance(entry, unicode):
+            entry = entry.encode('utf8')
+        held = self._held.setdefault(preamble, [[], [], 0])
+        held[0].append(entry)
+        held[2] += len(entry)
+        self._held_size += len(entry)
+
+    def _write_held(self):
+        """Writes held entries of logs which can be connected and calls
+        their acknowledgements. Returns True if any entries were written."""
+        written = False
+        for preamble, held in self._held.items():
+            if self._stopped():
+                break
+            entries, acks, size = held
+            if entries:
+                entries.append('')
+                ok = self._write(preamble, '\n'.join(entries))
+                entries.pop()
+                if not ok:
+                    continue
+                self._connections[preamble][1] = time.time()
+                self._sent += len(entries)
+                self._held_size -= size
+                written = True
+            del self._held[preamble]
+            for ack in acks:
+                ack.callback()
+        if not self._held:
+            acks, self._acks = self._acks, []
+            for ack in acks:
+                ack.callback()
+        return written
+
+    def _retry_delay(self):
+        """Returns time until held entries should be written again or a
+        connection has to be closed or kept alive, at most IAA_INTERVAL."""
+        delay = IAA_INTERVAL
+        now = time.time()
+        for preamble in self._held:
+            backoff = self._backoff.get(preamble)
+            if not backoff:
+                return 0
+            delay = min(delay, backoff[0] - now)
+        for _, last_entry, last_write in self._connections.itervalues():
+            delay = min(delay, last_entry + self._idle_timeout - now,
+                        last_write + IAA_INTERVAL - now)
+        return max(delay, 0)
+
+    def run(self):
+        """Collects entries of all logs from the queue and sends them over
+        connections of their logs. On shutdown, queued entries are sent until
+        the queue is empty and held entries cannot be written."""
+        while not self._stopped():
+            try:
+                draining = self._drain_deadline is not None
+                if self._spooling:
+                    # Entries not sent on the last shutdown are consumed and
+                    # followed by the next ones once written
+                    entries = []
+                    if self._held:
+                        time.sleep(min(self._retry_delay(), TAIL_RECHECK))
+                    else:
+                        if self._replayed:
+                            self._replayed.consume()
+                        entries = self._get_spooled() or []
+                elif self._held_size >= self._entries.max_size:
+                    # Held entries take the whole queue size, new entries
+                    # wait in the queue
+                    entries = []
+                    time.sleep(min(self._retry_delay(), TAIL_RECHECK))
+                else:
+                    entries = self._get_entries(not draining, self._retry_delay())
+                for entry in entries:
+                    self._hold(entry)
+                written = self._write_held()
+                if draining and not entries and not written:
+                    break
+                if not draining:
+                    self._maintain_connections()
+            except Exception:
+                log.error("Exception in run: %s", traceback.format_exc())
+        for preamble in self._connections.keys():
+            self._drop_connection(preamble)
+
+    def _take_queued(self):
+        # Held entries are older than queued ones, entries not sent on the
+        # last shutdown are left where they are
+        entries = []
+        for preamble, (held, acks, size) in self._held.items():
+            if not self._replayed:
+                entries.extend([(preamble, x) for x in held])
+            entries.extend(acks)
+        entries.extend(self._acks)
+        self._held = {}
+        self._held_size = 0
+        self._acks = []
+        return entries + Transport._take_queued(self)
+
+
+class _PooledLog(object):
+
+    """Transport of a single log sending through PooledTransport."""
+
+    def __init__(self, pool, preamble):
+        self._pool = pool
+        self._preamble = preamble
+
+    def send(self, entry, block=True):
+        self._pool._entries.put((self._preamble, entry), block)
+
+    def acknowledge(self, callback):
+        self._pool._entries.put(_Ack(callback, self._preamble))
+
+    def accepting(self):
+        return self._pool.accepting()
+
+    def wait_accepting(self, timeout):
+        return self._pool.wait_accepting(timeout)
+
+
 class DefaultTransport(object):
 
     def __init__(self, xconfig):
@@ -1615,6 +3589,19 @@ class DefaultTransport(object):
                 (self._config.proxy_type, self._config.proxy_url, self._config.proxy_port))
         return self._transport
 
+    def current(self):
+        """Returns the transport if it has been created already, None
+        otherwise."""
+        return self._transport
+
+    def stop(self, deadline):
+        if self._transport:
+            self._transport.stop(deadline)
+
+    def join(self, timeout):
+        if self._transport:
+            self._transport.join(timeout)
+
     def close(self):
         if self._transport:
             self._transport.close()
@@ -1622,13 +3609,21 @@ class DefaultTransport(object):
 
 class ConfiguredLog(object):
 
-    def __init__(self, name, token, destination, path, formatter, entry_identifier):
+    def __init__(self, name, token, destination, path, formatter, entry_identifier,
+                 drop='', keep='', redact='', listen='', app_name=''):
         self.name = name
         self.token = token
         self.destination = destination
         self.path = path
+        # Syslog address and app name of messages accepted
+        self.listen = listen
+        self.app_name = app_name
         self.formatter = formatter
         self.entry_identifier = entry_identifier
+        # Filter rules, patterns one per line
+        self.drop = drop
+        self.keep = keep
+        self.redact = redact
         self.logset = None
         self.set_key = None
         self.log_key = None
@@ -1673,6 +3668,9 @@ class Config(object):
         self.formatters = NOT_SET
         self.formatter = NOT_SET
         self.entry_identifier = NOT_SET
+        self.drop = NOT_SET
+        self.keep = NOT_SET
+        self.redact = NOT_SET
         self.force = False
         self.hostname = NOT_SET
         self.name = NOT_SET
@@ -1680,6 +3678,7 @@ class Config(object):
         self.pid_file = PID_FILE
         self.std = False
         self.std_all = False
+        self.json_output = False
         self.system_stats_token = NOT_SET
         self.type_opt = NOT_SET
         self.uuid = False
@@ -1687,6 +3686,19 @@ class Config(object):
         self.yes = False
         self.multilog = False
         self.state_file = NOT_SET
+        self.state_position = NOT_SET
+        self.follower_engine = NOT_SET
+        self.send_batch_size = NOT_SET
+        self.send_batch_latency = NOT_SET
+        self.send_queue_size = NOT_SET
+        self.send_queue_policy = NOT_SET
+        self.spool_dir = NOT_SET
+        self.spool_size = NOT_SET
+        self.put_connections = NOT_SET
+        self.put_idle_timeout = NOT_SET
+        self.timestamp_resolution = NOT_SET
+        self.shutdown_timeout = NOT_SET
+        self.syslog_socket_mode = NOT_SET
         # Behaviour associated with daemontools/multilog
 
         #proxy
@@ -1779,6 +3791,52 @@ class Config(object):
                 return new_param
         return param
 
+    def _get_number(self, conf, param, param_name, parse, minimum, maximum, show):
+        """Returns the numeric parameter converted by parse unless given on
+        the command line already, NOT_SET if it is not configured. Raises
+        FatalConfigurationError if the value is invalid or out of range."""
+        if param != NOT_SET:
+            return param
+        value = conf.get(MAIN_SECT, param_name)
+        if not value:
+            return NOT_SET
+        try:
+            number = parse(value)
+        except ValueError:
+            raise FatalConfigurationError('Invalid %s: %s' % (param_name, value))
+        if number != number:
+            # Not a number
+            raise FatalConfigurationError('Invalid %s: %s' % (param_name, value))
+        if number < minimum:
+            raise FatalConfigurationError('Invalid %s: %s, at least %s expected' % (
+                param_name, value, show(minimum)))
+        if maximum is not None and number > maximum:
+            raise FatalConfigurationError('Invalid %s: %s, at most %s expected' % (
+                param_name, value, show(maximum)))
+        return number
+
+    def _get_int(self, conf, param, param_name, minimum, maximum=None, base=10):
+        """Returns integer parameter in the base given, see _get_number."""
+        if base == 8:
+            show = lambda x: '%04o' % x
+        else:
+            show = str
+        return self._get_number(conf, param, param_name, lambda x: int(x, base),
+                                minimum, maximum, show)
+
+    def _get_float(self, conf, param, param_name, minimum, maximum=None):
+        """Returns floating point parameter, see _get_number."""
+        return self._get_number(conf, param, param_name, float, minimum, maximum, str)
+
+    def _check_patterns(self, param_name, patterns):
+        """Raises FatalConfigurationError if any of the filter rule patterns
+        given one per line is not a valid regular expression."""
+        for pattern in rules.parse_patterns(patterns):
+            try:
+                rules.check_pattern(pattern, param_name == REDACT_PARAM)
+            except re.error:
+                raise FatalConfigurationError('Invalid %s: %s' % (param_name, pattern))
+
     def load(self, load_include_dirs=True):
         """
         Initializes configuration parameters from the configuration
@@ -1798,18 +3856,34 @@ class Config(object):
                 FORMATTERS_PARAM: '',
                 FORMATTER_PARAM: '',
                 ENTRY_IDENTIFIER_PARAM: '',
+                DROP_PARAM: '',
+                KEEP_PARAM: '',
+                REDACT_PARAM: '',
                 SUPPRESS_SSL_PARAM: '',
                 FORCE_DOMAIN_PARAM: '',
                 USE_CA_PROVIDED_PARAM: '',
                 DATAHUB_PARAM: '',
                 SYSSTAT_TOKEN_PARAM: '',
                 STATE_FILE_PARAM: '',
+                STATE_POSITION_PARAM: '',
                 HOSTNAME_PARAM: '',
                 PULL_SERVER_SIDE_CONFIG_PARAM: 'True',
                 INCLUDE_PARAM: '',
                 PROXY_TYPE_PARAM: '',
                 PROXY_URL_PARAM: '',
                 PROXY_PORT_PARAM: '',
+                FOLLOWER_ENGINE_PARAM: '',
+                SEND_BATCH_SIZE_PARAM: '',
+                SEND_BATCH_LATENCY_PARAM: '',
+                SEND_QUEUE_SIZE_PARAM: '',
+                SEND_QUEUE_POLICY_PARAM: '',
+                SPOOL_DIR_PARAM: '',
+                SPOOL_SIZE_PARAM: '',
+                PUT_CONNECTIONS_PARAM: '',
+                PUT_IDLE_TIMEOUT_PARAM: '',
+                TIMESTAMP_RESOLUTION_PARAM: '',
+                SHUTDOWN_TIMEOUT_PARAM: '',
+                SYSLOG_SOCKET_MODE_PARAM: '',
             })
 
             # Read configuration files from default directories
@@ -1851,7 +3925,36 @@ class Config(object):
             self.formatters = self._get_if_def(conf, self.formatters, FORMATTERS_PARAM)
             self.formatter = self._get_if_def(conf, self.formatter, FORMATTER_PARAM)
             self.entry_identifier = self._get_if_def(conf, self.entry_identifier, ENTRY_IDENTIFIER_PARAM)
+            self.drop = self._get_if_def(conf, self.drop, DROP_PARAM)
+            self.keep = self._get_if_def(conf, self.keep, KEEP_PARAM)
+            self.redact = self._get_if_def(conf, self.redact, REDACT_PARAM)
+            for param_name, patterns in ((DROP_PARAM, self.drop), (KEEP_PARAM, self.keep),
+                                         (REDACT_PARAM, self.redact)):
+                if patterns != NOT_SET:
+                    self._check_patterns(param_name, patterns)
             self.hostname = self._get_if_def(conf, self.hostname, HOSTNAME_PARAM)
+            self.follower_engine = self._get_if_def(conf, self.follower_engine, FOLLOWER_ENGINE_PARAM)
+            if self.follower_engine not in (NOT_SET, FOLLOWER_ENGINE_THREADS, FOLLOWER_ENGINE_REACTOR):
+                raise FatalConfigurationError("Invalid %s: %s, `%s' or `%s' expected" % (
+                    FOLLOWER_ENGINE_PARAM, self.follower_engine,
+                    FOLLOWER_ENGINE_THREADS, FOLLOWER_ENGINE_REACTOR))
+            self.send_batch_size = self._get_int(conf, self.send_batch_size, SEND_BATCH_SIZE_PARAM, 1)
+            self.send_batch_latency = self._get_float(conf, self.send_batch_latency, SEND_BATCH_LATENCY_PARAM, 0)
+            self.send_queue_size = self._get_int(conf, self.send_queue_size, SEND_QUEUE_SIZE_PARAM, 1)
+            self.send_queue_policy = self._get_if_def(conf, self.send_queue_policy, SEND_QUEUE_POLICY_PARAM)
+            if self.send_queue_policy not in (NOT_SET, SEND_QUEUE_BACKPRESSURE, SEND_QUEUE_DROP_OLDEST):
+                raise FatalConfigurationError("Invalid %s: %s, `%s' or `%s' expected" % (
+                    SEND_QUEUE_POLICY_PARAM, self.send_queue_policy,
+                    SEND_QUEUE_BACKPRESSURE, SEND_QUEUE_DROP_OLDEST))
+            self.spool_dir = self._get_if_def(conf, self.spool_dir, SPOOL_DIR_PARAM)
+            self.spool_size = self._get_int(conf, self.spool_size, SPOOL_SIZE_PARAM, 1)
+            self.put_connections = self._get_int(conf, self.put_connections, PUT_CONNECTIONS_PARAM, 1)
+            self.put_idle_timeout = self._get_float(conf, self.put_idle_timeout, PUT_IDLE_TIMEOUT_PARAM, 1)
+            self.shutdown_timeout = self._get_float(conf, self.shutdown_timeout, SHUTDOWN_TIMEOUT_PARAM, 0)
+            self.syslog_socket_mode = self._get_int(conf, self.syslog_socket_mode, SYSLOG_SOCKET_MODE_PARAM,
+                                                    0, 07777, 8)
+            self.timestamp_resolution = self._get_float(conf, self.timestamp_resolution,
+                                                        TIMESTAMP_RESOLUTION_PARAM, 0.000001)
             if self.pull_server_side_config == NOT_SET:
                 new_pull_server_side_config = conf.get(MAIN_SECT, PULL_SERVER_SIDE_CONFIG_PARAM)
                 self.pull_server_side_config = new_pull_server_side_config == 'True'
@@ -1897,6 +4000,11 @@ class Config(object):
                 state_file_str = conf.get(MAIN_SECT, STATE_FILE_PARAM)
                 if state_file_str:
                     self.state_file = state_file_str
+            self.state_position = self._get_if_def(conf, self.state_position, STATE_POSITION_PARAM)
+            if self.state_position not in (NOT_SET, STATE_POSITION_READ, STATE_POSITION_SENT):
+                raise FatalConfigurationError("Invalid %s: %s, `%s' or `%s' expected" % (
+                    STATE_POSITION_PARAM, self.state_position,
+                    STATE_POSITION_READ, STATE_POSITION_SENT))
 
             self.metrics.load(conf)
 
@@ -1930,9 +4038,33 @@ class Config(object):
                 except ConfigParser.NoOptionError:
                     pass
 
+                path = ''
                 try:
                     path = conf.get(name, PATH_PARAM)
                 except ConfigParser.NoOptionError:
+                    pass
+
+                listen = ''
+                try:
+                    listen = conf.get(name, LISTEN_PARAM)
+                except ConfigParser.NoOptionError:
+                    pass
+
+                app_name = ''
+                try:
+                    app_name = conf.get(name, APP_NAME_PARAM)
+                except ConfigParser.NoOptionError:
+                    pass
+
+                if listen:
+                    try:
+                        syslogd.parse_address(listen)
+                    except ValueError:
+                        raise FatalConfigurationError(
+                            "Invalid %s: %s, udp:HOST:PORT, tcp:HOST:PORT or unix:PATH expected" % (
+                                LISTEN_PARAM, listen))
+
+                if not path and not listen:
                     log.debug("Not following logs for application `%s' as `%s' parameter is not specified", name, PATH_PARAM)
                     continue
 
@@ -1954,7 +4086,15 @@ class Config(object):
                 except ConfigParser.NoOptionError:
                     pass
 
-                configured_log = ConfiguredLog(name, token, destination, path, formatter, entry_identifier)
+                drop = conf.get(name, DROP_PARAM)
+                keep = conf.get(name, KEEP_PARAM)
+                redact = conf.get(name, REDACT_PARAM)
+                for param_name, patterns in ((DROP_PARAM, drop), (KEEP_PARAM, keep),
+                                             (REDACT_PARAM, redact)):
+                    self._check_patterns(param_name, patterns)
+
+                configured_log = ConfiguredLog(name, token, destination, path, formatter, entry_identifier,
+                                               drop, keep, redact, listen, app_name)
                 self.configured_logs.append(configured_log)
 
     def save(self):
@@ -1977,6 +4117,13 @@ class Config(object):
                 conf.set(MAIN_SECT, FORMATTERS_PARAM, self.formatters)
             if self.formatter != NOT_SET:
                 conf.set(MAIN_SECT, FORMATTER_PARAM, self.formatter)
+            # Patterns are regular expressions, percent signs are not interpolations
+            if self.drop != NOT_SET:
+                conf.set(MAIN_SECT, DROP_PARAM, self.drop.replace('%', '%%'))
+            if self.keep != NOT_SET:
+                conf.set(MAIN_SECT, KEEP_PARAM, self.keep.replace('%', '%%'))
+            if self.redact != NOT_SET:
+                conf.set(MAIN_SECT, REDACT_PARAM, self.redact.replace('%', '%%'))
             if self.hostname != NOT_SET:
                 conf.set(MAIN_SECT, HOSTNAME_PARAM, self.hostname)
             if self.suppress_ssl:
@@ -1993,14 +4140,51 @@ class Config(object):
             if self.system_stats_token != NOT_SET:
                 conf.set(
                     MAIN_SECT, SYSSTAT_TOKEN_PARAM, self.system_stats_token)
+            if self.follower_engine != NOT_SET:
+                conf.set(MAIN_SECT, FOLLOWER_ENGINE_PARAM, self.follower_engine)
+            if self.send_batch_size != NOT_SET:
+                conf.set(MAIN_SECT, SEND_BATCH_SIZE_PARAM, str(self.send_batch_size))
+            if self.send_batch_latency != NOT_SET:
+                conf.set(MAIN_SECT, SEND_BATCH_LATENCY_PARAM, str(self.send_batch_latency))
+            if self.send_queue_size != NOT_SET:
+                conf.set(MAIN_SECT, SEND_QUEUE_SIZE_PARAM, str(self.send_queue_size))
+            if self.send_queue_policy != NOT_SET:
+                conf.set(MAIN_SECT, SEND_QUEUE_POLICY_PARAM, self.send_queue_policy)
+            if self.spool_dir != NOT_SET:
+                conf.set(MAIN_SECT, SPOOL_DIR_PARAM, self.spool_dir)
+            if self.spool_size != NOT_SET:
+                conf.set(MAIN_SECT, SPOOL_SIZE_PARAM, str(self.spool_size))
+            if self.put_connections != NOT_SET:
+                conf.set(MAIN_SECT, PUT_CONNECTIONS_PARAM, str(self.put_connections))
+            if self.put_idle_timeout != NOT_SET:
+                conf.set(MAIN_SECT, PUT_IDLE_TIMEOUT_PARAM, str(self.put_idle_timeout))
+            if self.timestamp_resolution != NOT_SET:
+                conf.set(MAIN_SECT, TIMESTAMP_RESOLUTION_PARAM, str(self.timestamp_resolution))
+            if self.shutdown_timeout != NOT_SET:
+                conf.set(MAIN_SECT, SHUTDOWN_TIMEOUT_PARAM, str(self.shutdown_timeout))
+            if self.syslog_socket_mode != NOT_SET:
+                conf.set(MAIN_SECT, SYSLOG_SOCKET_MODE_PARAM, '%04o' % self.syslog_socket_mode)
+            if self.state_position != NOT_SET:
+                conf.set(MAIN_SECT, STATE_POSITION_PARAM, self.state_position)
 
             for clog in self.configured_logs:
                 conf.add_section(clog.name)
                 if clog.token:
                     conf.set(clog.name, TOKEN_PARAM, clog.token)
-                conf.set(clog.name, PATH_PARAM, clog.path)
+                if clog.path:
+                    conf.set(clog.name, PATH_PARAM, clog.path)
+                if clog.listen:
+                    conf.set(clog.name, LISTEN_PARAM, clog.listen)
+                if clog.app_name:
+                    conf.set(clog.name, APP_NAME_PARAM, clog.app_name)
                 if clog.destination:
                     conf.set(clog.name, DESTINATION_PARAM, clog.destination)
+                if clog.drop:
+                    conf.set(clog.name, DROP_PARAM, clog.drop.replace('%', '%%'))
+                if clog.keep:
+                    conf.set(clog.name, KEEP_PARAM, clog.keep.replace('%', '%%'))
+                if clog.redact:
+                    conf.set(clog.name, REDACT_PARAM, clog.redact.replace('%', '%%'))
 
             self.metrics.save(conf)
 
@@ -2202,7 +4386,7 @@ class Config(object):
                     std std-all name= hostname= type= pid-file= debug no-defaults
                     suppress-ssl use-ca-provided force-api-host= force-domain=
                     system-stat-token= datahub=
-                    pull-server-side-config= config= config.d= multilog debug-multilog"""
+                    pull-server-side-config= config= config.d= multilog debug-multilog json"""
         try:
             optlist, args = getopt.gnu_getopt(params, '', param_list.split())
         except getopt.GetoptError, err:
@@ -2245,6 +4429,8 @@ class Config(object):
                     self.pid_file = value
             elif name == "--std":
                 self.std = True
+            elif name == "--json":
+                self.json_output = True
             elif name == "--type":
                 self.type_opt = value
             elif name == "--std-all":
@@ -2722,7 +4908,17 @@ def check_file_name(file_name):
     return file_name.startswith('/')
 
 
-def get_filters(available_filters, filter_filenames, log_name, log_id, log_filename, log_token):
+def _get_batch_function(available_functions, log_name, log_id, log_token):
+    """Returns user's batch function for the log given by its name, ID or
+    token, in this order. Returns None if not found."""
+    for key in (log_name, log_id, log_token):
+        if key and hasattr(available_functions.get(key), '__call__'):
+            return available_functions[key]
+    return None
+
+
+def get_filters(available_filters, filter_filenames, log_name, log_id, log_filename, log_token,
+                available_batch_filters={}):
     # Check filters
     if not filter_filenames(log_filename):
         debug_filters(
@@ -2730,6 +4926,11 @@ def get_filters(available_filters, filter_filenames, log_name, log_id, log_filen
         log.info(
             'Not following %s, blocked by filter_filenames', log_name)
         return None
+    if available_batch_filters:
+        filter_batch = _get_batch_function(available_batch_filters, log_name, log_id, log_token)
+        if filter_batch:
+            debug_filters(" Using batch filter %s", filter_batch)
+            return BatchFilter(filter_batch)
     debug_filters(
         " Looking for filters by log_name=%s log_id=%s token=%s", log_name, log_id, log_token)
 
@@ -2764,7 +4965,37 @@ def get_filters(available_filters, filter_filenames, log_name, log_id, log_filen
     return entry_filter
 
 
-def get_formatters(default_formatter, available_formatters, log_name, log_id, log_filename, log_token):
+def get_filter_rules(entry_filter, log_name, drop, keep, redact):
+    """Returns entry_filter preceded by filter rules of the log, or of the
+    Main section for kinds of rules not specified for the log. Returns
+    entry_filter if there are no rules, None if the rules cannot be
+    compiled."""
+    if not drop and config.drop != NOT_SET:
+        drop = config.drop
+    if not keep and config.keep != NOT_SET:
+        keep = config.keep
+    if not redact and config.redact != NOT_SET:
+        redact = config.redact
+    if not drop and not keep and not redact:
+        return entry_filter
+    debug_filters(" Using filter rules drop=%r keep=%r redact=%r for %s",
+                  drop, keep, redact, log_name)
+    try:
+        filter_rules = rules.Rules(rules.parse_patterns(drop), rules.parse_patterns(keep),
+                                   rules.parse_patterns(redact))
+    except re.error, e:
+        log.error("Not following %s, invalid filter rules: %s", log_name, e)
+        return None
+    return RuleFilter(filter_rules, entry_filter, log_name)
+
+
+def get_formatters(default_formatter, available_formatters, log_name, log_id, log_filename, log_token,
+                   available_batch_formatters={}):
+    if available_batch_formatters:
+        setup = _get_batch_function(available_batch_formatters, log_name, log_id, log_token)
+        if setup:
+            debug_formatters(" Batch formatter found")
+            return BatchFormatter(setup(config.hostname, log_name, log_token))
     debug_formatters(
         " Looking for formatters by log_name=%s id=%s token=%s", log_name, log_id, log_token)
 
@@ -2801,6 +5032,30 @@ def get_formatters(default_formatter, available_formatters, log_name, log_id, lo
 
     return form
 
+def _block_entry_search(entry_identifier):
+    """Prepares the entry identifier for searching in blocks of lines instead
+    of single lines. Returns tuple of the expression compiled for multiple
+    lines and list of characters of a literal the identifier starts with at
+    the beginning of a line, if any. Returns None for expressions which may
+    match differently in blocks, like lookarounds or anchors of strings."""
+    pattern = entry_identifier.pattern
+    for construct in ('(?=', '(?!', '(?<', '\\A', '\\Z'):
+        if construct in pattern:
+            return None
+    try:
+        regex = re.compile(pattern, entry_identifier.flags | re.MULTILINE)
+        parsed = sre_parse.parse(pattern, entry_identifier.flags)
+    except (re.error, sre_constants.error):
+        return None
+    literal = []
+    if not parsed.pattern.flags & re.IGNORECASE and len(parsed) > 0 and \
+            parsed[0] == (sre_constants.AT, sre_constants.AT_BEGINNING):
+        for op, av in parsed[1:]:
+            if op != sre_constants.LITERAL:
+                break
+            literal.append(av)
+    return regex, literal
+
 def _init_entry_identifier(entry_identifier):
     """Compiles entry separator defined by regular expression. If the
     compilation is not successfull, it return None.
@@ -2810,15 +5065,18 @@ def _init_entry_identifier(entry_identifier):
     except re.error:
         return None
 
-def start_followers(default_transport, states, terminate):
+def start_followers(default_transport, states, terminate, reactor=None):
     """
-    Loads logs from the server (or configuration) and initializes followers.
+    Loads logs from the server (or configuration) and initializes followers
+    and syslog inputs. Followers are run by the reactor if given.
     """
     noticed = False
     logs = []
     followers = []
     transports = []
     follow_multilogs = []
+    inputs = []
+    pooled_transport = None
 
     if config.pull_server_side_config:
         # Use LE server as the source for list of followed logs
@@ -2841,6 +5099,8 @@ def start_followers(default_transport, states, terminate):
             if l.get('follow') == 'true':
                 l['formatter'] = ''
                 l['entry_identifier'] = ''
+                l['drop'] = l['keep'] = l['redact'] = ''
+                l['listen'] = l['app_name'] = ''
                 logs.append(l)
 
     for cl in config.configured_logs:
@@ -2848,9 +5108,12 @@ def start_followers(default_transport, states, terminate):
         # returned by LE Server.
         logs.append(
             {'type': 'token', 'name': cl.name, 'filename': cl.path, 'key': '', 'token': cl.token,
-                     'formatter': cl.formatter, 'entry_identifier': cl.entry_identifier, 'follow': 'true'})
+                     'formatter': cl.formatter, 'entry_identifier': cl.entry_identifier,
+                     'drop': cl.drop, 'keep': cl.keep, 'redact': cl.redact, 'follow': 'true',
+                     'listen': cl.listen, 'app_name': cl.app_name})
 
     available_filters = {}
+    available_batch_filters = {}
     filter_filenames = default_filter_filenames
     if config.filters != NOT_SET:
         sys.path.append(config.filters)
@@ -2858,10 +5121,13 @@ def start_followers(default_transport, states, terminate):
             import filters
 
             available_filters = getattr(filters, 'filters', {})
+            available_batch_filters = getattr(filters, 'batch_filters', {})
             filter_filenames = getattr(
                 filters, 'filter_filenames', default_filter_filenames)
 
             debug_filters("Available filters: %s", available_filters.keys())
+            if available_batch_filters:
+                debug_filters("Available batch filters: %s", available_batch_filters.keys())
             debug_filters("Filter filenames: %s", filter_filenames)
         except:
             log.error('Cannot import event filter module %s: %s',
@@ -2869,13 +5135,17 @@ def start_followers(default_transport, states, terminate):
             log.error('Details: %s', traceback.print_exc(sys.exc_info()))
 
     available_formatters = {}
+    available_batch_formatters = {}
     if config.formatters != NOT_SET:
         sys.path.append(config.formatters)
         try:
             import formatters
 
             available_formatters = getattr(formatters, 'formatters', {})
+            available_batch_formatters = getattr(formatters, 'batch_formatters', {})
             debug_formatters("Available formatters: %s", available_formatters.keys())
+            if available_batch_formatters:
+                debug_formatters("Available batch formatters: %s", available_batch_formatters.keys())
         except:
             log.error('Cannot import event formatter module %s: %s',
                       config.formatters, sys.exc_info()[1])
@@ -2888,6 +5158,7 @@ def start_followers(default_transport, states, terminate):
         if l['follow'] == 'true' or l['type'] == 'token':
             log_name = l['name']
             log_filename = l['filename']
+            log_listen = l['listen']
             log_key = l['key']
             log_token = ''
             if l['type'] == 'token':
@@ -2900,13 +5171,17 @@ def start_followers(default_transport, states, terminate):
                 multilog_filename = True
 
             # Do not start a follower for a log with absent filepath.
-            if not check_file_name(log_filename):
+            if (log_filename or not log_listen) and not check_file_name(log_filename):
                 continue
             #log.info("After check_file_name:log_filename %s",log_filename )
 
             entry_filter = get_filters(available_filters, filter_filenames,
-                                       log_name, log_key, log_filename,
-                                       log_token)
+                                       log_name, log_key, log_filename or log_listen,
+                                       log_token, available_batch_filters)
+            if not entry_filter:
+                continue
+            entry_filter = get_filter_rules(entry_filter, log_name,
+                                            l['drop'], l['keep'], l['redact'])
             if not entry_filter:
                 continue
 
@@ -2917,7 +5192,7 @@ def start_followers(default_transport, states, terminate):
                 entry_formatter = formats.get_formatter(config.formatter, config.hostname, log_name, log_token)
             entry_formatter = get_formatters(entry_formatter, available_formatters,
                                              log_name, log_key, log_filename,
-                                             log_token)
+                                             log_token, available_batch_formatters)
 
             s_entry_identifier = l['entry_identifier']
             if not s_entry_identifier:
@@ -2929,7 +5204,10 @@ def start_followers(default_transport, states, terminate):
             else:
                 entry_identifier = None
 
-            log.info("Following %s", log_filename)
+            if log_filename:
+                log.info("Following %s", log_filename)
+            if log_listen:
+                log.info("Listening on %s for %s", log_listen, log_name)
 
             if log_token or config.datahub:
                 transport = default_transport.get()
@@ -2950,9 +5228,21 @@ def start_followers(default_transport, states, terminate):
 
                 # Special case for HTTP PUT
                 # Use plain formatter if no formatter is defined
-                transport = Transport(endpoint, port, use_ssl, preamble, config.debug_transport_events,
-                                      (config.proxy_type, config.proxy_url, config.proxy_port))
-                transports.append(transport)
+                if config.put_connections != NOT_SET:
+                    # Logs share a pool of connections
+                    if not pooled_transport:
+                        idle_timeout = PUT_IDLE_TIMEOUT
+                        if config.put_idle_timeout != NOT_SET:
+                            idle_timeout = config.put_idle_timeout
+                        pooled_transport = PooledTransport(endpoint, port, use_ssl, config.debug_transport_events,
+                                                           (config.proxy_type, config.proxy_url, config.proxy_port),
+                                                           config.put_connections, idle_timeout)
+                        transports.append(pooled_transport)
+                    transport = pooled_transport.get(preamble)
+                else:
+                    transport = Transport(endpoint, port, use_ssl, preamble, config.debug_transport_events,
+                                          (config.proxy_type, config.proxy_url, config.proxy_port))
+                    transports.append(transport)
                 # Default formatter is plain
                 if not entry_formatter:
                     entry_formatter = formats.get_formatter('plain', config.hostname, log_name, log_token)
@@ -2963,14 +5253,21 @@ def start_followers(default_transport, states, terminate):
             if not entry_formatter:
                 entry_formatter = formats.get_formatter('syslog', config.hostname, log_name, log_token)
 
+            if log_listen:
+                inputs.append(SyslogInput(log_name, log_listen, l['app_name'],
+                                          entry_filter, entry_formatter, transport))
             # Instantiate the follow_multilog for 'multilog' filename, otherwise the individual follower
+            if not log_filename:
+                continue
             if multilog_filename:
-                follow_multilog = FollowMultilog(log_filename, entry_filter, entry_formatter, entry_identifier, transport, states)
+                follow_multilog = FollowMultilog(log_filename, entry_filter, entry_formatter, entry_identifier, transport, states,
+                                                 reactor=reactor)
                 follow_multilogs.append(follow_multilog)
             else:
-                follower = Follower(log_filename, entry_filter, entry_formatter, entry_identifier, transport, states.get(log_filename))
+                follower = Follower(log_filename, entry_filter, entry_formatter, entry_identifier, transport, states.get(log_filename),
+                                    reactor=reactor)
                 followers.append(follower)
-    return (followers, transports, follow_multilogs)
+    return (followers, transports, follow_multilogs, inputs)
 
 
 def is_followed(filename):
@@ -3041,6 +5338,83 @@ def create_configured_logs(configured_logs):
             clog.token = token
 
 
+def stats_snapshot(followers, follow_multilogs, transports, default_transport, inputs=()):
+    """Returns runtime statistics of followers, syslog inputs, transports and
+    hits of redact patterns as a dictionary. Counters are read without
+    locking, hence they may be slightly inconsistent with each other."""
+    follower_stats = [follower.stats() for follower in followers]
+    for follow_multilog in follow_multilogs:
+        follower_stats.extend(follow_multilog.stats())
+    transport_stats = []
+    if default_transport.current():
+        transport_stats.append(default_transport.current().stats())
+    transport_stats.extend([transport.stats() for transport in transports])
+    snapshot = {
+        'time': time.time(),
+        'followers': follower_stats,
+        'transports': transport_stats,
+    }
+    if inputs:
+        snapshot['inputs'] = [syslog_input.stats() for syslog_input in inputs]
+    redactions = []
+    for follower in followers + follow_multilogs + list(inputs):
+        if isinstance(follower.entry_filter, RuleFilter):
+            redactions.extend(follower.entry_filter.redactions())
+    if redactions:
+        snapshot['redactions'] = redactions
+    return snapshot
+
+
+def process_stats(start_time):
+    """Returns statistics of the agent process as a dictionary. RSS and
+    the number of open file descriptors are None if they cannot be
+    determined."""
+    cpu_user, cpu_system = os.times()[:2]
+    rss = None
+    try:
+        statm = open('/proc/self/statm')
+        try:
+            rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        finally:
+            statm.close()
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    fds = None
+    try:
+        fds = len(os.listdir('/proc/self/fd'))
+    except OSError:
+        pass
+    return {
+        'pid': os.getpid(),
+        'uptime': time.time() - start_time,
+        'threads': threading.activeCount(),
+        'cpu_user': cpu_user,
+        'cpu_system': cpu_system,
+        'rss': rss,
+        'fds': fds,
+    }
+
+
+def control_socket_name():
+    """Returns name of the control socket, None if there is no pid file."""
+    if not config.pid_file:
+        return None
+    return os.path.splitext(config.pid_file)[0] + CONTROL_SOCKET_SUFFIX
+
+
+def create_control_server(handlers):
+    """Starts serving commands given by handlers on the control socket.
+    Returns the server, None if the socket cannot be created."""
+    name = control_socket_name()
+    if not name:
+        return None
+    try:
+        return control.ControlServer(name, handlers)
+    except control.ControlError, e:
+        log.warn('%s', e.msg)
+        return None
+
+
 def load_state(state_file):
     if state_file:
         try:
@@ -3063,24 +5437,47 @@ def load_state(state_file):
     return {} # Fallback
 
 
-def save_state(state_file, followers):
-    if state_file:
-        # Collect statees from all followers
+class StateStore(object):
+
+    """
+    Saves positions of followers, including followers of multilogs, in the
+    state file. The file is rewritten only if some position has changed
+    since the last save.
+    """
+
+    def __init__(self, state_file):
+        self._state_file = state_file
+        self._saved = None
+
+    def load(self):
+        """Returns states saved in the state file."""
+        self._saved = load_state(self._state_file)
+        return self._saved
+
+    def save(self, followers, follow_multilogs):
+        if not self._state_file:
+            return
         states = {}
         for follower in followers:
-            states[ follower.get_name()] = follower.get_state()
+            states[follower.get_name()] = follower.get_state()
+        for follow_multilog in follow_multilogs:
+            for follower in follow_multilog.followers():
+                states[follower.get_name()] = follower.get_state()
+        if states == self._saved:
+            return
         try:
-            # Save statees in state file
-            tmp_name = config.state_file + '.tmp'
+            # Replace the state file at once
+            tmp_name = self._state_file + '.tmp'
             sfile = open(tmp_name, 'w')
-            content = json_dumps(states, sort_keys=True, indent=2) + '\n'
-            sfile.write(content)
-            sfile.close()
-            # Update the state file
-            os.rename(tmp_name, config.state_file)
-        except IOError:
-            # Not too much we can do here
-            pass
+            try:
+                sfile.write(json_dumps(states, sort_keys=True) + '\n')
+            finally:
+                sfile.close()
+            os.rename(tmp_name, self._state_file)
+        except (IOError, OSError):
+            # Not too much we can do here, try again next time
+            return
+        self._saved = states
 
 
 class TerminationNotifier(object):
@@ -3102,6 +5499,7 @@ def cmd_monitor(args):
     config.load()
     stats = None
     smetrics = None
+    start_time = time.time()
 
     # We need account and host ID to get server side configuration
     if config.pull_server_side_config:
@@ -3115,50 +5513,100 @@ def cmd_monitor(args):
     if config.daemon:
         daemonize()
 
+    if config.timestamp_resolution != NOT_SET:
+        formats.clock.set_resolution(config.timestamp_resolution)
+
     # Start default transport channel
     default_transport = DefaultTransport(config)
 
+    followers = []
+    transports = []
+    follow_multilogs = []
+    inputs = []
+
+    def agent_stats():
+        snapshot = stats_snapshot(followers, follow_multilogs, transports, default_transport, inputs)
+        snapshot['agent'] = process_stats(start_time)
+        if smetrics:
+            snapshot['metrics'] = smetrics.stats()
+        return snapshot
+
     formatter = formats.FormatSyslog(config.hostname, 'le',
                                      config.metrics.token)
     smetrics = metrics.Metrics(config.metrics, default_transport,
-                                formatter, config.debug_metrics)
+                                formatter, config.debug_metrics, agent_stats)
     smetrics.start()
 
-    followers = []
-    transports = []
-    follow_multilogs = []
+    # Start reactor for followers if requested
+    reactor = None
+    if config.follower_engine == FOLLOWER_ENGINE_REACTOR:
+        reactor = FollowerReactor()
+
+    control_server = None
+    syslog_server = None
     terminate = TerminationNotifier()
+
+    def stats_handler(args):
+        if args:
+            raise control.ControlError('Unexpected arguments: %s' % ' '.join(args))
+        return json_dumps(agent_stats(), sort_keys=True) + '\n'
+
+    state_store = StateStore(config.state_file)
     try:
-        state = load_state(config.state_file)
+        state = state_store.load()
 
         # Load logs to follow and start following them
         if not config.debug_stats_only:
-            (followers, transports, follow_multilogs) = start_followers(default_transport, state, terminate)
+            (followers, transports, follow_multilogs, inputs) = start_followers(default_transport, state, terminate, reactor)
+            syslog_server = start_syslog_server(inputs)
+
+        # Answer `le stats' queries
+        control_server = create_control_server({'stats': stats_handler})
 
         # Periodically save state
         while not terminate.terminate:
-            save_state(config.state_file, followers)
+            state_store.save(followers, follow_multilogs)
 
-            time.sleep(1)
+            time.sleep(STATE_SAVE_INTERVAL)
     except KeyboardInterrupt:
         pass
 
     print >> sys.stderr, "\nShutting down"
+    # All threads are signalled at once and waited for until a single deadline
+    shutdown_timeout = SHUTDOWN_TIMEOUT
+    if config.shutdown_timeout != NOT_SET:
+        shutdown_timeout = config.shutdown_timeout
+    deadline = time.time() + shutdown_timeout
+    if control_server:
+        control_server.close()
+    # Stop followers, including followers of each follow_multilog, and
+    # receiving of syslog messages
+    for follower in followers + follow_multilogs:
+        follower.stop()
+    if reactor:
+        reactor.stop()
+    if syslog_server:
+        syslog_server.stop()
     # Stop metrics
     if smetrics:
-        smetrics.cancel()
-    # Close followers
-    for follower in followers:
-        follower.close()
-    # Close each follow_multilog and the followers it holds
-    for follow_multilog in follow_multilogs:
-        follow_multilog.close()
-    # Close transports
-    for transport in transports:
-        transport.close()
-    default_transport.close()
+        smetrics.cancel(_remaining(deadline))
+    for follower in followers + follow_multilogs:
+        follower.join(_remaining(deadline))
+    if reactor:
+        reactor.join(_remaining(deadline))
+    _close_watch_manager(_remaining(deadline))
+    if syslog_server:
+        syslog_server.join(_remaining(deadline))
+    for follower in followers + follow_multilogs + inputs:
+        if isinstance(follower.entry_filter, RuleFilter):
+            follower.entry_filter.log_redactions()
+    # Send queued entries, the rest is saved and sent on the next start
+    for transport in transports + [default_transport]:
+        transport.stop(deadline)
+    for transport in transports + [default_transport]:
+        transport.join(_remaining(deadline))
     # Collect statuses
-    save_state(config.state_file, followers)
+    state_store.save(followers, follow_multilogs)
 
 
 def cmd_monitor_daemon(args):
@@ -3319,6 +5767,88 @@ def cmd_whoami(args):
     list_object(request('hosts/%s/' % config.agent_key, True, True))
 
 
+def _format_rate(count, seconds):
+    if seconds <= 0:
+        return '-'
+    return '%.1f' % (count / seconds)
+
+
+def format_stats(stats):
+    """Returns statistics of the agent as lines of text."""
+    agent = stats['agent']
+    uptime = agent['uptime']
+    rss = '-'
+    if agent['rss'] is not None:
+        rss = '%.1fMiB' % (agent['rss'] / 1048576.0)
+    fds = agent['fds']
+    if fds is None:
+        fds = '-'
+    lines = ['Agent pid %s: uptime %.0fs, threads %s, cpu user %.2fs system %.2fs, rss %s, fds %s' % (
+        agent['pid'], uptime, agent['threads'], agent['cpu_user'], agent['cpu_system'], rss, fds)]
+    lines.append('Followers:')
+    for follower in stats['followers']:
+        lag = follower['lag']
+        if lag is None:
+            lag = '-'
+        lines.append('  %s: lines %s (%s/s), bytes %s (%s/s), filtered %s, lag %s' % (
+            follower['name'], follower['lines_read'], _format_rate(follower['lines_read'], uptime),
+            follower['bytes_read'], _format_rate(follower['bytes_read'], uptime),
+            follower['filtered'], lag))
+    lines.append('Transports:')
+    for transport in stats['transports']:
+        line = '  %s: queued %s, sent %s (%s/s), dropped %s, queue %s (%s bytes), reconnects %s, connect failures %s' % (
+            transport['endpoint'], transport['queued'], transport['sent'],
+            _format_rate(transport['sent'], uptime), transport['dropped'],
+            transport['queue_depth'], transport['queue_size'], transport['reconnects'],
+            transport['connect_failures'])
+        if 'spooled' in transport:
+            line += ', spooled %s, spool evicted %s bytes' % (transport['spooled'], transport['spool_evicted'])
+        if 'connections' in transport:
+            line += ', connections %s' % transport['connections']
+        lines.append(line)
+    if 'inputs' in stats:
+        lines.append('Inputs:')
+        for syslog_input in stats['inputs']:
+            lines.append('  %s: listen %s, received %s (%s/s), filtered %s, dropped %s' % (
+                syslog_input['name'], syslog_input['listen'], syslog_input['received'],
+                _format_rate(syslog_input['received'], uptime), syslog_input['filtered'],
+                syslog_input['dropped']))
+    if 'redactions' in stats:
+        lines.append('Redactions:')
+        for redaction in stats['redactions']:
+            lines.append("  %s: %s hits of `%s'" % (
+                redaction['log'], redaction['hits'], redaction['pattern']))
+    if stats.get('metrics'):
+        lines.append('Metrics:')
+        for collector in stats['metrics']:
+            lines.append('  %s: interval %ss, collections %s, overruns %s, timeouts %s, skipped %s' % (
+                collector['name'], collector['interval'], collector['collections'],
+                collector['overruns'], collector['timeouts'], collector['skipped']))
+    return lines
+
+
+def cmd_stats(args):
+    """
+    Displays statistics of the running agent, received via its control
+    socket.
+    """
+    no_more_args(args)
+    name = control_socket_name()
+    if not name:
+        die('Error: Control socket is next to the pid file, specify --pid-file')
+    try:
+        response = control.request(name, 'stats')
+    except control.ControlError, e:
+        die('Error: %s. Is the agent running?' % e.msg)
+    if response.startswith(control.ERROR_PREFIX):
+        die(response.rstrip())
+    if config.json_output:
+        sys.stdout.write(response)
+        return
+    for line in format_stats(json_loads(response)):
+        print line
+
+
 def logtype_name(logtype_uuid):
     """ Provides name for the logtype given.
     """
@@ -3785,6 +6315,7 @@ def main_root():
         'rm': cmd_rm,
         'remove': cmd_rm,
         'pull': cmd_pull,
+        'stats': cmd_stats,
     }
     for cmd, func in commands.items():
         if cmd == args[0]:
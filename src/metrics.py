@@ -3,6 +3,7 @@
 # vim: set ts=4 sw=4 et:
 
 import ConfigParser
+import Queue
 import re
 import sys
 import threading
@@ -10,6 +11,7 @@ import time
 import traceback
 
 import formats
+import procstats
 from utils import report
 from __init__ import __version__
 
@@ -20,6 +22,15 @@ try:
 except ImportError:
     psutil_available = False
 
+# System statistics are read natively on Linux, psutil is used elsewhere.
+# Process metrics always need psutil.
+if procstats.available:
+    sysstats = procstats
+elif psutil_available:
+    sysstats = psutil
+else:
+    sysstats = None
+
 
 # Main section name (TODO - move it)
 SECT = 'Main'
@@ -37,26 +48,29 @@ NET = 'net'
 DISK = 'disk'
 SPACE = 'space'
 PROCESS = 'process'
+AGENT = 'agent'
 
 
-def _psutil_cpu_count():
-    """Replaces cpu_count which is missing in older version."""
+def _cpu_count():
+    """Replaces cpu_count which is missing in older version of psutil."""
     try:
-        return psutil.NUM_CPUS
+        return sysstats.NUM_CPUS
     except AttributeError:
-        return psutil.cpu_count()
+        return sysstats.cpu_count()
 
 class CpuMetrics(object):
 
     """Collecting aggregated CPU metrics."""
 
+    name = 'cpu'
+
     def __init__(self, per_core, interval, transport, formatter):
         self._per_core = per_core
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
         self._last = None
-        self._vcpus = _psutil_cpu_count()
+        self._vcpus = _cpu_count()
 
     @staticmethod
     def construct(curr, last, vcpus, per_core, index=-1):
@@ -102,7 +116,7 @@ class CpuMetrics(object):
                 softirq, steal, guest, guest_nice, vcpus)
 
     def collect(self):
-        curr = psutil.cpu_times()
+        curr = sysstats.cpu_times()
         if self._last:
             line = CpuMetrics.construct(
                 curr, self._last, self._vcpus, self._per_core)
@@ -114,16 +128,18 @@ class VcpuMetrics(object):
 
     """Collecting per-CPU metrics."""
 
+    name = 'vcpu'
+
     def __init__(self, interval, transport, formatter):
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
-        self._vcpus = _psutil_cpu_count()
+        self._vcpus = _cpu_count()
         self._last = None
 
     def collect(self):
         try:
-            curr = psutil.cpu_times(percpu=True)
+            curr = sysstats.cpu_times(percpu=True)
         except TypeError:
             return
         last = self._last
@@ -140,14 +156,16 @@ class MemMetrics(object):
 
     """Collecting memory metrics."""
 
+    name = 'mem'
+
     def __init__(self, interval, transport, formatter):
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
 
     def collect(self):
         try:
-            x = psutil.virtual_memory()
+            x = sysstats.virtual_memory()
         except AttributeError:
             return
         total = float(x.total)
@@ -163,8 +181,10 @@ class SwapMetrics(object):
 
     """Collection swap metrics."""
 
+    name = 'swap'
+
     def __init__(self, interval, transport, formatter):
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
         self._last = None
@@ -184,7 +204,7 @@ class SwapMetrics(object):
 
     def collect(self):
         try:
-            curr = psutil.swap_memory()
+            curr = sysstats.swap_memory()
         except AttributeError:
             return
         if self._last:
@@ -197,9 +217,11 @@ class DiskIoMetrics(object):
 
     """Collecting disk metrics."""
 
+    name = 'disk'
+
     def __init__(self, devices, interval, transport, formatter):
         self._parse_devices(devices)
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
         self._last = None
@@ -226,7 +248,7 @@ class DiskIoMetrics(object):
         # Collect metrics for all devices
         if self._sum:
             try:
-                curr = psutil.disk_io_counters(perdisk=False)
+                curr = sysstats.disk_io_counters(perdisk=False)
             except:
                 # Not enough permissions
                 curr = self._last_sum = None
@@ -237,7 +259,7 @@ class DiskIoMetrics(object):
         # Collect metrics for each individual device
         if self._all or self._devices:
             try:
-                curr_all = psutil.disk_io_counters(perdisk=True)
+                curr_all = sysstats.disk_io_counters(perdisk=True)
             except:
                 # Typically not enough permissions
                 curr_all = self._last = None
@@ -257,9 +279,11 @@ class DiskSpaceMetrics(object):
 
     """Collecting disk usage metrics."""
 
+    name = 'space'
+
     def __init__(self, paths, interval, transport, formatter):
         self._parse_paths(paths)
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
 
@@ -269,7 +293,7 @@ class DiskSpaceMetrics(object):
     def collect(self):
         for path in self._paths:
             try:
-                curr = psutil.disk_usage(path)
+                curr = sysstats.disk_usage(path)
                 if curr.total != 0:
                     used = curr.used / float(curr.total) * 100
                     free = curr.free / float(curr.total) * 100
@@ -289,9 +313,11 @@ class NetMetrics(object):
 
     """Collecting network metrics."""
 
+    name = 'net'
+
     def __init__(self, nets, interval, transport, formatter):
         self._parse_nets(nets)
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
         self._last = None
@@ -328,14 +354,14 @@ class NetMetrics(object):
     def collect(self):
         # Summary of all interfaces
         if self._sum:
-            counters = psutil.net_io_counters(pernic=False)
+            counters = sysstats.net_io_counters(pernic=False)
             if self._last_sum:
                 self._construct('sum', counters, self._last_sum)
             self._last_sum = counters
 
         # Per-interface metrics
         if self._all or self._select or self._nets:
-            counters = psutil.net_io_counters(pernic=True)
+            counters = sysstats.net_io_counters(pernic=True)
             if self._last:
                 for net in counters:
                     if self._all or net in self._nets or (self._select and self._selected(net)):
@@ -352,10 +378,10 @@ class ProcMetrics(object):
     """Collecting process metrics."""
 
     def __init__(self, name, pattern, token, interval, transport, formatter):
-        self._name = name
+        self.name = name
         self._pattern = pattern
         self._token = token
-        self._interval = interval
+        self.interval = interval
         self._transport = transport
         self._formatter = formatter
         self._proc = None
@@ -366,11 +392,22 @@ class ProcMetrics(object):
         except AttributeError:
             self._total = 0
 
-    def _find_proc(self):
-        for proc in psutil.process_iter():
-            cmdline = ' '.join(proc.cmdline())
-            if cmdline and cmdline.find(self._pattern) != -1:
-                return proc
+    @property
+    def pattern(self):
+        return self._pattern
+
+    def lost(self):
+        """Returns True if the process is not known or it is not running."""
+        if self._proc and not self._proc.is_running():
+            self._proc = None
+        return not self._proc
+
+    def attach(self, pid):
+        """Follows the process with the pid given."""
+        try:
+            self._proc = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            pass
 
     def _get_io_counters(self):
         try:
@@ -389,8 +426,6 @@ class ProcMetrics(object):
             return
         if self._proc and not self._proc.is_running():
             self._proc = None
-        if not self._proc:
-            self._proc = self._find_proc()
         if not self._proc:
             return
 
@@ -417,49 +452,264 @@ class ProcMetrics(object):
                 fds_line = ''
 
             lcpu = self._last_cpu
-            cpu_user = float(cpu.user - lcpu.user) / self._interval * 100
-            cpu_system = float(cpu.system - lcpu.system) / self._interval * 100
+            cpu_user = float(cpu.user - lcpu.user) / self.interval * 100
+            cpu_system = float(cpu.system - lcpu.system) / self.interval * 100
             line = 'cpu_user=%.1f cpu_system=%.1f%s%s mem=%.1f total=%d rss=%d vms=%d\n' % (
                     cpu_user, cpu_system,
                     io_line, fds_line,
                     proc.memory_percent(), self._total, mem.rss, mem.vms)
             self._transport.send(
-                self._formatter.format_line(line, msgid=self._name, token=self._token))
+                self._formatter.format_line(line, msgid=self.name, token=self._token))
         self._last_cpu = cpu
         self._last_io = io
 
 
-class Metrics(object):
+class ProcessTable(object):
+
+    """
+    Command lines of running processes shared by all process metrics, so
+    that processes are scanned once per interval regardless of the number
+    of patterns. Command lines are cached by pid and change time of the
+    process directory, only processes started since the last scan are
+    read. Kernel threads have no command line and never match.
+    """
+
+    def __init__(self):
+        self._cmdlines = {}
+
+    def _native_scan(self):
+        cmdlines = {}
+        for pid in procstats.pids():
+            try:
+                ctime = procstats.process_ctime(pid)
+                cached = self._cmdlines.get(pid)
+                if cached and cached[0] == ctime:
+                    cmdlines[pid] = cached
+                else:
+                    cmdlines[pid] = (ctime, procstats.process_cmdline(pid))
+            except (IOError, OSError):
+                # The process has exited
+                continue
+        self._cmdlines = cmdlines
+        return [(pid, cmdlines[pid][1]) for pid in sorted(cmdlines)]
+
+    @staticmethod
+    def _psutil_scan():
+        cmdlines = []
+        for proc in psutil.process_iter():
+            try:
+                cmdlines.append((proc.pid, ' '.join(proc.cmdline())))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return cmdlines
+
+    def find(self, patterns):
+        """Returns dictionary of pids of the first process whose command
+        line contains the pattern, for each pattern found."""
+        if procstats.available:
+            cmdlines = self._native_scan()
+        else:
+            cmdlines = self._psutil_scan()
+        # Any of the patterns
+        search = re.compile('|'.join([re.escape(x) for x in patterns])).search
+        remaining = set(patterns)
+        found = {}
+        for pid, cmdline in cmdlines:
+            if not cmdline or not search(cmdline):
+                continue
+            for pattern in list(remaining):
+                if cmdline.find(pattern) != -1:
+                    found[pattern] = pid
+                    remaining.remove(pattern)
+            if not remaining:
+                break
+        return found
+
+
+class ProcessFinder(object):
+
+    """Finds processes of process metrics which do not follow a running
+    process. Scheduled ahead of process metrics as a collector of its own,
+    so that a scan of the process table is bounded by the interval as any
+    other collection."""
+
+    name = 'processes'
+
+    def __init__(self, collectors):
+        self._collectors = collectors
+        self.interval = min([x.interval for x in collectors])
+        self._processes = ProcessTable()
+
+    def collect(self):
+        lost = [x for x in self._collectors if x.lost()]
+        if not lost:
+            return
+        found = self._processes.find([x.pattern for x in lost])
+        for x in lost:
+            if x.pattern in found:
+                x.attach(found[x.pattern])
+
+
+class AgentMetrics(object):
+
+    """Collecting metrics of the agent itself. Statistics are provided by
+    the function given, see stats_snapshot and process_stats of the agent."""
+
+    name = 'agent'
+
+    def __init__(self, agent_stats, interval, transport, formatter):
+        self._agent_stats = agent_stats
+        self.interval = interval
+        self._transport = transport
+        self._formatter = formatter
+        self._last = None
+
+    @staticmethod
+    def _totals(stats):
+        """Returns lines and bytes read by all followers and entries
+        dropped by all transports."""
+        lines = 0
+        bytes = 0
+        for follower in stats['followers']:
+            lines += follower['lines_read']
+            bytes += follower['bytes_read']
+        dropped = 0
+        for transport in stats['transports']:
+            dropped += transport['dropped']
+        return lines, bytes, dropped
+
+    def collect(self):
+        curr = self._agent_stats()
+        last = self._last
+        self._last = curr
+        if not last:
+            return
+        elapsed = curr['time'] - last['time']
+        if elapsed <= 0:
+            return
+        agent = curr['agent']
+        lagent = last['agent']
+        lines, bytes, dropped = self._totals(curr)
+        llines, lbytes, ldropped = self._totals(last)
+        queue_depth = 0
+        for transport in curr['transports']:
+            queue_depth += transport['queue_depth']
+
+        if agent['rss'] is not None:
+            rss_line = ' rss=%d' % agent['rss']
+        else:
+            rss_line = ''
+        if agent['fds'] is not None:
+            fds_line = ' fds=%d' % agent['fds']
+        else:
+            fds_line = ''
+
+        line = 'cpu_user=%.1f cpu_system=%.1f%s threads=%d%s lines_sec=%.1f bytes_sec=%.1f queue_depth=%d dropped=%d\n' % (
+                (agent['cpu_user'] - lagent['cpu_user']) / elapsed * 100,
+                (agent['cpu_system'] - lagent['cpu_system']) / elapsed * 100,
+                rss_line, agent['threads'], fds_line,
+                (lines - llines) / elapsed, (bytes - lbytes) / elapsed,
+                queue_depth, dropped - ldropped)
+        self._transport.send(self._formatter.format_line(line, msgid='agent'))
+
+
+def _next_tick(now, interval):
+    """Returns the first time after now aligned to the interval."""
+    return (int(now) // interval + 1) * interval
+
+
+class _Task(object):
+
+    """Scheduled collection of a single collector with its accounting."""
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.interval = collector.interval
+        # Time of the next collection
+        self.due = 0
+        # Queued or being collected
+        self.running = False
+        # Start of the current collection, None if not started
+        self.started = None
+        # Left to a stuck worker
+        self.abandoned = False
+        # Number of collections completed
+        self.collections = 0
+        # Collections which took longer than the interval
+        self.overruns = 0
+        # Collections not finished in the interval
+        self.timeouts = 0
+        # Collections skipped because the previous one was still running
+        self.skipped = 0
+
+    def stats(self):
+        return {
+            'name': self.collector.name,
+            'interval': self.interval,
+            'collections': self.collections,
+            'overruns': self.overruns,
+            'timeouts': self.timeouts,
+            'skipped': self.skipped,
+        }
+
 
-    """Metrics collecting class."""
+class Metrics(object):
 
-    def __init__(self, conf, default_transport, formatter, debug):
-        """Creates an instance of metrics from the configuration."""
+    """
+    Metrics collecting class. A single scheduler thread collects metrics on
+    time boundaries aligned to the interval of each collector. Collectors
+    run on a worker thread, a collector which does not finish in its
+    interval is left to its worker and skipped until it finishes, while
+    a new worker collects the other metrics. At most one worker is left
+    behind, a collector timing out while it still runs keeps its worker
+    until the worker left behind finishes.
+    """
+
+    def __init__(self, conf, default_transport, formatter, debug, agent_stats=None):
+        """Creates an instance of metrics from the configuration. Agent
+        metrics use the agent_stats function given."""
         self._ready = False
         self._token = conf.token
 
         if debug and not default_transport:
             self._transport = StderrTransport(None)
         elif debug:
-            self._transport = StderrTransport(default_transport.get())
+            self._transport = StderrTransport(NonBlockingTransport(default_transport.get()))
         else:
-            self._transport = default_transport.get()
+            self._transport = NonBlockingTransport(default_transport.get())
         self._formatter = formatter
         self._debug = debug
 
-        self._timer = None
+        self._scheduler = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
         self._shutdown = False
+        # Current worker and the worker left with a timed out collector
+        self._worker = None
+        self._abandoned = None
+        # Timed out task waiting for the worker left behind to finish
+        self._overdue = None
         self._interval = self._parse_interval(conf.interval)
         if self._interval == 0:
             report("Warning: Cannot instantiate metrics, invalid interval `%s'." % conf.interval)
+            return
 
+        # Agent metrics do not need psutil
+        self._items = self._instantiate_agent(conf, agent_stats, debug)
+        if sysstats:
+            self._items += self._instantiate_system(conf, debug)
+        elif debug:
+            report("Warning: Cannot instantiate system metrics, psutil library is not available.")
         if psutil_available:
-            self._items = self._instantiate_system(conf, debug) + self._instantiate_processes(conf, debug)
-        else:
-            if debug:
-                report("Warning: Cannot instantiate system metrics, psutil library is not available.")
-            self._items = []
+            processes = self._instantiate_processes(conf, debug)
+            if processes:
+                # Processes are looked up before they are collected
+                self._items += [ProcessFinder(processes)] + processes
+        elif debug and conf.processes:
+            report("Warning: Cannot instantiate process metrics, psutil library is not available.")
+        if not self._items:
             return
+        self._tasks = [_Task(x) for x in self._items]
 
         self._ready = True
 
@@ -514,42 +764,166 @@ class Metrics(object):
 
         return items
 
+    def _instantiate_agent(self, conf, agent_stats, debug):
+        if not conf.agent or not agent_stats:
+            return []
+        if conf.agent != 'True':
+            report("Unrecognized agent option `%s', `True' expected" % conf.agent)
+            return []
+        if not conf.token:
+            if debug:
+                report("Warning: Cannot instantiate agent metrics, token not specified.")
+            return []
+        return [AgentMetrics(agent_stats, self._interval, self._transport, self._formatter)]
+
     def _instantiate_processes(self, conf, debug):
         items = []
         for process in conf.processes:
             name = process[0]
             token = process[2]
+            interval = self._interval
+            if process[3]:
+                interval = self._parse_interval(process[3])
             if not token:
                 if debug:
                     report("Warning: Cannot instantiate metrics for `%s', token not specified." % name)
+            elif interval == 0:
+                report("Warning: Cannot instantiate metrics for `%s', invalid interval `%s'." % (name, process[3]))
             else:
-                items.append(ProcMetrics(name, process[1], token, self._interval, self._transport, self._formatter))
+                items.append(ProcMetrics(name, process[1], token, interval, self._transport, self._formatter))
 
         return items
 
-    def _schedule(self, ethalon):
-        # TODO - align metrics on time boundary
-        ethalon += self._interval
-        next_step = (ethalon - time.time()) % self._interval
-        if not self._shutdown:
-            self._timer = threading.Timer(next_step, self._collect_metrics, ())
-            self._timer.daemon = True
-            self._timer.start()
-
-    def _collect_metrics(self):
-        ethalon = time.time()
-
-        for x in self._items:
+    def _report_exception(self, e):
+        # Make sure we don't propagate any unexpected exceptions
+        # Typically `permission denied' on hard-ended systems
+        if self._debug:
+            report("Warning: `%s'" % e)
+            report(''.join(traceback.format_tb(sys.exc_info()[2])))
+
+    def _start_worker(self):
+        """Starts a worker collecting tasks from the queue returned."""
+        tasks = Queue.Queue()
+        worker = threading.Thread(target=self._work, args=(tasks,), name='metrics')
+        worker.daemon = True
+        worker.start()
+        self._worker = worker
+        return tasks
+
+    def _work(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            self._lock.acquire()
+            try:
+                task.started = time.time()
+            finally:
+                self._lock.release()
             try:
-                x.collect()
+                task.collector.collect()
             except Exception, e:
-                # Make sure we don't propagate any unexpected exceptions
-                # Typically `permission denied' on hard-ended systems
+                self._report_exception(e)
+            self._lock.acquire()
+            try:
+                task.collections += 1
+                if time.time() - task.started > task.interval:
+                    task.overruns += 1
+                task.running = False
+                task.started = None
+                task.abandoned = False
+            finally:
+                self._lock.release()
+
+    def _stuck(self, now):
+        """Returns task collected longer than its interval by the current
+        worker, None if there is no such task."""
+        self._lock.acquire()
+        try:
+            for task in self._tasks:
+                if task.started is not None and not task.abandoned and \
+                        task.started + task.interval <= now:
+                    task.timeouts += 1
+                    task.abandoned = True
+                    return task
+        finally:
+            self._lock.release()
+        return None
+
+    def _replace_worker(self, tasks):
+        """Leaves the current worker to finish its task and moves tasks
+        waiting for it to a new worker."""
+        self._abandoned = self._worker
+        new_tasks = self._start_worker()
+        while True:
+            try:
+                new_tasks.put(tasks.get_nowait())
+            except Queue.Empty:
+                break
+        tasks.put(None)
+        return new_tasks
+
+    def _next_wakeup(self):
+        """Returns time of the next collection or timeout."""
+        wakeup = min([x.due for x in self._tasks])
+        self._lock.acquire()
+        try:
+            for task in self._tasks:
+                if task.started is not None and not task.abandoned:
+                    wakeup = min(wakeup, task.started + task.interval)
+        finally:
+            self._lock.release()
+        return wakeup
+
+    def _run(self):
+        tasks = self._start_worker()
+        now = time.time()
+        for task in self._tasks:
+            task.due = _next_tick(now, task.interval)
+
+        while not self._shutdown:
+            now = time.time()
+            stuck = self._stuck(now)
+            if stuck:
                 if self._debug:
-                    report("Warning: `%s'" % e)
-                    report(''.join(traceback.format_tb(sys.exc_info()[2])))
-
-        self._schedule(ethalon)
+                    report("Warning: `%s' metrics timed out" % stuck.collector.name)
+                self._overdue = stuck
+            if self._overdue:
+                if not self._overdue.abandoned:
+                    # Finished meanwhile
+                    self._overdue = None
+                elif self._abandoned is None or not self._abandoned.isAlive():
+                    tasks = self._replace_worker(tasks)
+                    self._overdue = None
+                elif stuck:
+                    report("Warning: `%s' metrics timed out, other metrics wait until "
+                           "the worker left with a timed out collector finishes" % stuck.collector.name)
+
+            due = [x for x in self._tasks if x.due <= now]
+            for task in due:
+                task.due = _next_tick(now, task.interval)
+                self._lock.acquire()
+                try:
+                    if task.running:
+                        task.skipped += 1
+                        continue
+                    task.running = True
+                finally:
+                    self._lock.release()
+                tasks.put(task)
+
+            self._wakeup.wait(max(self._next_wakeup() - time.time(), 0))
+        tasks.put(None)
+
+    def stats(self):
+        """Returns list of collection statistics of each collector."""
+        if not self._ready:
+            return []
+        self._lock.acquire()
+        try:
+            return [x.stats() for x in self._tasks]
+        finally:
+            self._lock.release()
 
     def _collect_info(self):
         if self._token:
@@ -559,15 +933,35 @@ class Metrics(object):
 
     def start(self):
         if self._ready:
-            self._schedule(time.time())
+            self._scheduler = threading.Thread(target=self._run, name='metrics scheduler')
+            self._scheduler.daemon = True
+            self._scheduler.start()
             self._collect_info()
 
-    def cancel(self):
+    def cancel(self, timeout=None):
+        """Stops collecting metrics, waits up to timeout seconds for the
+        scheduler to stop."""
         if self._ready:
             self._shutdown = True
-            t = self._timer
-            if t:
-                t.cancel()
+            self._wakeup.set()
+            self._scheduler.join(timeout)
+
+
+class NonBlockingTransport(object):
+
+    """Transport encapsulation which never waits for the send queue, for
+    producers which cannot stop such as metrics collected on schedule.
+    Entries which do not fit in the queue are dropped and counted."""
+
+    def __init__(self, transport):
+        self._transport = transport
+        self.dropped = 0
+
+    def send(self, entry):
+        try:
+            self._transport.send(entry, False)
+        except Queue.Full:
+            self.dropped += 1
 
 
 class StderrTransport(object):
@@ -602,17 +996,24 @@ class MetricsConfig(object):
         SPACE: '/',
     }
 
+    # Options disabled by default, saved only if set
+    OPTIONAL = {
+        AGENT: '',
+    }
+
     def __init__(self):
         # Set instance fields initialized to default values
         self.token = '' # Avoid pylint error
         for item in self.DEFAULTS:
             self.__dict__[item] = self.DEFAULTS[item]
+        for item in self.OPTIONAL:
+            self.__dict__[item] = self.OPTIONAL[item]
         self.processes = []
 
     def load(self, conf):
         """Loads metrics configuration."""
         # Basic metrics
-        for item in self.DEFAULTS:
+        for item in self.DEFAULTS.keys() + self.OPTIONAL.keys():
             try:
                 self.__dict__[item] = conf.get(SECT, PREFIX + item)
             except ConfigParser.NoOptionError:
@@ -628,8 +1029,12 @@ class MetricsConfig(object):
                             token = conf.get(section, TOKEN)
                         except ConfigParser.NoOptionError:
                             token = ''
+                    try:
+                        interval = conf.get(section, PREFIX + INTERVAL)
+                    except ConfigParser.NoOptionError:
+                        interval = ''
                     pattern = conf.get(section, PREFIX + PROCESS)
-                    self.processes.append([section, pattern, token])
+                    self.processes.append([section, pattern, token, interval])
                 except ConfigParser.NoOptionError:
                     pass
 
@@ -638,6 +1043,9 @@ class MetricsConfig(object):
         # Basic metrics
         for item in self.DEFAULTS:
             conf.set(SECT, PREFIX + item, self.__dict__[item])
+        for item in self.OPTIONAL:
+            if self.__dict__[item]:
+                conf.set(SECT, PREFIX + item, self.__dict__[item])
         # Process metrics
         for process in self.processes:
             try:
@@ -647,6 +1055,8 @@ class MetricsConfig(object):
             conf.set(process[0], PREFIX + PROCESS, process[1])
             if process[2]:
                 conf.set(process[0], PREFIX + TOKEN, process[2])
+            if process[3]:
+                conf.set(process[0], PREFIX + INTERVAL, process[3])
 
 # Pattern matching safe values, values that does not need to be quited
 SAFE_CHARS = re.compile(r'^[a-zA-Z0-9_]*$')
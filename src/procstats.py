@@ -0,0 +1,249 @@
+# coding: utf-8
+# vim: set ts=4 sw=4 et:
+
+"""Native system statistics of Linux read from /proc and /sys. Functions
+mirror psutil's system-wide functions used for metrics and return tuples
+with the same field names, so that metrics can be collected without psutil."""
+
+__author__ = 'Logentries'
+
+__all__ = ['available', 'cpu_count', 'cpu_times', 'virtual_memory',
+           'swap_memory', 'disk_io_counters', 'disk_usage', 'net_io_counters',
+           'pids', 'process_ctime', 'process_cmdline']
+
+import os
+import threading
+from collections import namedtuple
+
+# Linux process directories
+PROC_DIR = '/proc/'
+# Linux block devices
+SYS_BLOCK_DEV = '/sys/block/'
+# Linux CPU stat file
+CPUSTATS_FILE = '/proc/stat'
+# Linux memory stat file
+MEMSTATS_FILE = '/proc/meminfo'
+# Linux virtual memory stat file
+VMSTATS_FILE = '/proc/vmstat'
+# Linux network stat file
+NETSTATS_FILE = '/proc/net/dev'
+# Linux disk stat file
+DISKSTATS_FILE = '/proc/diskstats'
+
+# Size of a single read of a stat file
+READ_SIZE = 65536
+# Size of a sector in /proc/diskstats, regardless of the device
+SECTOR_SIZE = 512
+
+available = os.path.exists(CPUSTATS_FILE) and os.path.exists(MEMSTATS_FILE)
+
+cputimes = namedtuple('cputimes', 'user nice system idle iowait irq softirq steal guest guest_nice')
+svmem = namedtuple('svmem', 'total available used free active inactive buffers cached')
+sswap = namedtuple('sswap', 'total used free sin sout')
+sdiskio = namedtuple('sdiskio', 'read_count write_count read_bytes write_bytes read_time write_time')
+sdiskusage = namedtuple('sdiskusage', 'total used free')
+snetio = namedtuple('snetio', 'bytes_sent bytes_recv packets_sent packets_recv errin errout dropin dropout')
+
+if available:
+    _CLOCK_TICKS = float(os.sysconf('SC_CLK_TCK'))
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class _StatFile(object):
+
+    """Stat file kept open between samples. Files in /proc are generated on
+    each read from the beginning, hence seeking back is enough to read
+    current values without opening the file again. The file is shared by
+    collectors running on different threads, reads are serialized."""
+
+    def __init__(self, path):
+        self._path = path
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def read(self):
+        self._lock.acquire()
+        try:
+            if self._fd is None:
+                self._fd = os.open(self._path, os.O_RDONLY)
+            try:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                chunks = []
+                while True:
+                    data = os.read(self._fd, READ_SIZE)
+                    if not data:
+                        break
+                    chunks.append(data)
+            except OSError:
+                os.close(self._fd)
+                self._fd = None
+                raise
+            return ''.join(chunks)
+        finally:
+            self._lock.release()
+
+    def lines(self):
+        return self.read().splitlines()
+
+
+_cpu_stats = _StatFile(CPUSTATS_FILE)
+_mem_stats = _StatFile(MEMSTATS_FILE)
+_vm_stats = _StatFile(VMSTATS_FILE)
+_net_stats = _StatFile(NETSTATS_FILE)
+_disk_stats = _StatFile(DISKSTATS_FILE)
+
+
+def _cputimes(fields):
+    # Older kernels do not report some of the times
+    values = [int(x) / _CLOCK_TICKS for x in fields[1:11]]
+    values += [0.0] * (10 - len(values))
+    return cputimes(*values)
+
+
+def cpu_count():
+    """Returns the number of CPUs."""
+    count = 0
+    for line in _cpu_stats.lines():
+        if line.startswith('cpu') and line[3:4].isdigit():
+            count += 1
+    return count
+
+
+def cpu_times(percpu=False):
+    """Returns system CPU times in seconds, or list of times of each CPU."""
+    times = []
+    for line in _cpu_stats.lines():
+        if not line.startswith('cpu'):
+            continue
+        fields = line.split()
+        if not percpu:
+            return _cputimes(fields)
+        if fields[0] != 'cpu':
+            times.append(_cputimes(fields))
+    return times
+
+
+def _meminfo():
+    """Returns /proc/meminfo values in bytes."""
+    info = {}
+    for line in _mem_stats.lines():
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        value = int(fields[1])
+        if len(fields) > 2 and fields[2] == 'kB':
+            value *= 1024
+        info[fields[0].rstrip(':')] = value
+    return info
+
+
+def virtual_memory():
+    """Returns memory statistics in bytes."""
+    info = _meminfo()
+    total = info['MemTotal']
+    free = info['MemFree']
+    buffers = info.get('Buffers', 0)
+    cached = info.get('Cached', 0) + info.get('SReclaimable', 0)
+    used = total - free - buffers - cached
+    if used < 0:
+        used = total - free
+    # Estimated on kernels older than 3.14
+    available = info.get('MemAvailable', free + buffers + cached)
+    return svmem(total, available, used, free, info.get('Active', 0),
+                 info.get('Inactive', 0), buffers, cached)
+
+
+def swap_memory():
+    """Returns swap statistics, sin and sout are bytes swapped in and out
+    since boot."""
+    info = _meminfo()
+    total = info.get('SwapTotal', 0)
+    free = info.get('SwapFree', 0)
+    sin = sout = 0
+    try:
+        for line in _vm_stats.lines():
+            if line.startswith('pswpin '):
+                sin = int(line.split()[1]) * _PAGE_SIZE
+            elif line.startswith('pswpout '):
+                sout = int(line.split()[1]) * _PAGE_SIZE
+    except OSError:
+        pass
+    return sswap(total, total - free, free, sin, sout)
+
+
+def disk_io_counters(perdisk=False):
+    """Returns disk I/O statistics. The sum includes whole disks only,
+    partitions are included in their disks."""
+    disks = {}
+    for line in _disk_stats.lines():
+        fields = line.split()
+        if len(fields) < 11:
+            continue
+        name = fields[2]
+        if not perdisk and not os.path.exists(SYS_BLOCK_DEV + name):
+            continue
+        disks[name] = sdiskio(int(fields[3]), int(fields[7]),
+                              int(fields[5]) * SECTOR_SIZE, int(fields[9]) * SECTOR_SIZE,
+                              int(fields[6]), int(fields[10]))
+    if perdisk:
+        return disks
+    return sdiskio(*[sum(x) for x in zip(*disks.values())] or [0] * 6)
+
+
+def disk_usage(path):
+    """Returns disk space statistics in bytes of the file system mounted at
+    the path given."""
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    return sdiskusage(total, used, free)
+
+
+def net_io_counters(pernic=False):
+    """Returns network I/O statistics, either the sum or a dictionary of
+    statistics of each interface."""
+    nics = {}
+    # The first two lines are headers
+    for line in _net_stats.lines()[2:]:
+        name, _, counters = line.partition(':')
+        fields = counters.split()
+        if len(fields) < 16:
+            continue
+        nics[name.strip()] = snetio(int(fields[8]), int(fields[0]),
+                                    int(fields[9]), int(fields[1]),
+                                    int(fields[2]), int(fields[10]),
+                                    int(fields[3]), int(fields[11]))
+    if pernic:
+        return nics
+    return snetio(*[sum(x) for x in zip(*nics.values())] or [0] * 8)
+
+
+def _read_file(path):
+    f = open(path, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def pids():
+    """Returns sorted list of pids of running processes."""
+    return sorted([int(x) for x in os.listdir(PROC_DIR) if x.isdigit()])
+
+
+def process_ctime(pid):
+    """Returns change time of the process directory. The time is set when
+    the directory is looked up first, hence it changes if the pid is reused
+    by another process. Raises OSError if the process does not exist."""
+    return os.stat('%s%d' % (PROC_DIR, pid)).st_ctime
+
+
+def process_cmdline(pid):
+    """Returns command line of the process with arguments separated by
+    spaces, an empty string for kernel threads. Raises IOError if the
+    process does not exist."""
+    cmdline = _read_file('%s%d/cmdline' % (PROC_DIR, pid))
+    if cmdline.endswith('\0'):
+        cmdline = cmdline[:-1]
+    return cmdline.replace('\0', ' ')
@@ -0,0 +1,327 @@
+# coding: utf-8
+# vim: set ts=4 sw=4 et:
+
+"""Declarative filter rules defined in the configuration. Lines matching
+drop patterns are dropped, lines not matching keep patterns are dropped and
+matches of redact patterns are replaced."""
+
+__author__ = 'Logentries'
+
+__all__ = ['Rules', 'check_pattern', 'parse_patterns', 'required_literal', 'REDACTED']
+
+import re
+import sre_constants
+import sre_parse
+import threading
+
+# Replacement of redacted text
+REDACTED = '*****'
+
+# Name of the group of the n-th redact pattern
+_GROUP = '_r%d'
+# Maximal number of groups of a regular expression, see sre_compile
+_MAX_GROUPS = 99
+
+
+def parse_patterns(value):
+    """Returns list of patterns given one per line."""
+    return [x.strip() for x in value.split('\n') if x.strip()]
+
+
+def _to_bytes(s):
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    return s
+
+
+def _to_unicode(s):
+    if isinstance(s, unicode):
+        return s
+    return s.decode('utf-8')
+
+
+def check_pattern(pattern, redact=False):
+    """Raises re.error if the pattern is not a valid regular expression.
+    Redact patterns get a group to count hits, hence they may have one group
+    less."""
+    try:
+        re.compile(pattern)
+        if redact:
+            re.compile('(?:%s)()' % pattern)
+    except AssertionError, e:
+        # Too many groups
+        raise re.error(str(e))
+
+
+def _subpatterns(av):
+    """Returns parsed subpatterns of the argument of a parsed item."""
+    if isinstance(av, sre_parse.SubPattern):
+        return [av]
+    subpatterns = []
+    if isinstance(av, (tuple, list)):
+        for x in av:
+            subpatterns.extend(_subpatterns(x))
+    return subpatterns
+
+
+def _has_groupref(items):
+    for op, av in items:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return True
+        for subpattern in _subpatterns(av):
+            if _has_groupref(subpattern):
+                return True
+    return False
+
+
+def _standalone(parsed):
+    """Returns True if the parsed pattern cannot be combined with others.
+    Inline flags apply to the whole expression, group names must be unique
+    and backreferences refer to groups by numbers."""
+    return bool(parsed.pattern.flags or parsed.pattern.groupdict or _has_groupref(parsed))
+
+
+def _combine(patterns, extra=0):
+    """Splits patterns into lists of indexes of patterns to be combined into
+    a single expression. Patterns which cannot be combined are alone, others
+    are combined while their groups, including extra groups added to each
+    pattern, fit in the limit of the re module."""
+    chunks = []
+    chunk = []
+    groups = 0
+    for i, pattern in enumerate(patterns):
+        parsed = sre_parse.parse(pattern)
+        if _standalone(parsed):
+            chunks.append([i])
+            continue
+        count = parsed.pattern.groups - 1 + extra
+        if chunk and groups + count > _MAX_GROUPS:
+            chunks.append(chunk)
+            chunk = []
+            groups = 0
+        chunk.append(i)
+        groups += count
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _compile(patterns):
+    """Returns search function of the patterns. Patterns are combined into a
+    single alternation so that a line is scanned once regardless of the
+    number of patterns, see _combine for exceptions. Returns None if there
+    are no patterns."""
+    if not patterns:
+        return None
+    searches = [re.compile('|'.join(['(?:%s)' % patterns[i] for i in chunk])).search
+                for chunk in _combine(patterns)]
+    if len(searches) == 1:
+        return searches[0]
+
+    def search(line):
+        for search_chunk in searches:
+            match = search_chunk(line)
+            if match:
+                return match
+        return None
+    return search
+
+
+def _literal_runs(items, runs, run, char):
+    """Collects runs of literals which every match of the parsed items
+    contains. Anything else than a literal ends the current run."""
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            run.append(char(av))
+        elif op == sre_constants.SUBPATTERN:
+            _literal_runs(av[1], runs, run, char)
+        else:
+            runs.append(''.join(run))
+            del run[:]
+            if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                # Repeated at least once
+                repeated = []
+                _literal_runs(av[2], runs, repeated, char)
+                runs.append(''.join(repeated))
+
+
+def required_literal(pattern):
+    """Returns the longest literal text every match of the pattern contains.
+    Returns an empty string if there is no such text or case is ignored."""
+    parsed = sre_parse.parse(pattern)
+    if parsed.pattern.flags & (re.IGNORECASE | re.LOCALE):
+        return pattern[:0]
+    if isinstance(pattern, unicode):
+        char = unichr
+    else:
+        char = chr
+    runs = []
+    run = []
+    _literal_runs(parsed, runs, run, char)
+    runs.append(''.join(run))
+    return max(runs, key=len)
+
+
+class _Redaction(object):
+
+    """
+    Redact patterns compiled for either UTF-8 encoded or unicode lines.
+    Patterns are merged into as few regular expressions as possible, see
+    _combine, with a named group per pattern to count hits. Patterns which
+    cannot be merged are compiled alone and identified by their expression.
+
+    Most patterns contain literal text, for example `@' of e-mail addresses.
+    Literals of all patterns are searched at once in the whole block first
+    and then in each line, the merged expression is used only for lines
+    containing some of them. Patterns without a literal are applied to all
+    lines.
+    """
+
+    def __init__(self, patterns, replacement):
+        literals = []
+        unconditional = []
+        for i, pattern in enumerate(patterns):
+            literal = required_literal(pattern)
+            if literal:
+                literals.append(re.escape(literal))
+            else:
+                unconditional.append(i)
+        # Expression of a standalone pattern -> index of the pattern
+        self.standalone = {}
+        self.sub = self._compile(patterns, range(len(patterns)))
+        # Applied to lines without any literal
+        self.unconditional_sub = None
+        if unconditional:
+            self.unconditional_sub = self._compile(patterns, unconditional)
+        # Literals of the other patterns
+        self.literal_search = None
+        if literals:
+            self.literal_search = re.compile('|'.join(literals)).search
+        self.replacement = replacement
+        self.separator = replacement[:0] + '\n'
+
+    def _compile(self, patterns, indexes):
+        """Returns substitution function of the patterns given by their
+        indexes."""
+        subs = []
+        for chunk in _combine([patterns[i] for i in indexes], 1):
+            chunk = [indexes[j] for j in chunk]
+            if len(chunk) == 1 and _standalone(sre_parse.parse(patterns[chunk[0]])):
+                expression = re.compile(patterns[chunk[0]])
+                self.standalone[expression] = chunk[0]
+            else:
+                expression = re.compile('|'.join(
+                    ['(?P<%s>%s)' % (_GROUP % i, patterns[i]) for i in chunk]))
+            subs.append(expression.sub)
+        if len(subs) == 1:
+            return subs[0]
+
+        def sub(replace, line):
+            for sub_chunk in subs:
+                line = sub_chunk(replace, line)
+            return line
+        return sub
+
+
+class Rules(object):
+
+    """
+    Filter rules. Patterns of each kind are combined into a single regular
+    expression where possible, patterns with inline flags, named groups or
+    backreferences are searched separately. Lines may be either UTF-8
+    encoded or unicode. Raises re.error if a pattern is invalid.
+
+    Hits of each redact pattern are counted, see redactions.
+    """
+
+    def __init__(self, drop=(), keep=(), redact=(), replacement=REDACTED):
+        for pattern in list(drop) + list(keep) + list(redact):
+            # Identify the invalid pattern
+            try:
+                check_pattern(pattern, pattern in redact)
+            except re.error, e:
+                raise re.error('%s: %s' % (pattern, e))
+        self._redact_patterns = list(redact)
+        self._hits = [0] * len(redact)
+        self._hits_lock = threading.Lock()
+
+        self._drop = _compile([_to_bytes(x) for x in drop])
+        self._keep = _compile([_to_bytes(x) for x in keep])
+        self._redaction = None
+        if redact:
+            self._redaction = _Redaction([_to_bytes(x) for x in redact], _to_bytes(replacement))
+
+        self._drop_unicode = _compile([_to_unicode(x) for x in drop])
+        self._keep_unicode = _compile([_to_unicode(x) for x in keep])
+        self._redaction_unicode = None
+        if redact:
+            self._redaction_unicode = _Redaction([_to_unicode(x) for x in redact],
+                                                 _to_unicode(replacement))
+
+    def redactions(self):
+        """Returns list of (pattern, hits) tuples of redact patterns."""
+        self._hits_lock.acquire()
+        try:
+            return zip(self._redact_patterns, self._hits)
+        finally:
+            self._hits_lock.release()
+
+    def filter(self, line):
+        """Returns the line with matches of redact patterns replaced, None if
+        the line is dropped."""
+        for line in self.filter_lines([line]):
+            return line
+        return None
+
+    def filter_lines(self, lines):
+        """Returns list of lines which are not dropped, with matches of
+        redact patterns replaced."""
+        if not lines:
+            return lines
+        if isinstance(lines[0], unicode):
+            drop, keep, redaction = self._drop_unicode, self._keep_unicode, self._redaction_unicode
+        else:
+            drop, keep, redaction = self._drop, self._keep, self._redaction
+        if drop:
+            lines = [x for x in lines if not drop(x)]
+        if keep:
+            lines = [x for x in lines if keep(x)]
+        if redaction and lines:
+            lines = self._redact(redaction, lines)
+        return lines
+
+    def _redact(self, redaction, lines):
+        hits = [0] * len(self._hits)
+        replacement = redaction.replacement
+
+        standalone = redaction.standalone
+
+        def replace(match):
+            if standalone and match.re in standalone:
+                hits[standalone[match.re]] += 1
+            else:
+                hits[int(match.lastgroup[2:])] += 1
+            return replacement
+
+        literal_search = redaction.literal_search
+        unconditional_sub = redaction.unconditional_sub
+        if literal_search is None or not literal_search(redaction.separator.join(lines)):
+            # No line contains a literal
+            if unconditional_sub is None:
+                return lines
+            lines = [unconditional_sub(replace, x) for x in lines]
+        elif unconditional_sub is None:
+            sub = redaction.sub
+            lines = [literal_search(x) and sub(replace, x) or x for x in lines]
+        else:
+            sub = redaction.sub
+            lines = [(literal_search(x) and sub or unconditional_sub)(replace, x) for x in lines]
+
+        if any(hits):
+            self._hits_lock.acquire()
+            try:
+                for i, count in enumerate(hits):
+                    self._hits[i] += count
+            finally:
+                self._hits_lock.release()
+        return lines
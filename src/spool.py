@@ -0,0 +1,268 @@
+# coding: utf-8
+# vim: set ts=4 sw=4 et:
+
+"""On-disk spool of entries which cannot be sent right away. Entries are
+appended to segment files in a directory and read back in the same order."""
+
+__author__ = 'Logentries'
+
+__all__ = ['Spool']
+
+import errno
+import os
+import struct
+import threading
+
+# Maximal size of a single segment file
+SEGMENT_SIZE = 4 * 1024 * 1024 # Bytes
+# Segment file name suffix
+SEGMENT_SUFFIX = '.spool'
+
+# Length of each entry precedes the entry
+_LENGTH = struct.Struct('>I')
+
+
+class Spool(object):
+
+    """
+    Segmented append-only spool. Entries are appended to the newest segment
+    and read from the oldest one; fully read segments are removed. If the
+    total size would exceed max_size, the oldest segments are evicted.
+
+    Reading is done in two steps, read returns entries and consume confirms
+    they have been processed. Entries consumed are removed from the first
+    segment on close, segments left over from a previous run are read from
+    their beginning.
+    """
+
+    def __init__(self, directory, max_size, segment_size=SEGMENT_SIZE):
+        self._directory = directory
+        self._max_size = max_size
+        self._segment_size = segment_size
+        self._lock = threading.Lock()
+        # Bytes of entries evicted because of the size limit
+        self.evicted = 0
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._segments = []
+        self._size = 0
+        for name in os.listdir(directory):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            try:
+                number = int(name[:-len(SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+            self._segments.append(number)
+            self._size += os.path.getsize(self._segment_name(number))
+        self._segments.sort()
+        # New entries always go to a new segment, a segment of a previous
+        # run may end with an incomplete entry
+        self._writer = None
+        self._writer_size = 0
+        self._read_offset = 0
+        self._pending_offset = 0
+
+    def _segment_name(self, number):
+        return os.path.join(self._directory, '%016d%s' % (number, SEGMENT_SUFFIX))
+
+    def _remove_segment(self, number):
+        if self._writer and number == self._segments[-1]:
+            self._writer.close()
+            self._writer = None
+        name = self._segment_name(number)
+        try:
+            self._size -= os.path.getsize(name)
+            os.remove(name)
+        except OSError:
+            pass
+        self._segments.remove(number)
+
+    def _new_segment(self):
+        if self._writer:
+            self._writer.close()
+        if self._segments:
+            number = self._segments[-1] + 1
+        else:
+            number = 0
+        self._writer = open(self._segment_name(number), 'ab')
+        self._writer_size = 0
+        self._segments.append(number)
+
+    def empty(self):
+        """Returns True if there are no entries to be read."""
+        self._lock.acquire()
+        try:
+            return self._empty()
+        finally:
+            self._lock.release()
+
+    def _empty(self):
+        if not self._segments:
+            return True
+        return len(self._segments) == 1 and self._writer is not None and \
+            self._read_offset >= self._writer_size
+
+    def append(self, entries):
+        """Appends entries given as strings."""
+        data = _pack(entries)
+        self._lock.acquire()
+        try:
+            if not self._writer or self._writer_size >= self._segment_size:
+                self._new_segment()
+            # Evict the oldest segments, never the one being written
+            while self._size + len(data) > self._max_size and len(self._segments) > 1:
+                oldest = self._segments[0]
+                self.evicted += os.path.getsize(self._segment_name(oldest))
+                self._remove_segment(oldest)
+                self._read_offset = self._pending_offset = 0
+            self._writer.write(data)
+            self._writer.flush()
+            self._writer_size += len(data)
+            self._size += len(data)
+        finally:
+            self._lock.release()
+
+    def insert(self, entries):
+        """Inserts entries given as strings before the entries not consumed
+        yet, they are read first. The size limit does not apply."""
+        data = _pack(entries)
+        self._lock.acquire()
+        try:
+            self._compact()
+            if self._segments:
+                number = self._segments[0] - 1
+            else:
+                number = 0
+            f = open(self._segment_name(number), 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            self._segments.insert(0, number)
+            self._size += len(data)
+        finally:
+            self._lock.release()
+
+    def _compact(self):
+        """Removes entries consumed from the first segment, so that it is
+        read from its beginning."""
+        if not self._segments or not self._read_offset:
+            return
+        segment = self._segments[0]
+        if self._writer and segment == self._segments[-1]:
+            self._writer.close()
+            self._writer = None
+        name = self._segment_name(segment)
+        f = open(name, 'rb')
+        try:
+            f.seek(self._read_offset)
+            data = f.read()
+        finally:
+            f.close()
+        f = open(name + '.tmp', 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        os.rename(name + '.tmp', name)
+        self._size -= self._read_offset
+        self._read_offset = self._pending_offset = 0
+
+    def read(self, max_size):
+        """Returns the oldest entries not consumed yet, up to max_size bytes
+        but at least one entry if available. Entries are read from a single
+        segment at a time."""
+        self._lock.acquire()
+        try:
+            while self._segments:
+                segment = self._segments[0]
+                f = open(self._segment_name(segment), 'rb')
+                try:
+                    f.seek(self._read_offset)
+                    data = f.read(max_size + _LENGTH.size)
+                finally:
+                    f.close()
+                entries = []
+                pos = 0
+                while pos + _LENGTH.size <= len(data):
+                    length, = _LENGTH.unpack_from(data, pos)
+                    if pos + _LENGTH.size + length > len(data):
+                        if not entries:
+                            # Entry longer than max_size
+                            data = self._read_entry(segment, self._read_offset + pos, length)
+                            if data is not None:
+                                entries.append(data)
+                                pos += _LENGTH.size + length
+                        break
+                    entries.append(data[pos + _LENGTH.size:pos + _LENGTH.size + length])
+                    pos += _LENGTH.size + length
+                if entries:
+                    self._pending_offset = self._read_offset + pos
+                    return entries
+                if self._writer and segment == self._segments[-1]:
+                    # Nothing more written yet
+                    return []
+                # The segment has been read completely
+                self._remove_segment(segment)
+                self._read_offset = self._pending_offset = 0
+            return []
+        finally:
+            self._lock.release()
+
+    def _read_entry(self, segment, offset, length):
+        """Reads a single entry. Returns None if the entry is incomplete."""
+        f = open(self._segment_name(segment), 'rb')
+        try:
+            f.seek(offset + _LENGTH.size)
+            data = f.read(length)
+        finally:
+            f.close()
+        if len(data) < length:
+            return None
+        return data
+
+    def consume(self):
+        """Confirms entries returned by the last read have been processed."""
+        self._lock.acquire()
+        try:
+            self._read_offset = self._pending_offset
+            if not self._segments:
+                return
+            segment = self._segments[0]
+            if self._writer and segment == self._segments[-1]:
+                size = self._writer_size
+            else:
+                size = os.path.getsize(self._segment_name(segment))
+            if self._read_offset >= size:
+                # Nothing is left to replay after a restart
+                self._remove_segment(segment)
+                self._read_offset = self._pending_offset = 0
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+            try:
+                self._compact()
+            except (IOError, OSError):
+                # Consumed entries are read again on the next start
+                pass
+        finally:
+            self._lock.release()
+
+
+def _pack(entries):
+    """Returns entries given as strings preceded by their lengths."""
+    data = []
+    for entry in entries:
+        data.append(_LENGTH.pack(len(entry)))
+        data.append(entry)
+    return ''.join(data)
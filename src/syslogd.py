@@ -0,0 +1,458 @@
+# coding: utf-8
+# vim: set ts=4 sw=4 et:
+
+"""Local syslog receiver. Messages in RFC 3164 or RFC 5424 format are received
+on UDP, TCP and Unix datagram sockets and passed to handlers of their sockets
+in batches. On Linux, datagrams are read in batches with recvmmsg(2) bound with
+ctypes."""
+
+__author__ = 'Logentries'
+
+__all__ = ['SyslogServer', 'SyslogError', 'parse', 'parse_address']
+
+import errno
+import os
+import re
+import select
+import socket
+import stat
+import sys
+import threading
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+# Maximal size of a message, longer datagrams are truncated
+MAX_MESSAGE = 8192
+# Maximal number of datagrams read at once
+BATCH_SIZE = 64
+# Maximal number of batches read from a socket before checking other sockets
+MAX_BATCHES = 16
+# Size of a single read of a TCP connection
+READ_SIZE = 65536
+# Maximal number of TCP connections
+MAX_CONNECTIONS = 256
+# Requested size of receive buffers of datagram sockets
+RECEIVE_BUFFER = 4 * 1024 * 1024 # Bytes
+# Default permissions of Unix socket files, any local process may log
+SOCKET_MODE = 0666
+# Maximal length of the octet counting header, digits and a space
+_MAX_HEADER = 11
+# Timeout of waiting for the receiving thread on close
+JOIN_INTERVAL = 1.0 # Seconds
+
+_KINDS = ('udp', 'tcp', 'unix')
+# Syslog message of either format, parsed by a single match
+_MESSAGE = re.compile(
+    r'<\d{1,3}>(?:'
+    # RFC 5424: VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID STRUCTURED-DATA MSG
+    r'1 \S+ \S+ (\S+) (\S+) \S+ (?:-|(?:\[(?:[^\]\\]|\\.)*\])+)(?: (?:\xef\xbb\xbf)?(.*))?'
+    r'|'
+    # RFC 3164: TIMESTAMP HOSTNAME TAG MSG, hostname is missing in messages
+    # of local applications and the tag ends with [pid] or colon
+    r'(?:(?:[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d|\d{4}-\d\d-\d\dT\S+) (?:[^ \[]*[^ \[:] )?)?'
+    r'(([^\[: ]{1,48}(?=[\[:]))?.*)'
+    r')', re.S)
+
+# Flag of recvmmsg, see <sys/socket.h>
+_MSG_DONTWAIT = 0x40
+
+
+def _load_libc():
+    if ctypes is None or not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+_libc = _load_libc()
+
+if _libc:
+    class _iovec(ctypes.Structure):
+        _fields_ = [('iov_base', ctypes.c_void_p),
+                    ('iov_len', ctypes.c_size_t)]
+
+    class _msghdr(ctypes.Structure):
+        _fields_ = [('msg_name', ctypes.c_void_p),
+                    ('msg_namelen', ctypes.c_uint32),
+                    ('msg_iov', ctypes.POINTER(_iovec)),
+                    ('msg_iovlen', ctypes.c_size_t),
+                    ('msg_control', ctypes.c_void_p),
+                    ('msg_controllen', ctypes.c_size_t),
+                    ('msg_flags', ctypes.c_int)]
+
+    class _mmsghdr(ctypes.Structure):
+        _fields_ = [('msg_hdr', _msghdr),
+                    ('msg_len', ctypes.c_uint)]
+
+    _libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr),
+                               ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+
+
+class SyslogError(Exception):
+
+    """Raised if a socket cannot be created."""
+
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
+
+def parse_address(value):
+    """Returns kind and address of the listening address given as
+    udp:HOST:PORT, tcp:HOST:PORT or unix:PATH. The address is a (host, port)
+    tuple or a path. Raises ValueError if the address is invalid."""
+    kind, _, rest = value.strip().partition(':')
+    if kind not in _KINDS or not rest:
+        raise ValueError(value)
+    if kind == 'unix':
+        return kind, rest
+    host, _, port = rest.rpartition(':')
+    port = int(port)
+    if not 0 < port < 65536:
+        raise ValueError(value)
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    return kind, (host or 'localhost', port)
+
+
+def parse(data):
+    """Returns app name and text of the syslog message given. The text is
+    the tag and the message as syslog daemons write them to files, for
+    example `sshd[42]: Accepted publickey'. Messages without a valid
+    priority are returned as they are with an empty app name."""
+    if data.endswith('\n') or data.endswith('\0'):
+        data = data.rstrip('\r\n\0')
+    m = _MESSAGE.match(data)
+    if m is None:
+        return '', data
+    app, procid, msg, line, tag = m.groups()
+    if line is not None:
+        return tag or '', line
+    msg = msg or ''
+    if app == '-':
+        return '', msg
+    if procid == '-':
+        return app, '%s: %s' % (app, msg)
+    return app, '%s[%s]: %s' % (app, procid, msg)
+
+
+def _stale_socket(path):
+    """Returns True if the path is a Unix socket nobody receives on, such as
+    a socket file left by a process which has exited."""
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return False
+    except OSError:
+        return False
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        s.connect(path)
+    except socket.error, e:
+        return e.args[0] == errno.ECONNREFUSED
+    finally:
+        s.close()
+    return False
+
+
+class _BatchReceiver(object):
+
+    """Receives up to BATCH_SIZE datagrams with a single recvmmsg call.
+    Buffers are allocated once and reused."""
+
+    def __init__(self):
+        self._buffers = ctypes.create_string_buffer(BATCH_SIZE * MAX_MESSAGE)
+        self._base = ctypes.addressof(self._buffers)
+        self._iovecs = (_iovec * BATCH_SIZE)()
+        self._headers = (_mmsghdr * BATCH_SIZE)()
+        for i in range(BATCH_SIZE):
+            self._iovecs[i].iov_base = self._base + i * MAX_MESSAGE
+            self._iovecs[i].iov_len = MAX_MESSAGE
+            self._headers[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            self._headers[i].msg_hdr.msg_iovlen = 1
+        # Lengths of received datagrams read as a flat array, accessing
+        # fields of the structures is slow
+        words = ctypes.sizeof(self._headers) / ctypes.sizeof(ctypes.c_uint)
+        self._lengths = (ctypes.c_uint * words).from_buffer(self._headers)
+        self._stride = ctypes.sizeof(_mmsghdr) / ctypes.sizeof(ctypes.c_uint)
+        self._offset = _mmsghdr.msg_len.offset / ctypes.sizeof(ctypes.c_uint)
+        self._data = buffer(self._buffers)
+
+    def receive(self, s):
+        count = _libc.recvmmsg(s.fileno(), self._headers, BATCH_SIZE, _MSG_DONTWAIT, None)
+        if count == -1:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise socket.error(err, os.strerror(err))
+        lengths = self._lengths
+        data = self._data
+        stride = self._stride
+        offset = self._offset
+        datagrams = []
+        for i in xrange(count):
+            start = i * MAX_MESSAGE
+            datagrams.append(data[start:start + lengths[i * stride + offset]])
+        return datagrams
+
+
+def _receive(s):
+    """Receives up to BATCH_SIZE datagrams one by one."""
+    datagrams = []
+    while len(datagrams) < BATCH_SIZE:
+        try:
+            datagrams.append(s.recv(MAX_MESSAGE))
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                break
+            raise
+    return datagrams
+
+
+class _StreamDecoder(object):
+
+    """Splits data received on a TCP connection to messages. Messages are
+    either preceded by their length (octet counting) or terminated by a new
+    line, see RFC 6587."""
+
+    def __init__(self):
+        self._buffer = ''
+        # Bytes of a truncated message not received yet
+        self._skip = 0
+
+    def feed(self, data):
+        """Returns list of messages completed by the data given."""
+        data = self._buffer + data
+        messages = []
+        pos = 0
+        size = len(data)
+        if self._skip:
+            # Rest of a message longer than MAX_MESSAGE
+            pos = min(self._skip, size)
+            self._skip -= pos
+        while pos < size:
+            if data[pos].isdigit():
+                space = data.find(' ', pos, pos + _MAX_HEADER)
+                if space != -1 and data[pos:space].isdigit():
+                    end = space + 1 + int(data[pos:space])
+                    if end - space - 1 > MAX_MESSAGE:
+                        # Truncated, the rest is skipped as it arrives
+                        if size - space - 1 < MAX_MESSAGE:
+                            break
+                        messages.append(data[space + 1:space + 1 + MAX_MESSAGE])
+                        pos = min(end, size)
+                        self._skip = end - pos
+                        continue
+                    if end > size:
+                        break
+                    messages.append(data[space + 1:end])
+                    pos = end
+                    continue
+            end = data.find('\n', pos)
+            if end == -1:
+                break
+            if end > pos:
+                messages.append(data[pos:end])
+            pos = end + 1
+        self._buffer = data[pos:]
+        if len(self._buffer) > MAX_MESSAGE + _MAX_HEADER:
+            # Too long without a frame end
+            messages.append(self._buffer[:MAX_MESSAGE])
+            self._buffer = ''
+        return messages
+
+    def flush(self):
+        """Returns incomplete message left when the connection is closed."""
+        messages = []
+        if self._buffer.strip():
+            messages.append(self._buffer)
+        self._buffer = ''
+        return messages
+
+
+class SyslogServer(object):
+
+    """
+    Receives syslog messages on sockets in a background thread. Listeners
+    are (kind, address, handler) tuples, see parse_address. Handlers accept
+    lists of (app name, text) tuples of messages received at once, see
+    parse. Unix socket files get the permissions given. Raises SyslogError
+    if a socket cannot be created.
+    """
+
+    def __init__(self, listeners, socket_mode=SOCKET_MODE):
+        self._shutdown = False
+        self._socket_mode = socket_mode
+        # Datagram sockets and listening TCP sockets -> handler
+        self._datagram = {}
+        self._listening = {}
+        # TCP connection -> (handler, decoder)
+        self._connections = {}
+        self._paths = []
+        self._receiver = None
+        if _libc:
+            self._receiver = _BatchReceiver()
+        # Number of messages received
+        self.received = 0
+        try:
+            for kind, address, handler in listeners:
+                self._bind(kind, address, handler)
+        except (socket.error, OSError), e:
+            self._close_sockets()
+            raise SyslogError('Cannot listen on %s:%s: %s' % (kind, address, e))
+        # Pipe used to interrupt waiting, closed with the sockets
+        self._wake_r, self._wake_w = os.pipe()
+        self._wake_lock = threading.Lock()
+        self._worker = threading.Thread(target=self.run, name='syslog')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _bind(self, kind, address, handler):
+        if kind == 'unix':
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._datagram[s] = handler
+            if _stale_socket(address):
+                # Left by a previous run
+                os.remove(address)
+            s.bind(address)
+            self._paths.append(address)
+            os.chmod(address, self._socket_mode)
+        else:
+            host, port = address
+            if kind == 'udp':
+                socktype = socket.SOCK_DGRAM
+            else:
+                socktype = socket.SOCK_STREAM
+            family, _, _, _, sockaddr = socket.getaddrinfo(host, port, 0, socktype)[0]
+            s = socket.socket(family, socktype)
+            if kind == 'udp':
+                self._datagram[s] = handler
+            else:
+                self._listening[s] = handler
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind(sockaddr)
+            if kind == 'tcp':
+                s.listen(socket.SOMAXCONN)
+        if s in self._datagram:
+            try:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+            except socket.error:
+                pass
+        s.setblocking(0)
+
+    def _close_sockets(self):
+        for s in self._datagram.keys() + self._listening.keys() + self._connections.keys():
+            s.close()
+        self._datagram = {}
+        self._listening = {}
+        self._connections = {}
+        for path in self._paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._paths = []
+
+    def run(self):
+        while not self._shutdown:
+            fds = [self._wake_r] + self._datagram.keys() + self._listening.keys() + \
+                self._connections.keys()
+            try:
+                readable, _, _ = select.select(fds, [], [])
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for s in readable:
+                if s == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                elif s in self._datagram:
+                    self._receive_datagrams(s)
+                elif s in self._listening:
+                    self._accept(s)
+                else:
+                    self._receive_stream(s)
+        self._close_sockets()
+        self._wake_lock.acquire()
+        try:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = -1
+        finally:
+            self._wake_lock.release()
+
+    def _dispatch(self, handler, data):
+        messages = [parse(x) for x in data if x]
+        if messages:
+            self.received += len(messages)
+            handler(messages)
+
+    def _receive_datagrams(self, s):
+        handler = self._datagram[s]
+        for _ in range(MAX_BATCHES):
+            try:
+                if self._receiver:
+                    data = self._receiver.receive(s)
+                else:
+                    data = _receive(s)
+            except socket.error:
+                return
+            self._dispatch(handler, data)
+            if len(data) < BATCH_SIZE:
+                break
+
+    def _accept(self, s):
+        try:
+            connection, _ = s.accept()
+        except socket.error:
+            return
+        if len(self._connections) >= MAX_CONNECTIONS:
+            connection.close()
+            return
+        connection.setblocking(0)
+        self._connections[connection] = (self._listening[s], _StreamDecoder())
+
+    def _receive_stream(self, connection):
+        handler, decoder = self._connections[connection]
+        try:
+            data = connection.recv(READ_SIZE)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            data = ''
+        if data:
+            self._dispatch(handler, decoder.feed(data))
+            return
+        # Closed by the client
+        del self._connections[connection]
+        connection.close()
+        self._dispatch(handler, decoder.flush())
+
+    def stop(self):
+        """Signals the receiving thread to stop without waiting, see join."""
+        self._shutdown = True
+        self._wake_lock.acquire()
+        try:
+            if self._wake_w != -1:
+                try:
+                    os.write(self._wake_w, '\0')
+                except OSError:
+                    pass
+        finally:
+            self._wake_lock.release()
+
+    def join(self, timeout):
+        """Waits up to timeout seconds for the receiving thread to stop, the
+        sockets are closed then."""
+        self._worker.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.join(JOIN_INTERVAL)
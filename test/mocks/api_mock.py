@@ -19,10 +19,12 @@ CWD = os.getcwd()
 HOST0_KEY = "41ae887a-284a-4d78-91fe-56485b076148"
 HOST1_KEY = "86707421-6a05-4c70-9034-e5e30b6a1a44"
 HOST2_KEY = "9df0ea6f-36fa-820f-a6bc-c97da8939a06"
+HOST3_KEY = "c2f4e1a8-5b7d-4e3c-9a6f-1d8b2e4f6a0c"
 LOG0_KEY = "400da462-36fa-48f4-bb4e-87f96ad34e8a"
 LOG1_KEY = "ee0489cc-41ce-41cf-9bb6-4cdf5e5acf32"
 LOG2_KEY = "484d6e95-a4e1-42fe-820f-5a4c0824428c"
 LOG3_KEY = "fa32313c-3907-4214-ac41-3ff9c6549a22"
+LOG4_KEY = "7b3e9d21-0c4f-4a8e-b6d2-5f1a9c3e7d40"
 LOG_DYNAMIC_KEY = "32fa313c-4c70-4214-9bb6-3ff9c6549a22"
 
 LOG0 = {
@@ -73,6 +75,18 @@ LOG3 = {
     "retention":-1,
 }
 
+# Second log sent by HTTP PUT
+LOG4 = {
+    "object":"log",
+    "key":LOG4_KEY,
+    "name":"Log name 4",
+    "filename":CWD +"/example3.log",
+    "created":1418775058812,
+    "type":"agent",
+    "follow":"true",
+    "retention":-1,
+}
+
 HOST0 = {
     "object":"host",
     "key":HOST0_KEY,
@@ -239,6 +253,11 @@ class HostLogsHandler( cyclone.web.RequestHandler):
                 "object":"loglist",
                 "list":[LOG2],
             }))
+        elif host_id == HOST3_KEY:
+            self.write( response_ok( {
+                "object":"loglist",
+                "list":[ LOG0, LOG4],
+            }))
         else:
             raise cyclone.web.HTTPError( 403)
 
@@ -260,6 +279,8 @@ class IngestionHandler( cyclone.web.RequestHandler):
             pass
         elif log_id in [LOG3_KEY, LOG3['name']]:
             pass
+        elif log_id in [LOG4_KEY, LOG4['name']]:
+            pass
 
 def response_ok( x):
     a = { 'response': 'ok'}
@@ -3,18 +3,28 @@
 #
 # Logentries data server mock
 #
+# Data received are appended to the file given as the first argument, if
+# any, one line with the representation of each chunk
+#
+
+import sys
 
 from twisted.internet import protocol, reactor, endpoints
 
+record = None
+
 class Listen( protocol.Protocol):
 	def dataReceived( self, data):
-		pass
+		if record:
+			record.write( repr( data) + '\n')
+			record.flush()
 
 class ListenFactory( protocol.Factory):
 	def buildProtocol( self, addr):
 		return Listen()
 
 if __name__ == "__main__":
+	if len( sys.argv) > 1:
+		record = open( sys.argv[1], 'a')
 	endpoints.serverFromString( reactor, "tcp:10000").listen(ListenFactory())
 	reactor.run()
-
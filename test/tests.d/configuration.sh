@@ -139,3 +139,29 @@ cat $CONFIG
 #o token = 629cc7e9-3344-4cef-b364-7fb6baeb74f2
 #o path = /var/log/syslog
 #o
+
+
+Scenario 'Numeric parameters are checked'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+echo 'pull-server-side-config = False' >>"$CONFIG"
+
+for param in 'send-batch-size = 0' 'send-queue-size = -1' 'send-batch-latency = x' \
+		'put-connections = 0' 'shutdown-timeout = nan' 'syslog-socket-mode = 10000' ; do
+	echo "$param" >>"$CONFIG"
+	$LE monitor
+	sed -i '$d' "$CONFIG"
+done
+#e Configuration files loaded: sandbox_config
+#e Fatal: Invalid send-batch-size: 0, at least 1 expected
+#e Configuration files loaded: sandbox_config
+#e Fatal: Invalid send-queue-size: -1, at least 1 expected
+#e Configuration files loaded: sandbox_config
+#e Fatal: Invalid send-batch-latency: x
+#e Configuration files loaded: sandbox_config
+#e Fatal: Invalid put-connections: 0, at least 1 expected
+#e Configuration files loaded: sandbox_config
+#e Fatal: Invalid shutdown-timeout: nan
+#e Configuration files loaded: sandbox_config
+#e Fatal: Invalid syslog-socket-mode: 10000, at most 7777 expected
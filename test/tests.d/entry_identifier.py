@@ -99,6 +99,56 @@ wait $LE_PID 2>/dev/null || true
 
 
 
+Scenario 'Entries longer than a read block'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+entry_identifier = separator
+EOF
+
+Testcase 'Entries spanning read blocks are assembled whole'
+
+touch example.log
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for entry in 1 2 3 ; do
+	echo "separatorEntry $entry"
+	seq -f 'Line %05g' 3000
+done >entries.log
+cat entries.log >>example.log
+sleep 2
+
+grep -o 'separatorEntry [0-9]' monitor.log
+#o separatorEntry 1
+#o separatorEntry 2
+#o separatorEntry 3
+grep 'separatorEntry' monitor.log | awk -F'Line ' '{ print NF - 1 }'
+#o 3000
+#o 3000
+#o 3000
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+
+
+
+
+
+
+
+
+
+
 Scenario 'Configuration precedence'
 
 
@@ -0,0 +1,166 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Filter rules defined in configuration'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+Testcase 'Drop and redact rules'
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+redact = pass=\S+
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+drop = DEBUG
+	health check
+EOF
+
+touch example.log
+$LE --debug-transport-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 1
+cat >>example.log <<EOF
+DEBUG First message
+Login user=joe pass=secret
+GET /health check
+Second message
+EOF
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148Login user=joe *****
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148Second message
+sleep 1
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+#e
+#e Shutting down
+#e Web: 1 hits of redact pattern `pass=\S+'
+
+
+Testcase 'Keep rules'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+keep = ERROR|WARN
+EOF
+
+$LE --debug-transport-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 1
+cat >>example.log <<EOF
+INFO First message
+ERROR Second message
+WARN Third message
+EOF
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148ERROR Second message
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148WARN Third message
+sleep 1
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+#e
+#e Shutting down
+
+
+Testcase 'Inline flags apply to their pattern only'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+drop = (?i)debug
+	health
+EOF
+
+$LE --debug-transport-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 1
+cat >>example.log <<EOF
+Debug First message
+GET /health check
+GET /HEALTH check
+EOF
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148GET /HEALTH check
+sleep 1
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+#e
+#e Shutting down
+
+
+Testcase 'Backreferences refer to groups of their pattern'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+drop = (DEBUG)
+	\b(\w+) \1\b
+EOF
+
+$LE --debug-transport-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 1
+cat >>example.log <<EOF
+DEBUG First message
+Second second message
+Third message message
+Fourth message
+EOF
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148Second second message
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148Fourth message
+sleep 1
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+#e
+#e Shutting down
+
+
+Testcase 'Invalid pattern'
+
+tee >>"$CONFIG" <<EOF
+drop = (DEBUG
+EOF
+
+$LE monitor
+#e Configuration files loaded: sandbox_config
+#e Fatal: Invalid drop: (DEBUG
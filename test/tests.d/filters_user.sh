@@ -0,0 +1,57 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'User-defined filters'
+
+Testcase 'Batch filter'
+
+mkdir BatchFilters
+touch BatchFilters/__init__.py
+tee >BatchFilters/filters.py <<EOF
+
+def filter_batch(lines):
+	return ['%s/%s %s'%(len(lines), i, line) for i, line in enumerate(lines) if 'skip' not in line]
+
+batch_filters = {
+	'Web' : filter_batch,
+}
+EOF
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+filters = BatchFilters
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+drop = debug
+EOF
+
+touch example.log
+$LE --debug-transport-events monitor --debug-filters 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+cat >>example.log <<EOF
+First message
+debug message
+Please skip this message
+Second message
+EOF
+sleep 1
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+grep -o 'Available batch filters: .*\| Using batch filter\|Using filter rules .*' monitor.log
+#o Available batch filters: ['Web']
+#o  Using batch filter
+#o Using filter rules drop='debug' keep='' redact='' for Web
+# Lines dropped by filter rules do not reach the batch filter
+grep '^89caf699' monitor.log
+#o 89caf699-8fb7-45b1-a41f-ae111ec991483/0 First message
+#o 89caf699-8fb7-45b1-a41f-ae111ec991483/2 Second message
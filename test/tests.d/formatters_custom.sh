@@ -29,6 +29,63 @@ echo 'Second message' >> example.log
 #e 3fc10892-51e3-4865-b35d-eac9de6e3e52abraka ISODATETIME dabra myhost apache Second message
 sleep 1
 
+kill $LE_PID
+wait $LE_PID
+
 #e
 #e Shutting down
 
+
+
+Scenario 'Timestamp resolution'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+timestamp-resolution = 0.001
+[apache]
+token = 3fc10892-51e3-4865-b35d-eac9de6e3e52
+path = $TMP/example.log
+formatter = \$isodatetime|\$line
+[syslog]
+token = 629cc7e9-3344-4cef-b364-7fb6baeb74f2
+path = $TMP/example2.log
+formatter = syslog
+EOF
+
+Testcase 'Finer digits are zeroed'
+
+touch example.log example2.log
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+echo 'First message' >> example.log
+echo 'Second message' >> example2.log
+sleep 1
+
+grep -o 'T[0-9:]\{8\}\.[0-9]\{3\}000|First message' monitor.log | wc -l
+#o 1
+grep -o 'T[0-9:]\{8\}\.[0-9]\{3\}000Z myhost syslog - - - Second message' monitor.log | wc -l
+#o 1
+
+kill $LE_PID
+wait $LE_PID
+
+Testcase 'Whole seconds have no fraction'
+
+sed -i 's/^timestamp-resolution = .*/timestamp-resolution = 1/' "$CONFIG"
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+echo 'Third message' >> example.log
+sleep 1
+
+grep -o '[0-9]T[0-9:]\{8\}|Third message' monitor.log | wc -l
+#o 1
+
+kill $LE_PID
+wait $LE_PID
@@ -135,6 +135,62 @@ echo 'Second message' >> example.log
 #e log_id myhost Log name 0  Second message
 sleep 1
 
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
 #e
 #e Shutting down
 
+
+
+
+Testcase 'Batch formatter'
+
+mkdir BatchFormatters
+touch BatchFormatters/__init__.py
+tee >BatchFormatters/formatters.py <<EOF
+
+def setup(hostname, log_name, token):
+	def format_batch(lines):
+		return ['%s%s %s/%s %s'%(token, hostname, len(lines), i, line) for i, line in enumerate(lines)]
+	return format_batch
+
+batch_formatters = {
+	'apache' : setup,
+}
+EOF
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+formatters = BatchFormatters
+[apache]
+token = d86382bb-2a80-408a-8f3a-c684467e6082
+path = $TMP/example.log
+EOF
+
+touch example.log
+$LE --debug-transport-events monitor --debug-formatters &
+#e Configuration files loaded: sandbox_config
+#e Available formatters: []
+#e Available batch formatters: ['apache']
+#e  Batch formatter found
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 1
+cat >>example.log <<EOF
+First message
+Second message
+EOF
+#e d86382bb-2a80-408a-8f3a-c684467e6082myhost 2/0 First message
+#e d86382bb-2a80-408a-8f3a-c684467e6082myhost 2/1 Second message
+sleep 1
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+#e
+#e Shutting down
@@ -29,6 +29,8 @@ $LE
 #e   ls        List internal filesystem and settings: <path>
 #e   rm        Remove entity: <path>
 #e   pull      Pull log file: <path> <when> <filter> <limit>
+#e   stats     Display statistics of the running agent
+#e     --json  output statistics in JSON
 #e 
 #e Where parameters are:
 #e   --help                  show usage help and exit
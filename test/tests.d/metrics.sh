@@ -0,0 +1,200 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'System metrics are read from /proc and /sys'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+sed -i -e 's/^metrics-interval = .*/metrics-interval = 1s/' -e 's/^metrics-vcpu = .*/metrics-vcpu = core/' \
+	-e 's/^metrics-token = .*/metrics-token = 0b52788c-7981-4138-ac40-6720ae2d5f0c/' "$CONFIG"
+echo 'pull-server-side-config = False' >>"$CONFIG"
+
+Testcase 'All system metrics are collected'
+
+$LE --debug-metrics monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 3.5
+kill $LE_PID
+wait $LE_PID
+
+grep -o ' le - [a-z]* - .*' monitor.log | sed -e 's/^ le - //' -e 's/=[^ ]*//g' | sort -u
+#o cpu - user nice system usage idle iowait irq softirq steal guest guest_nice vcpus
+#o disk - device reads writes bytes_read bytes_write time_read time_write
+#o mem - total available used free active inactive buffers cached
+#o net - net bytes_sent bytes_recv packets_sent packets_recv err_in err_out drop_in drop_out
+#o space - path size used free
+#o start - agent_version
+#o swap - total used free in out
+#o vcpu - vcpu user nice system usage idle iowait irq softirq steal guest guest_nice vcpus
+
+Testcase 'Values match the system'
+
+[ "$(grep -o 'le - mem - total=[0-9]*' monitor.log | sort -u | grep -o '[0-9]*$')" == \
+	"$(( $(awk '/^MemTotal:/ { print $2 }' /proc/meminfo) * 1024 ))" ] && echo 'Memory total matches'
+#o Memory total matches
+[ "$(grep 'le - cpu - ' monitor.log | grep -o 'vcpus=[0-9]*' | sort -u | grep -o '[0-9]*$')" == \
+	"$(grep -c '^cpu[0-9]' /proc/stat)" ] && echo 'CPU count matches'
+#o CPU count matches
+[ "$(grep -c 'le - vcpu - ' monitor.log)" == \
+	"$(( $(grep -c 'le - cpu - ' monitor.log) * $(grep -c '^cpu[0-9]' /proc/stat) ))" ] && echo 'Each CPU is reported'
+#o Each CPU is reported
+grep -o 'le - cpu - .*' monitor.log | awk '{
+	split($0, fields, " ")
+	for (i in fields) { split(fields[i], kv, "="); value[kv[1]] = kv[2] }
+	if (value["usage"] + value["idle"] < 99.8 || value["usage"] + value["idle"] > 100.2) print "Invalid usage: " $0
+}'
+
+
+
+Scenario 'Processes of process metrics are found in a shared table'
+
+Testcase 'Processes are found by command line'
+
+# Patterns are made up when run, so that no other command line contains them
+python - <<EOF
+import os, subprocess, sys
+sys.path.insert(0, '$DIR/../src')
+import metrics, procstats
+
+def start(n):
+    return subprocess.Popen(['sleep', '%d.%d' % (os.getpid(), n)])
+
+def pattern(n):
+    return 'sleep %d.%d' % (os.getpid(), n)
+
+first = start(1)
+other = start(2)
+table = metrics.ProcessTable()
+found = table.find([pattern(1), pattern(2), pattern(3)])
+print found == {pattern(1): first.pid, pattern(2): other.pid}
+
+# Command lines are read only for processes started since the last scan
+read = []
+process_cmdline = procstats.process_cmdline
+def counting_cmdline(pid):
+    read.append(pid)
+    return process_cmdline(pid)
+procstats.process_cmdline = counting_cmdline
+scanned = set(table._cmdlines)
+first.kill()
+first.wait()
+second = start(1)
+print table.find([pattern(1)]) == {pattern(1): second.pid}
+print second.pid in read and not scanned.intersection(read)
+
+second.kill()
+other.kill()
+EOF
+#o True
+#o True
+#o True
+
+
+
+Scenario 'Collections are bounded by their interval'
+
+Testcase 'A hung process scan does not hold up other metrics'
+
+python - <<EOF
+import sys, threading, time
+sys.path.insert(0, '$DIR/../src')
+import formats, metrics
+
+class Transport(object):
+    def __init__(self):
+        self.entries = []
+    def get(self):
+        return self
+    def send(self, entry, block=True):
+        self.entries.append(entry)
+
+class Process(object):
+    name = 'app'
+    def __init__(self, name, pattern, token, interval, transport, formatter):
+        self.pattern = pattern
+        self.interval = interval
+        self.pid = None
+    def lost(self):
+        return self.pid is None
+    def attach(self, pid):
+        self.pid = pid
+    def collect(self):
+        pass
+
+# The process table hangs until released
+released = threading.Event()
+def find(table, patterns):
+    released.wait()
+    return {'app': 1}
+metrics.psutil_available = True
+metrics.ProcMetrics = Process
+metrics.ProcessTable.find = find
+
+conf = metrics.MetricsConfig()
+for item in conf.DEFAULTS:
+    conf.__dict__[item] = ''
+conf.token = '0b52788c-7981-4138-ac40-6720ae2d5f0c'
+conf.interval = '1s'
+conf.mem = 'system'
+conf.processes = [['app', 'app', conf.token, '']]
+transport = Transport()
+m = metrics.Metrics(conf, transport, formats.FormatSyslog('myhost', 'le', conf.token), False)
+m.start()
+
+def stats():
+    return dict([(x['name'], x) for x in m.stats()])
+time.sleep(3.5)
+s = stats()
+print 'Scan timed out:', s['processes']['timeouts'] == 1 and s['processes']['collections'] == 0
+print 'Metrics collected:', s['mem']['collections'] >= 2 and s['app']['collections'] >= 2
+print 'Memory metrics sent:', len([x for x in transport.entries if ' le - mem - ' in x]) >= 2
+
+released.set()
+time.sleep(1.5)
+s = stats()
+print 'Scan finished:', s['processes']['collections'] >= 1 and m._items[-1].pid == 1
+m.cancel(1)
+print 'Scheduler stopped:', not m._scheduler.isAlive()
+EOF
+#o Scan timed out: True
+#o Metrics collected: True
+#o Memory metrics sent: True
+#o Scan finished: True
+#o Scheduler stopped: True
+
+
+
+Scenario 'Metrics never wait for the send queue'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+sed -i -e 's/^\(metrics-[a-z]*\) = .*/\1 = /' -e 's/^metrics-interval = .*/metrics-interval = 1s/' \
+	-e 's/^metrics-mem = .*/metrics-mem = system/' \
+	-e 's/^metrics-token = .*/metrics-token = 0b52788c-7981-4138-ac40-6720ae2d5f0c/' "$CONFIG"
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+send-queue-size = 100
+EOF
+
+Testcase 'Metrics are dropped while the send queue is full'
+
+kill $DATA_MOCK_PID
+wait $DATA_MOCK_PID 2>/dev/null || true
+
+$LE --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 4
+$LE --pid-file=$TMP/le.pid stats --json >stats.json
+grep -o '"dropped": [0-9]*' stats.json | sed 's/ [1-9][0-9]*$/ dropped/'
+#o "dropped": dropped
+sed 's/.*"metrics": //' stats.json | grep -o '"\(name\|collections\|overruns\|timeouts\)": [^,}]*' | sed 's/"collections": [2-9]$/"collections": At least 2/'
+#o "collections": At least 2
+#o "name": "mem"
+#o "overruns": 0
+#o "timeouts": 0
+
+kill $LE_PID
+wait $LE_PID
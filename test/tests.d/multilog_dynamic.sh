@@ -81,13 +81,15 @@ sleep 1
 
 # tidy up test directory and daemon
 rm -rf apache*
+sleep 1
+#e Number of followers decreased to: 2
+#e Number of followers decreased to: 1
+#e Number of followers decreased to: 0
 kill $LE_PID
 wait $LE_PID 2>/dev/null || true
 
 #e
 #e Shutting down
-#e Number of followers decreased to: 2
-#e Number of followers decreased to: 1
 
 
 Scenario 'Using server side configuration to test dynamic behaviour'
@@ -139,8 +141,10 @@ sleep 1
 
 # tidy up test directory and daemon
 rm -rf apache*
+sleep 1
+#e Number of followers decreased to: 1
+#e Number of followers decreased to: 0
 
 #e
 #e Shutting down
-#e Number of followers decreased to: 1
 
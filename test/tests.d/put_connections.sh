@@ -0,0 +1,70 @@
+#!/bin/bash
+
+. vars
+
+HOST_PUT_KEY=c2f4e1a8-5b7d-4e3c-9a6f-1d8b2e4f6a0c
+
+Scenario 'Logs sent by HTTP PUT share a pool of connections'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_PUT_KEY --hostname myhost
+#e Initialized
+echo 'put-connections = 2' >>"$CONFIG"
+touch example.log example3.log
+
+Testcase 'Each log has its own connection'
+
+$LE --debug-transport-events --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+echo 'First message' >>example.log
+echo 'Second message' >>example3.log
+sleep 1
+
+grep -o 'Opening connection 127.0.0.1:8081 PUT .*' monitor.log | sort
+#o Opening connection 127.0.0.1:8081 PUT /f720fe54-879a-11e4-81ac-277d856f873e/hosts/c2f4e1a8-5b7d-4e3c-9a6f-1d8b2e4f6a0c/400da462-36fa-48f4-bb4e-87f96ad34e8a/?realtime=1 HTTP/1.0
+#o Opening connection 127.0.0.1:8081 PUT /f720fe54-879a-11e4-81ac-277d856f873e/hosts/c2f4e1a8-5b7d-4e3c-9a6f-1d8b2e4f6a0c/7b3e9d21-0c4f-4a8e-b6d2-5f1a9c3e7d40/?realtime=1 HTTP/1.0
+grep -o '^\(First\|Second\) message' monitor.log | sort
+#o First message
+#o Second message
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"\(connections\|sent\)": [0-9]*'
+#o "sent": 0
+#o "connections": 2
+#o "sent": 2
+
+kill $LE_PID
+wait $LE_PID
+
+
+Scenario 'Idle connections are closed and reopened'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_PUT_KEY --hostname myhost
+#e Initialized
+echo 'put-connections = 2' >>"$CONFIG"
+echo 'put-idle-timeout = 1' >>"$CONFIG"
+touch example.log example3.log
+
+Testcase 'A connection idle for put-idle-timeout is closed'
+
+$LE --debug-transport-events --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+echo 'First message' >>example.log
+sleep 2.5
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"connections": [0-9]*'
+#o "connections": 0
+
+Testcase 'The next entry opens a new connection'
+
+echo 'Second message' >>example.log
+sleep 1
+
+grep -c 'Opening connection 127.0.0.1:8081 PUT .*/400da462-36fa-48f4-bb4e-87f96ad34e8a/' monitor.log
+#o 2
+grep -o '^\(First\|Second\) message' monitor.log
+#o First message
+#o Second message
+
+kill $LE_PID
+wait $LE_PID
@@ -0,0 +1,89 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Log rotation while the file is written to'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+EOF
+touch example.log
+
+Testcase 'Copytruncate'
+
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for i in 1 2 3 4 5 ; do
+	echo "Before $i" >>example.log
+	sleep 0.3
+done
+cp example.log example.log.1
+: >example.log
+for i in 1 2 3 4 5 6 7 8 9 10 ; do
+	echo "After $i" >>example.log
+	sleep 0.3
+done
+sleep 1
+
+kill $LE_PID
+wait $LE_PID
+grep -c 'ec99148Before [0-9]' monitor.log
+#o 5
+grep -c 'ec99148After [0-9]*$' monitor.log
+#o 10
+
+Testcase 'Rename'
+
+: >example.log
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for i in 1 2 3 4 5 ; do
+	echo "Before $i" >>example.log
+	sleep 0.3
+done
+mv example.log example.log.1
+echo 'Before 6' >>example.log.1
+for i in 1 2 3 4 5 6 7 8 9 10 ; do
+	echo "After $i" >>example.log
+	sleep 0.3
+done
+sleep 1
+
+kill $LE_PID
+wait $LE_PID
+grep -c 'ec99148Before [0-9]' monitor.log
+#o 6
+grep -c 'ec99148After [0-9]*$' monitor.log
+#o 10
+
+Testcase 'Truncation of an idle file'
+
+: >example.log
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+echo 'First line' >>example.log
+echo -n 'Unterminated' >>example.log
+sleep 2
+: >example.log
+sleep 2
+echo 'After truncation' >>example.log
+sleep 1
+
+kill $LE_PID
+wait $LE_PID
+grep -o 'ec99148.*' monitor.log
+#o ec99148First line
+#o ec99148Unterminated
+#o ec99148After truncation
@@ -0,0 +1,68 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Queued entries are sent in batches'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+send-batch-latency = 1
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+EOF
+touch example.log
+
+# Record data received
+kill $DATA_MOCK_PID
+wait $DATA_MOCK_PID 2>/dev/null || true
+$DIR/env/bin/python $DIR/mocks/data_mock.py "$TMP/received" >>"$TMP/data_mock_output" 2>&1 &
+DATA_MOCK_PID=$!
+until (echo >/dev/tcp/localhost/10000) &>/dev/null ; do sleep 0.1 ; done
+
+Testcase 'Entries queued within the latency are written at once'
+
+$LE monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for i in 1 2 3 4 5 ; do
+	echo "Message $i" >>example.log
+	sleep 0.1
+done
+sleep 2
+
+grep -c 'Message' received
+#o 1
+grep -o 'Message [0-9]' received
+#o Message 1
+#o Message 2
+#o Message 3
+#o Message 4
+#o Message 5
+
+kill $LE_PID
+wait $LE_PID
+
+Testcase 'Batches are limited by size'
+
+sed -i 's/^send-batch-latency = 1$/send-batch-latency = 1\nsend-batch-size = 1/' "$CONFIG"
+: >received
+$LE monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for i in 1 2 3 4 5 ; do
+	echo "Message $i" >>example.log
+	sleep 0.1
+done
+sleep 1
+
+grep -c 'Message' received
+#o 5
+
+kill $LE_PID
+wait $LE_PID
@@ -0,0 +1,100 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Send queue policies while the destination is unreachable'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+send-queue-size = 100
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+EOF
+touch example.log
+
+function start_data_mock {
+	$DIR/env/bin/python $DIR/mocks/data_mock.py "$TMP/received" >>"$TMP/data_mock_output" 2>&1 &
+	DATA_MOCK_PID=$!
+	until (echo >/dev/tcp/localhost/10000) &>/dev/null ; do sleep 0.1 ; done
+}
+
+function stop_data_mock {
+	kill $DATA_MOCK_PID
+	wait $DATA_MOCK_PID 2>/dev/null || true
+}
+
+function wait_received {
+	for i in $(seq 300) ; do
+		[ "$(grep -o 'Message [0-9]*' received 2>/dev/null | wc -l)" -ge $1 ] && break
+		sleep 0.1
+	done
+}
+
+Testcase 'Followers stop reading with backpressure'
+
+stop_data_mock
+$LE --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for i in $(seq 10) ; do
+	echo "Message $i" >>example.log
+	sleep 0.2
+done
+sleep 1
+# Three entries exceed the queue size, the rest of the file is not read
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"\(lag\|dropped\|queue_depth\)": [0-9]*'
+#o "lag": 71
+#o "dropped": 0
+#o "queue_depth": 3
+
+start_data_mock
+wait_received 10
+grep -o 'Message [0-9]*' received
+#o Message 1
+#o Message 2
+#o Message 3
+#o Message 4
+#o Message 5
+#o Message 6
+#o Message 7
+#o Message 8
+#o Message 9
+#o Message 10
+
+kill $LE_PID
+wait $LE_PID
+
+Testcase 'Oldest entries are dropped with drop-oldest'
+
+sed -i 's/^send-queue-size = 100$/send-queue-size = 100\nsend-queue-policy = drop-oldest/' "$CONFIG"
+stop_data_mock
+: >received
+$LE --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for i in $(seq 11 20) ; do
+	echo "Message $i" >>example.log
+	sleep 0.2
+done
+sleep 1
+# Two entries fit in the queue
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"\(lag\|dropped\|queue_depth\)": [0-9]*'
+#o "lag": 0
+#o "dropped": 8
+#o "queue_depth": 2
+
+start_data_mock
+wait_received 2
+sleep 1
+grep -o 'Message [0-9]*' received
+#o Message 19
+#o Message 20
+
+kill $LE_PID
+wait $LE_PID
@@ -0,0 +1,153 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Shutdown is bounded by shutdown-timeout'
+
+Testcase 'Init'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+shutdown-timeout = 5
+state-file = $TMP/state
+EOF
+for i in 1 2 3 4 5 6 7 8 9 10 ; do
+	touch example$i.log
+	printf '[Log%d]\ntoken = 89caf699-8fb7-45b1-a41f-ae111ec991%02d\npath = %s\nformatter = plain\n' $i $i "$TMP/example$i.log" >>"$CONFIG"
+done
+
+Testcase 'Followers stop at once'
+
+$LE monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 2
+# Followers share a single inotify instance
+ls -l /proc/$LE_PID/fd | grep -c 'anon_inode:inotify'
+#o 1
+START=$(date +%s%N)
+kill $LE_PID
+wait $LE_PID
+ELAPSED=$(( ($(date +%s%N) - START) / 1000000 ))
+[ $ELAPSED -lt 3000 ] && echo 'Stopped in time'
+#o Stopped in time
+grep -c '^Following ' monitor.log
+#o 10
+
+Testcase 'Entries are saved at once if the destination is unreachable'
+
+kill $DATA_MOCK_PID
+wait $DATA_MOCK_PID 2>/dev/null || true
+
+$LE monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 2
+echo 'Message 1' >>example1.log
+echo 'Message 2' >>example1.log
+echo 'Message 3' >>example1.log
+sleep 1
+START=$(date +%s%N)
+kill $LE_PID
+wait $LE_PID
+ELAPSED=$(( ($(date +%s%N) - START) / 1000000 ))
+[ $ELAPSED -lt 3000 ] && echo 'Stopped in time'
+#o Stopped in time
+grep '^Saved ' monitor.log
+#o Saved 3 entries not sent to 127.0.0.1:10000
+ls state.unsent
+#o 127.0.0.1_10000_d41d8cd98f00b204e9800998ecf8427e
+grep -ao 'Message [0-9]' state.unsent/*/*
+#o Message 1
+#o Message 2
+#o Message 3
+
+Testcase 'Saved entries are sent once and in order on the next start'
+
+$DIR/env/bin/python $DIR/mocks/data_mock.py >>"$TMP/data_mock_output" 2>&1 &
+DATA_MOCK_PID=$!
+until (echo >/dev/tcp/localhost/10000) &>/dev/null ; do sleep 0.1 ; done
+
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 2
+echo 'Message 4' >>example1.log
+sleep 1
+kill $LE_PID
+wait $LE_PID
+
+grep '^Sending entries not sent' monitor.log
+#o Sending entries not sent on the last shutdown to 127.0.0.1:10000
+grep -o 'ec99101Message [0-9]' monitor.log
+#o ec99101Message 1
+#o ec99101Message 2
+#o ec99101Message 3
+#o ec99101Message 4
+[ -e state.unsent ] || echo 'Saved entries removed'
+#o Saved entries removed
+
+
+
+Scenario 'Queued entries are sent on shutdown'
+
+Testcase 'Init'
+
+kill $DATA_MOCK_PID
+wait $DATA_MOCK_PID 2>/dev/null || true
+$DIR/env/bin/python $DIR/mocks/data_mock.py "$TMP/received" >>"$TMP/data_mock_output" 2>&1 &
+DATA_MOCK_PID=$!
+until (echo >/dev/tcp/localhost/10000) &>/dev/null ; do sleep 0.1 ; done
+
+rm -f state
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+shutdown-timeout = 5
+state-file = $TMP/state
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+EOF
+touch example.log
+
+Testcase 'Entries queued while the destination stalls are sent within shutdown-timeout'
+
+$LE --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 2
+# The destination stops reading, entries pile up in the queue
+kill -STOP $DATA_MOCK_PID
+PADDING=$(printf '%0400d' 0)
+seq -f "Message %g $PADDING" 10000 >>example.log
+sleep 3
+QUEUED=$($LE --pid-file=$TMP/le.pid stats --json | grep -o '"queue_depth": [0-9]*' | head -1 | grep -o '[0-9]*$')
+[ $QUEUED -gt 0 ] && echo 'Entries queued'
+#o Entries queued
+
+kill -CONT $DATA_MOCK_PID
+START=$(date +%s%N)
+kill $LE_PID
+wait $LE_PID
+ELAPSED=$(( ($(date +%s%N) - START) / 1000000 ))
+[ $ELAPSED -lt 5000 ] && echo 'Stopped in time'
+#o Stopped in time
+grep -c '^Saved ' monitor.log || true
+#o 0
+
+# Every line read before shutdown has been received once and in order
+function received_messages {
+	$DIR/env/bin/python -c 'import ast, sys; sys.stdout.write("".join(ast.literal_eval(chunk) for chunk in open(sys.argv[1])))' received | grep -o 'Message [0-9]*'
+}
+READ=$(head -c $(grep -o '"position": [0-9]*' state | grep -o '[0-9]*$') example.log | wc -l)
+for i in $(seq 50) ; do
+	[ "$(received_messages | wc -l)" -ge $READ ] && break
+	sleep 0.1
+done
+[ "$(received_messages)" == "$(seq -f 'Message %g' $READ)" ] && echo 'All read entries received'
+#o All read entries received
@@ -0,0 +1,63 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Entries are spooled on disk while the destination is unreachable'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+spool-dir = $TMP/spool
+[Local]
+token = 7f0a6c3e-1d2b-4c5d-9e8f-0a1b2c3d4e5f
+listen = udp:127.0.0.1:10514
+formatter = plain
+EOF
+
+Testcase 'Entries received while disconnected are spooled'
+
+kill $DATA_MOCK_PID
+wait $DATA_MOCK_PID 2>/dev/null || true
+
+$LE --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+for i in 1 2 3 ; do
+	echo -n "<13>Oct 18 10:00:0$i app: Message $i" >/dev/udp/127.0.0.1/10514
+	sleep 0.2
+done
+sleep 1
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"\(sent\|spooled\)": [0-9]*'
+#o "sent": 0
+#o "spooled": 3
+
+kill $LE_PID
+wait $LE_PID
+ls spool
+#o 127.0.0.1_10000_d41d8cd98f00b204e9800998ecf8427e
+
+Testcase 'Spooled entries are sent in order after restart'
+
+$DIR/env/bin/python $DIR/mocks/data_mock.py "$TMP/received" >>"$TMP/data_mock_output" 2>&1 &
+DATA_MOCK_PID=$!
+until (echo >/dev/tcp/localhost/10000) &>/dev/null ; do sleep 0.1 ; done
+
+$LE --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+echo -n '<13>Oct 18 10:00:04 app: Message 4' >/dev/udp/127.0.0.1/10514
+sleep 1
+grep -o 'app: Message [0-9]' received
+#o app: Message 1
+#o app: Message 2
+#o app: Message 3
+#o app: Message 4
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"\(sent\|spooled\)": [0-9]*'
+#o "sent": 4
+#o "spooled": 0
+
+kill $LE_PID
+wait $LE_PID
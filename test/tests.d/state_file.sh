@@ -58,6 +58,225 @@ LE_PID=$!
 
 sleep 2
 
+kill $LE_PID
+wait $LE_PID
+
 #e
 #e Shutting down
 
+
+
+Scenario 'Positions of entries sent are saved'
+
+Testcase 'Init'
+
+rm -f state-file example.log
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+echo "state-file = $TMP/state-file" >>"$CONFIG"
+echo 'state-position = sent' >>"$CONFIG"
+echo 'pull-server-side-config = False' >>"$CONFIG"
+echo '[Web]' >>"$CONFIG"
+echo 'token = 0b52788c-7981-4138-ac40-6720ae2d5f0c' >>"$CONFIG"
+echo "path = $TMP/example.log" >>"$CONFIG"
+
+Testcase 'Monitoring - first phrase'
+
+echo 'Message 1 (skipped)' >> example.log
+$LE --debug-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 2
+echo 'Message 2' >> example.log
+echo 'Message 3' >> example.log
+sync
+sleep 2
+
+#e Message 2
+#e Message 3
+
+kill $LE_PID
+wait $LE_PID
+
+#e
+#e Shutting down
+
+grep -o '"position": [0-9]*' state-file
+#o "position": 40
+
+Testcase 'Monitoring - second phrase'
+
+echo 'Message 4 (not to be lost)' >> example.log
+sync
+
+$LE --debug-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+#e Message 4 (not to be lost)
+
+sleep 2
+
+kill $LE_PID
+wait $LE_PID
+
+#e
+#e Shutting down
+
+grep -o '"position": [0-9]*' state-file
+#o "position": 67
+
+Testcase 'Monitoring - partial last line'
+
+printf 'Message 5 written' >> example.log
+sync
+
+$LE --debug-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 2
+
+kill $LE_PID
+wait $LE_PID
+
+#e
+#e Shutting down
+
+grep -o '"position": [0-9]*' state-file
+#o "position": 67
+
+echo ' in two parts' >> example.log
+sync
+
+$LE --debug-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+#e Message 5 written in two parts
+
+sleep 2
+
+kill $LE_PID
+wait $LE_PID
+
+#e
+#e Shutting down
+
+grep -o '"position": [0-9]*' state-file
+#o "position": 98
+
+
+
+Scenario 'Renamed file is resumed'
+
+Testcase 'Init'
+
+rm -f state-file example.log
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+echo "state-file = $TMP/state-file" >>"$CONFIG"
+echo 'pull-server-side-config = False' >>"$CONFIG"
+echo '[Web]' >>"$CONFIG"
+echo 'token = 0b52788c-7981-4138-ac40-6720ae2d5f0c' >>"$CONFIG"
+echo "path = $TMP/example.log" >>"$CONFIG"
+
+Testcase 'Monitoring - first phrase'
+
+echo 'Message 1 (skipped)' >> example.log
+$LE --debug-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 2
+echo 'Message 2' >> example.log
+sync
+sleep 2
+
+#e Message 2
+
+kill $LE_PID
+wait $LE_PID
+
+#e
+#e Shutting down
+
+Testcase 'Monitoring - file rotated while stopped'
+
+echo 'Message 3 (not to be lost)' >> example.log
+mv example.log example.log.1
+echo 'Message 4 (new file)' >> example.log
+sync
+
+$LE --debug-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+#e Following $TMP/example.log renamed to $TMP/example.log.1
+LE_PID=$!
+
+#e Message 3 (not to be lost)
+#e Message 4 (new file)
+
+sleep 4
+
+kill $LE_PID
+wait $LE_PID
+
+#e
+#e Shutting down
+
+
+
+Scenario 'Lines written while stopped are all sent'
+
+Testcase 'Init'
+
+rm -f state-file example.log
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+echo "state-file = $TMP/state-file" >>"$CONFIG"
+echo 'pull-server-side-config = False' >>"$CONFIG"
+echo '[Web]' >>"$CONFIG"
+echo 'token = 0b52788c-7981-4138-ac40-6720ae2d5f0c' >>"$CONFIG"
+echo "path = $TMP/example.log" >>"$CONFIG"
+echo 'formatter = plain' >>"$CONFIG"
+
+Testcase 'Monitoring - first phrase'
+
+seq -f 'Line %g' 1 10 >example.log
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 2
+seq -f 'Line %g' 11 20 >>example.log
+sleep 2
+
+kill $LE_PID
+wait $LE_PID
+
+grep -c 'Line ' monitor.log
+#o 10
+
+Testcase 'Monitoring - resumed after restart'
+
+seq -f 'Line %g' 21 2000 >>example.log
+
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 3
+
+kill $LE_PID
+wait $LE_PID
+
+grep -o 'Line [0-9]*' monitor.log | sed -n '1p;$p'
+#o Line 21
+#o Line 2000
+grep -c 'Line ' monitor.log
+#o 1980
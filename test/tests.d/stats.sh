@@ -0,0 +1,127 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Statistics of the running agent'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+Testcase 'Statistics are not available without running agent'
+
+$LE --pid-file=$TMP/le.pid stats || true
+#e Error: Cannot contact the agent at $TMP/le.sock: [Errno 2] No such file or directory. Is the agent running?
+
+Testcase 'Statistics of followers and transports'
+
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+drop = DEBUG
+redact = pass=\S+
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+EOF
+
+touch example.log
+$LE --pid-file=$TMP/le.pid monitor &
+#e Configuration files loaded: sandbox_config
+#e Following $TMP/example.log
+LE_PID=$!
+
+sleep 1
+cat >>example.log <<EOF
+First message
+DEBUG Second message
+Third pass=x
+EOF
+sleep 1
+
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"\(lines_read\|bytes_read\|filtered\|lag\|sent\|dropped\|queue_depth\)": [0-9]*'
+#o "bytes_read": 48
+#o "filtered": 1
+#o "lag": 0
+#o "lines_read": 3
+#o "dropped": 0
+#o "queue_depth": 0
+#o "sent": 2
+$LE --pid-file=$TMP/le.pid stats | sed -n -e 's/ ([0-9.]*\/s)//g' -e '/^  /p'
+#o   $TMP/example.log: lines 3, bytes 48, filtered 1, lag 0
+#o   127.0.0.1:10000: queued 2, sent 2, dropped 0, queue 0 (0 bytes), reconnects 0, connect failures 0
+#o   Web: 1 hits of `pass=\S+'
+
+Testcase 'Invalid requests do not stop serving'
+
+for command in 'stats extra' 'unknown' ; do
+	python -c "
+import socket
+s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+s.connect('$TMP/le.sock')
+s.sendall('$command\n')
+print s.recv(1024).strip()"
+done
+#o Error: Unexpected arguments: extra
+#o Error: Unknown command
+$LE --pid-file=$TMP/le.pid stats --json | grep -o '"lines_read": [0-9]*'
+#o "lines_read": 3
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
+
+#e
+#e Shutting down
+#e Web: 1 hits of redact pattern `pass=\S+'
+
+
+
+Scenario 'Metrics of the agent itself'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+# Only agent metrics are collected
+sed -i -e 's/^\(metrics-[a-z]*\) = .*/\1 = /' -e 's/^metrics-interval = .*/metrics-interval = 1s/' \
+	-e 's/^metrics-token = .*/metrics-token = 0b52788c-7981-4138-ac40-6720ae2d5f0c/' "$CONFIG"
+tee >>"$CONFIG" <<EOF
+metrics-agent = True
+pull-server-side-config = False
+[Web]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+EOF
+
+Testcase 'Agent metrics are collected each interval'
+
+touch example.log
+$LE --debug-metrics --pid-file=$TMP/le.pid monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+seq -f 'Message %g' 100 >>example.log
+sleep 3
+
+# The first collection is a baseline for rates
+grep -c ' le - agent - cpu_user=[0-9.]* cpu_system=[0-9.]* rss=[0-9]* threads=[0-9]* fds=[0-9]* lines_sec=[0-9.]* bytes_sec=[0-9.]* queue_depth=[0-9]* dropped=0$' monitor.log | sed 's/^[2-9]$/At least 2/'
+#o At least 2
+grep -o 'lines_sec=[1-9][0-9.]*' monitor.log | wc -l
+#o 1
+
+Testcase 'Agent and collections are listed by le stats'
+
+$LE --pid-file=$TMP/le.pid stats | sed -n \
+	-e 's/^Agent pid [0-9]*: uptime [0-9]*s, threads [0-9]*, cpu user [0-9.]*s system [0-9.]*s, rss [0-9.]*MiB, fds [0-9]*$/Agent/p' \
+	-e 's/^\(Followers:\|Transports:\|Metrics:\)$/\1/p' \
+	-e 's/^  agent: interval 1s, collections [2-9], overruns 0, timeouts 0, skipped 0$/  agent/p'
+#o Agent
+#o Followers:
+#o Transports:
+#o Metrics:
+#o   agent
+$LE --pid-file=$TMP/le.pid stats --json | sed 's/.*"metrics": //' | grep -o '"\(name\|interval\|overruns\|timeouts\|skipped\)": [^,}]*'
+#o "interval": 1
+#o "name": "agent"
+#o "overruns": 0
+#o "skipped": 0
+#o "timeouts": 0
+
+kill $LE_PID
+wait $LE_PID 2>/dev/null || true
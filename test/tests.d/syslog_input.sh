@@ -0,0 +1,145 @@
+#!/bin/bash
+
+. vars
+
+Scenario 'Syslog messages received on local sockets'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+
+Testcase 'Messages are routed by app names'
+
+echo 'pull-server-side-config = False' >>"$CONFIG"
+echo 'formatter = plain' >>"$CONFIG"
+echo '[Web]' >>"$CONFIG"
+echo 'token = 89caf699-8fb7-45b1-a41f-ae111ec99148' >>"$CONFIG"
+echo 'listen = udp:127.0.0.1:10514' >>"$CONFIG"
+echo 'app-name = nginx' >>"$CONFIG"
+echo '[Other]' >>"$CONFIG"
+echo 'token = 0b52788c-7981-4138-ac40-6720ae2d5f0c' >>"$CONFIG"
+echo 'listen = udp:127.0.0.1:10514' >>"$CONFIG"
+echo '[Stream]' >>"$CONFIG"
+echo 'token = 5e6bbb1a-2b7d-4a7c-a1a5-6e4bb1c7e2f1' >>"$CONFIG"
+echo 'listen = tcp:127.0.0.1:10514' >>"$CONFIG"
+echo '[Local]' >>"$CONFIG"
+echo 'token = 7f0a6c3e-1d2b-4c5d-9e8f-0a1b2c3d4e5f' >>"$CONFIG"
+echo "listen = unix:$TMP/log.sock" >>"$CONFIG"
+
+$LE --debug-transport-events monitor &
+#e Configuration files loaded: sandbox_config
+#e Listening on udp:127.0.0.1:10514 for Web
+#e Listening on udp:127.0.0.1:10514 for Other
+#e Listening on tcp:127.0.0.1:10514 for Stream
+#e Listening on unix:$TMP/log.sock for Local
+LE_PID=$!
+
+sleep 1
+echo -n '<13>Oct 18 10:00:00 myhost nginx[12]: GET /index.html' >/dev/udp/127.0.0.1/10514
+sleep 0.5
+echo -n '<14>1 2026-10-18T10:00:00.000Z myhost cron - - [meta x="1"] Job done' >/dev/udp/127.0.0.1/10514
+sleep 0.5
+printf '<13>Oct 18 10:00:01 app: First\n31 <13>Oct 18 10:00:02 app: Second' >/dev/tcp/127.0.0.1/10514
+sleep 0.5
+python -c "
+import socket
+s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+s.sendto('<13>Oct 18 10:00:03 local: Via unix socket', '$TMP/log.sock')"
+sleep 1
+#e 89caf699-8fb7-45b1-a41f-ae111ec99148nginx[12]: GET /index.html
+#e 0b52788c-7981-4138-ac40-6720ae2d5f0ccron: Job done
+#e 5e6bbb1a-2b7d-4a7c-a1a5-6e4bb1c7e2f1app: First
+#e 5e6bbb1a-2b7d-4a7c-a1a5-6e4bb1c7e2f1app: Second
+#e 7f0a6c3e-1d2b-4c5d-9e8f-0a1b2c3d4e5flocal: Via unix socket
+
+kill $LE_PID
+wait $LE_PID
+
+#e
+#e Shutting down
+
+
+Testcase 'Stale socket files are replaced with the mode configured'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+echo 'pull-server-side-config = False' >>"$CONFIG"
+echo 'syslog-socket-mode = 0660' >>"$CONFIG"
+echo '[Local]' >>"$CONFIG"
+echo 'token = 7f0a6c3e-1d2b-4c5d-9e8f-0a1b2c3d4e5f' >>"$CONFIG"
+echo "listen = unix:$TMP/log.sock" >>"$CONFIG"
+
+python -c "
+import socket
+s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+s.bind('$TMP/log.sock')"
+[ -S log.sock ] && echo 'Stale socket left'
+#o Stale socket left
+
+$LE monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+stat -c %a log.sock
+#o 660
+
+kill $LE_PID
+wait $LE_PID
+[ -e log.sock ] || echo 'Socket removed'
+#o Socket removed
+
+
+Testcase 'Sockets of live receivers are kept'
+
+python -c "
+import socket, time
+s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+s.bind('$TMP/log.sock')
+time.sleep(5)" &
+RECEIVER_PID=$!
+sleep 0.5
+
+$LE monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+kill $LE_PID
+wait $LE_PID
+grep -o 'Cannot listen on .*' monitor.log
+#o Cannot listen on unix:$TMP/log.sock: [Errno 98] Address already in use
+[ -S log.sock ] && echo 'Socket kept'
+#o Socket kept
+
+kill $RECEIVER_PID
+wait $RECEIVER_PID 2>/dev/null || true
+rm -f log.sock
+
+
+Testcase 'Rest of oversized TCP messages is skipped'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+echo 'pull-server-side-config = False' >>"$CONFIG"
+echo 'formatter = plain' >>"$CONFIG"
+echo '[Stream]' >>"$CONFIG"
+echo 'token = 5e6bbb1a-2b7d-4a7c-a1a5-6e4bb1c7e2f1' >>"$CONFIG"
+echo 'listen = tcp:127.0.0.1:10514' >>"$CONFIG"
+
+$LE --debug-transport-events monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+python -c "
+import socket
+s = socket.create_connection(('127.0.0.1', 10514))
+body = '<13>Oct 18 10:00:01 app: ' + '31 <13>Oct 18 10:00:02 app: X ' * 4000
+s.sendall('%d %s' % (len(body), body))
+s.sendall('31 <13>Oct 18 10:00:02 app: Latest')
+s.close()"
+sleep 1
+
+kill $LE_PID
+wait $LE_PID
+grep -c '5e6bbb1a-2b7d-4a7c-a1a5-6e4bb1c7e2f1app: ' monitor.log
+#o 2
+grep -o '5e6bbb1a-2b7d-4a7c-a1a5-6e4bb1c7e2f1app: Latest' monitor.log
+#o 5e6bbb1a-2b7d-4a7c-a1a5-6e4bb1c7e2f1app: Latest
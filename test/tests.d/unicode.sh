@@ -25,6 +25,53 @@ echo 'Message: ěščřžýáíéů' >> example.log
 #e Message: ěščřžýáíéů
 sleep 1
 
+kill $LE_PID
+wait $LE_PID
+
 #e
 #e Shutting down
 
+
+
+Scenario 'Lines are passed through as UTF-8'
+
+$LE init --account-key=$ACCOUNT_KEY --host-key=$HOST_KEY --hostname myhost
+#e Initialized
+tee >>"$CONFIG" <<EOF
+pull-server-side-config = False
+[Plain]
+token = 89caf699-8fb7-45b1-a41f-ae111ec99148
+path = $TMP/example.log
+formatter = plain
+[Syslog]
+token = 0b52788c-7981-4138-ac40-6720ae2d5f0c
+path = $TMP/example.log
+formatter = syslog
+EOF
+touch example.log
+
+kill $DATA_MOCK_PID
+wait $DATA_MOCK_PID 2>/dev/null || true
+$DIR/env/bin/python $DIR/mocks/data_mock.py "$TMP/received" >>"$TMP/data_mock_output" 2>&1 &
+DATA_MOCK_PID=$!
+until (echo >/dev/tcp/localhost/10000) &>/dev/null ; do sleep 0.1 ; done
+
+Testcase 'Valid sequences are kept, invalid ones dropped'
+
+$LE monitor 2>monitor.log &
+LE_PID=$!
+
+sleep 1
+printf 'Message: \xc4\x9b\xc5\xa1\n' >>example.log
+sleep 1
+printf 'Invalid: \xff\xc4\n' >>example.log
+sleep 1
+
+kill $LE_PID
+wait $LE_PID
+grep -o "ec99148[^\\]*\(\\\\x[0-9a-f]*\)*" received
+#o ec99148Message: \xc4\x9b\xc5\xa1
+#o ec99148Invalid: 
+grep -o "myhost Syslog - - - [^\\]*\(\\\\x[0-9a-f]*\)*" received
+#o myhost Syslog - - - Message: \xc4\x9b\xc5\xa1
+#o myhost Syslog - - - Invalid: 